@@ -0,0 +1,376 @@
+import asyncio
+import numpy as np
+import random
+import time
+
+from csrgraph import as_csr
+from pdmmcore import PDMMState
+from traces import make_traces
+from eventsim import _clock_trace
+
+'''
+ACTOR-MODEL NETWORK SIMULATION (asyncio)
+using actor_gossip() / actor_dist_avg() / actor_pdmm(): every sensor node is an asyncio task that only reads its own
+inbox queue and only changes its own values, neighbors are reached by messages that take latency (+ exponential jitter)
+seconds to arrive and are lost with probability loss. Time is the real event loop clock, so in-flight messages,
+queueing and lost replies all show up in e(k), in the queue depths and in the time to reach TOL.
+'''
+# message kinds, a message is (kind, src, value, seq, sent_at)
+TICK = 0        # the node's own Poisson clock
+REQUEST = 1     # gossip: value of src / dist avg: asks for the value of dst
+REPLY = 2       # gossip: the pair average / dist avg: the value of src
+BUSY = 3        # dst is already part of another average
+SET = 4         # dist avg: the average of N(i) U i
+TIMEOUT = 5     # own request (or lock) expired
+Y = 6           # pdmm: y_ij for the edge position value[0] of dst
+
+
+class Network:
+    '''
+    Inboxes, links and counters shared by the node tasks.
+        latency     seconds per message, a number or a function latency(src, dst) for per-link values
+        jitter      mean of an exponential extra delay per message
+        loss        probability that a message is lost, a number or a function loss(src, dst)
+        time_scale  wall-clock seconds per simulated second. All delays are stretched by it and all reported
+                    times are simulated seconds, so a network that sends more messages per second than one
+                    event loop can handle runs in slow motion instead of piling up in the inboxes
+    A message is put into the inbox of dst by loop.call_later, so a message in flight costs no task.
+    Statistics: messages sent / lost / delivered, the inbox depth seen by every arriving message (max, mean),
+    and the end-to-end latency of every handled message (link delay + time waiting in the inbox).
+    '''
+    def __init__(self, num_nodes, latency, jitter, loss, rng, time_scale=1.0):
+        self.inboxes = [asyncio.Queue() for _ in range(num_nodes)]
+        self.loop = asyncio.get_running_loop()
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng
+        self.time_scale = time_scale
+        self.start = self.loop.time()
+        self.transmissions = 0
+        self.sent = 0
+        self.lost = 0
+        self.delivered = 0
+        self.max_depth = 0
+        self.depth_sum = 0
+        self.handled = 0
+        self.latency_sum = 0.0
+        self.max_latency = 0.0
+
+    def now(self):
+        return (self.loop.time() - self.start) / self.time_scale
+
+    def send(self, src, dst, kind, value=None, seq=0):
+        self.sent += 1
+        loss = self.loss(src, dst) if callable(self.loss) else self.loss
+        if loss > 0 and self.rng.random() < loss:
+            self.lost += 1
+            return
+        delay = self.latency(src, dst) if callable(self.latency) else self.latency
+        if self.jitter > 0:
+            delay += self.rng.expovariate(1 / self.jitter)
+        self.loop.call_later(delay * self.time_scale, self._arrive, dst, (kind, src, value, seq, self.loop.time()))
+
+    def _arrive(self, dst, message):
+        inbox = self.inboxes[dst]
+        inbox.put_nowait(message)
+        depth = inbox.qsize()
+        self.delivered += 1
+        self.depth_sum += depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def after(self, delay, dst, kind, seq=0):
+        # message from dst to itself (clock tick, timeout), never lost
+        self.loop.call_later(delay * self.time_scale, self.inboxes[dst].put_nowait, (kind, dst, None, seq, None))
+
+    def handled_message(self, sent_at):
+        self.handled += 1
+        waited = (self.loop.time() - sent_at) / self.time_scale
+        self.latency_sum += waited
+        if waited > self.max_latency:
+            self.max_latency = waited
+
+    def stats(self):
+        return {
+            "messages_sent": self.sent,
+            "messages_lost": self.lost,
+            "messages_delivered": self.delivered,
+            "max_queue_depth": self.max_depth,
+            "mean_queue_depth": self.depth_sum / self.delivered if self.delivered else 0.0,
+            "mean_message_latency": self.latency_sum / self.handled if self.handled else 0.0,
+            "max_message_latency": self.max_latency,
+        }
+
+
+class Actor:
+    '''
+    One sensor node: waits on its inbox and handles one message at a time. Subclasses implement tick()
+    and receive(). The clock reschedules itself with Exp(1/rate) gaps.
+    '''
+    def __init__(self, net, i, csr, x, rate, timeout):
+        self.net = net
+        self.i = i
+        self.neighbors = csr.neighbors(i).tolist()
+        self.x = x
+        self.rate = rate
+        self.timeout = timeout
+        self.busy = False
+        self.seq = 0
+
+    async def run(self):
+        net = self.net
+        inbox = net.inboxes[self.i]
+        net.after(net.rng.expovariate(self.rate), self.i, TICK)
+        while True:
+            kind, src, value, seq, sent_at = await inbox.get()
+            if kind == TICK:
+                net.after(net.rng.expovariate(self.rate), self.i, TICK)
+                self.tick()
+                continue
+            if sent_at is not None:
+                net.handled_message(sent_at)
+            self.receive(kind, src, value, seq)
+
+
+class GossipActor(Actor):
+    '''
+    random_gossip_noW with messages:
+        tick of i (not busy):   pick a random neighbor j, send REQUEST(x_i), wait (busy) for the reply
+        REQUEST at j:           busy -> BUSY, else x_j = avg(x_i, x_j) and REPLY(avg)
+        REPLY at i:             x_i = avg, one transmission
+    A lost REPLY leaves the pair with different values (mass is lost), i gives up after timeout.
+    '''
+    def tick(self):
+        if self.busy:
+            return
+        self.busy = True
+        self.seq += 1
+        j = self.neighbors[self.net.rng.randrange(len(self.neighbors))]
+        self.net.send(self.i, j, REQUEST, self.x[self.i], self.seq)
+        self.net.after(self.timeout, self.i, TIMEOUT, self.seq)
+
+    def receive(self, kind, src, value, seq):
+        i = self.i
+        if kind == REQUEST:
+            if self.busy:
+                self.net.send(i, src, BUSY, None, seq)
+                return
+            avg = (value + self.x[i]) / 2
+            self.x[i] = avg
+            self.net.send(i, src, REPLY, avg, seq)
+        elif seq == self.seq and self.busy:
+            if kind == REPLY:
+                self.x[i] = value
+                self.net.transmissions += 1
+            self.busy = False       # REPLY, BUSY or TIMEOUT
+
+
+class DistAvgActor(Actor):
+    '''
+    dist_avg_asynch_noW with messages:
+        tick of i (not busy):   send REQUEST to all neighbors, wait (busy) for their values
+        REQUEST at j:           busy -> BUSY, else lock j for i and REPLY(x_j)
+        all answers at i (or timeout): avg over i and the locked neighbors, x_i = avg, SET(avg) to them,
+                                N(locked) transmissions
+        SET at j:               x_j = avg, unlock
+    Locked neighbors are released after timeout if their SET is lost.
+    '''
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.values = {}
+        self.waiting = 0
+        self.locked_by = None
+        self.lock = 0
+
+    def tick(self):
+        if self.busy:
+            return
+        self.busy = True
+        self.seq += 1
+        self.values = {}
+        self.waiting = len(self.neighbors)
+        for j in self.neighbors:
+            self.net.send(self.i, j, REQUEST, None, self.seq)
+        self.net.after(self.timeout, self.i, TIMEOUT, self.seq)
+
+    def finish(self):
+        i = self.i
+        avg = (sum(self.values.values()) + self.x[i]) / (len(self.values) + 1)
+        self.x[i] = avg
+        for j in self.values:
+            self.net.send(i, j, SET, avg, self.seq)
+        self.net.transmissions += len(self.values)
+        self.busy = False
+
+    def receive(self, kind, src, value, seq):
+        i = self.i
+        if kind == REQUEST:
+            if self.busy:
+                self.net.send(i, src, BUSY, None, seq)
+                return
+            self.busy = True
+            self.locked_by = (src, seq)
+            self.lock += 1
+            self.net.send(i, src, REPLY, self.x[i], seq)
+            self.net.after(self.timeout, i, TIMEOUT, -self.lock)
+        elif kind == SET:
+            if self.locked_by == (src, seq):
+                self.x[i] = value
+                self.locked_by = None
+                self.busy = False
+        elif kind == TIMEOUT and seq < 0:
+            # lock for another node expired (negative seq numbers the locks)
+            if self.locked_by is not None and -seq == self.lock:
+                self.locked_by = None
+                self.busy = False
+        elif self.busy and self.locked_by is None and seq == self.seq:
+            if kind == REPLY:
+                self.values[src] = value
+            if kind == TIMEOUT:
+                self.finish()
+                return
+            self.waiting -= 1
+            if self.waiting == 0:
+                self.finish()
+
+
+class PDMMActor(Actor):
+    '''
+    pdmm_async with messages (broadcast form, node i only writes x_i, y_ij and z_ij of its own edges):
+        tick of i:      x_i(k) = ( a_i - sum(A_ij*z_ij(k-1)) ) / (1 + c*d_i)
+                        y_ij(k) = z_ij(k-1) + 2*c*x_i(k)*A_ij, send y_ij to every neighbor j, one transmission
+        Y at j:         z_ji = y_ij
+    A lost or late y_ij only leaves z_ji at its older value.
+    '''
+    def __init__(self, net, i, csr, x, rate, timeout, state):
+        super().__init__(net, i, csr, x, rate, timeout)
+        self.state = state
+        start = int(state.start[i])
+        self.edges = list(range(start, start + int(state.degree[i])))
+        self.targets = [int(state.indices[e]) for e in self.edges]
+        self.reverse = [int(state.rev[e]) for e in self.edges]
+
+    def tick(self):
+        state = self.state
+        state.update_node(self.i)
+        y = state.y
+        for e, j, r in zip(self.edges, self.targets, self.reverse):
+            self.net.send(self.i, j, Y, (r, y[e]))
+        self.net.transmissions += 1
+
+    def receive(self, kind, src, value, seq):
+        if kind == Y:
+            self.state.z[value[0]] = value[1]
+
+
+async def _simulate(csr, x, true_avg, make_actor, TOL, rates, latency, jitter, loss, timeout, max_time,
+                    sample_every, seed, trace, time_scale):
+    '''
+    Starts one task per node and a monitor task that samples e(k), std dev and the total inbox depth every
+    sample_every seconds, until e(k) <= TOL or max_time seconds have passed.
+    '''
+    rng = random.Random(int(np.random.default_rng(seed).integers(2**63)))
+    net = Network(csr.num_nodes, latency, jitter, loss, rng, time_scale)
+    rates = np.broadcast_to(np.asarray(rates, dtype=np.float64), (csr.num_nodes,))
+    tasks = [asyncio.create_task(make_actor(net, i, rates[i]).run()) for i in range(csr.num_nodes)]
+    std_devs, errors = make_traces(trace)
+    clock = _clock_trace(trace)
+
+    converged_at = None
+    max_queued = 0
+    while True:
+        await asyncio.sleep(sample_every * time_scale)
+        now = net.now()
+        error = float(np.sum((x - true_avg)**2))
+        std_devs.append(net.transmissions, float(np.std(x, ddof=1)))
+        errors.append(net.transmissions, error)
+        clock.append(net.transmissions, now)
+        max_queued = max(max_queued, sum(inbox.qsize() for inbox in net.inboxes))
+        if error <= TOL:
+            converged_at = now
+            break
+        if now > max_time:
+            break
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    stats = net.stats()
+    stats["max_total_queued"] = max_queued
+    stats["convergence_time"] = converged_at
+    stats["simulated_time"] = net.now()
+    stats["transmissions"] = net.transmissions
+    return std_devs, errors, clock, stats
+
+
+def _run(csr, x, true_avg, make_actor, TOL, rates, latency, jitter, loss, timeout, max_time, sample_every, seed, trace, time_scale):
+    start_time = time.time()
+    std_devs, errors, clock, stats = asyncio.run(_simulate(csr, x, true_avg, make_actor, TOL, rates, latency, jitter,
+                                                           loss, timeout, max_time, sample_every, seed, trace, time_scale))
+    transmissions = stats["transmissions"]
+    if stats["convergence_time"] is None:
+        print("\033[91mERROR: e(k) did not reach " + str(TOL) + " within " + str(max_time) + " seconds.\033[0m")
+    print("Execution time:", time.time() - start_time, "seconds")
+    print("Transmissions: ", transmissions)
+    print("Time to TOL:", stats["convergence_time"], "simulated seconds")
+    print("Messages sent / lost:", stats["messages_sent"], "/", stats["messages_lost"])
+    print("Queue depth (max / mean per arrival / max total):", stats["max_queue_depth"], "/",
+          round(stats["mean_queue_depth"], 3), "/", stats["max_total_queued"])
+    print("Message latency (mean / max):", stats["mean_message_latency"], "/", stats["max_message_latency"], "seconds")
+    print("Average: ", x[0])
+    return x[0], std_devs, errors, transmissions, clock, stats
+
+'''
+ACTOR RANDOM GOSSIP
+'''
+def actor_gossip(graph, TOL, rates=1.0, latency=0.001, jitter=0.0, loss=0.0, timeout=1.0, max_time=60.0,
+                 sample_every=0.01, seed=None, trace=None, time_scale=1.0):
+    '''
+    Random gossip with one asyncio task per node (see GossipActor).
+    rates: ticks per second, one value or one per node; latency / loss: number or function of (src, dst)
+    timeout: seconds a node waits for a reply before it gives up
+    time_scale: wall-clock seconds per simulated second (see Network), raise it for large networks until
+    the queue depths stay small, all times are reported in simulated seconds
+    Stops when e(k) <= TOL (sampled every sample_every seconds) or after max_time seconds.
+    Returns (avg, std devs, errors, transmissions, clock, stats), clock gives the time of the samples
+    (plot_time_pairs), stats the message, queue depth and latency metrics.
+    '''
+    print("")
+    print("------- ACTOR RANDOM GOSSIP ------- ")
+    csr = as_csr(graph)
+    x = csr.values
+    make_actor = lambda net, i, rate: GossipActor(net, i, csr, x, rate, timeout)
+    return _run(csr, x, np.mean(x), make_actor, TOL, rates, latency, jitter, loss, timeout, max_time, sample_every, seed, trace, time_scale)
+
+'''
+ACTOR ASYNCH DIST AVG
+'''
+def actor_dist_avg(graph, TOL, rates=1.0, latency=0.001, jitter=0.0, loss=0.0, timeout=1.0, max_time=60.0,
+                   sample_every=0.01, seed=None, trace=None, time_scale=1.0):
+    '''
+    Asynchronous distributed averaging with one asyncio task per node (see DistAvgActor).
+    Same arguments and result as actor_gossip.
+    '''
+    print("")
+    print("------- ACTOR ASYNCH. DIST. AVG. ------- ")
+    csr = as_csr(graph)
+    x = csr.values
+    make_actor = lambda net, i, rate: DistAvgActor(net, i, csr, x, rate, timeout)
+    return _run(csr, x, np.mean(x), make_actor, TOL, rates, latency, jitter, loss, timeout, max_time, sample_every, seed, trace, time_scale)
+
+'''
+ACTOR PDMM ASYNCHRONOUS
+'''
+def actor_pdmm(graph, TOL, c=0.4, rates=1.0, latency=0.001, jitter=0.0, loss=0.0, max_time=60.0,
+               sample_every=0.01, seed=None, trace=None, time_scale=1.0):
+    '''
+    Asynchronous PDMM with one asyncio task per node (see PDMMActor).
+    Same arguments and result as actor_gossip (no timeout, PDMM never waits for a reply).
+    '''
+    print("")
+    print("------- ACTOR PDMM Asynchronous ------- ")
+    csr = as_csr(graph)
+    state = PDMMState(csr, c)
+    make_actor = lambda net, i, rate: PDMMActor(net, i, csr, state.x, rate, None, state)
+    return _run(csr, state.x, np.mean(csr.values), make_actor, TOL, rates, latency, jitter, loss, None, max_time, sample_every, seed, trace, time_scale)
@@ -0,0 +1,156 @@
+import ast
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import numpy as np
+
+from csrgraph import as_csr
+
+'''
+CONTENT-ADDRESSED EXPERIMENT CACHE
+using ExperimentCache(directory) with run_experiments(..., cache=cache): a run whose graph, algorithm,
+parameters and seed were seen before is read from disk instead of simulated again
+'''
+def graph_fingerprint(graph):
+    '''
+    sha256 of the graph content: labels, CSR arrays, measurements and positions.
+    Two graphs with the same fingerprint give the same run for the same algorithm, parameters and seed.
+    '''
+    csr = as_csr(graph)
+    h = hashlib.sha256()
+    h.update(repr(csr.labels).encode())
+    for array in (csr.indptr, csr.indices, csr.values, csr.pos):
+        if array is None:
+            h.update(b"none")
+            continue
+        array = np.ascontiguousarray(array)
+        h.update(array.dtype.str.encode() + repr(array.shape).encode())
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+
+# modules that only plot, followed by no algorithm result (randgoss imports plot_rgg_side_by_side for the drop/add figures)
+PLOTTING = ("visualization",)
+
+
+def local_modules(path, skip=PLOTTING):
+    '''
+    Names of the modules of the directory of path that the module at path imports, directly or through one of them
+    (import statements anywhere in the files, also inside functions). Modules in skip are not followed.
+    '''
+    directory = os.path.dirname(path)
+    todo = [os.path.splitext(os.path.basename(path))[0]]
+    found = set()
+    while todo:
+        name = todo.pop()
+        file = os.path.join(directory, name + ".py")
+        if name in found or (name in skip and found) or not os.path.exists(file):
+            continue
+        found.add(name)
+        with open(file, "rb") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                todo.extend(alias.name.split(".")[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                todo.append(node.module.split(".")[0])
+    return sorted(found)
+
+
+def code_fingerprint(algorithm):
+    '''
+    sha256 of the module of algorithm and of every module next to it that it imports (local_modules, names and
+    contents). A run also depends on the helpers it calls (PDMMState, ErrorTracker, CSRGraph, ...), so editing one
+    of them invalidates the cached runs. The driver (main.py, experiments.py) and the plots are not imported by the
+    algorithms, editing them keeps the cache.
+    Functions without a source file (defined interactively) fall back to their own source.
+    '''
+    try:
+        path = os.path.abspath(inspect.getsourcefile(algorithm))
+    except TypeError:
+        return hashlib.sha256(inspect.getsource(algorithm).encode()).hexdigest()
+    h = hashlib.sha256()
+    for name in local_modules(path):
+        with open(os.path.join(os.path.dirname(path), name + ".py"), "rb") as f:
+            h.update(name.encode() + b"\0" + f.read() + b"\0")
+    return h.hexdigest()
+
+
+def run_key(fingerprint, algorithm, TOL, params, seed):
+    '''
+    Cache key of one run: graph fingerprint, algorithm (module and name), the code (code_fingerprint, so editing
+    the algorithm or any module it imports invalidates its entries), TOL, all parameters and the seed
+    (a np.random.SeedSequence or an int).
+    '''
+    if isinstance(seed, np.random.SeedSequence):
+        seed = [seed.entropy, list(seed.spawn_key)]
+    description = {
+        "graph": fingerprint,
+        "algorithm": algorithm.__module__ + "." + algorithm.__qualname__,
+        "source": code_fingerprint(algorithm),
+        "TOL": TOL,
+        "params": params,
+        "seed": seed,
+    }
+    text = json.dumps(description, sort_keys=True, default=repr)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ExperimentCache:
+    '''
+    Directory of pickled results named by their run_key. The file modification time is the last use,
+    a hit touches the file, and put() removes the least recently used files while the directory
+    is larger than max_bytes.
+    Traces written to disk by a TraceRecorder (trace "path") are not part of the entry, keep them
+    in the default in-memory mode when caching.
+    '''
+    def __init__(self, directory, max_bytes=2 * 1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+    def get(self, key):
+        # cached value of key or None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        # write to a temporary file first, so an interrupted run never leaves half an entry
+        path = self._path(key)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        self.evict()
+
+    def evict(self):
+        # remove least recently used entries until the cache fits in max_bytes
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def size(self):
+        return sum(os.path.getsize(os.path.join(self.directory, name))
+                   for name in os.listdir(self.directory) if name.endswith(".pkl"))
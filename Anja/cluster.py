@@ -0,0 +1,384 @@
+import heapq
+import multiprocessing
+import numpy as np
+import random
+import select
+import socket
+import struct
+import time
+from multiprocessing.connection import wait
+
+from actors import GossipActor, PDMMActor, TICK, Y
+from csrgraph import CSRGraph, as_csr
+from eventsim import _clock_trace
+from pdmmcore import PDMMState
+from traces import make_traces
+
+'''
+LOCALHOST CLUSTER (worker processes, real sockets)
+using cluster_gossip() / cluster_pdmm(): the nodes are split into shards of consecutive slots, every shard runs in its
+own process and every message between two nodes (also two nodes of the same shard) is sent over a localhost UDP or
+TCP socket in the wire format below. The node logic is GossipActor / PDMMActor of actors.py (random_gossip_noW and
+pdmm_async with messages), the clocks are real: node i ticks at rate lambda_i per wall-clock second.
+The parent process only collects x every sample_every seconds over a pipe (not counted as network traffic) and
+tells the workers to stop when e(k) <= TOL.
+'''
+# wire format: one record per message, little endian, no padding
+#   kind  uint8     message kind of actors.py (REQUEST, REPLY, BUSY, Y)
+#   src   uint32    sending node
+#   dst   uint32    receiving node
+#   seq   uint32    request number (gossip) / edge position of z_ji at dst (pdmm)
+#   value float64   x_i, the pair average or y_ij
+# all records for the same worker that are produced in one pass of its loop go out in one datagram / send
+RECORD = struct.Struct("<BIIId")
+MAX_BATCH = RECORD.size * 2800          # stays below the 65507 byte UDP payload limit
+UDP_HEADER = 28                         # IPv4 + UDP header bytes per datagram
+RECV_BUFFER = 1 << 22
+
+
+class UDPTransport:
+    '''
+    One non-blocking UDP socket per worker, records for a worker are sent as datagrams to its address.
+    A datagram that does not fit in the send buffer is dropped (and counted), like the kernel drops
+    datagrams that do not fit in the receive buffer of the other side.
+    '''
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+        self.bytes_sent = 0
+        self.header_bytes = 0
+        self.sends = 0
+        self.dropped = 0
+
+    def connect(self, addresses):
+        self.addresses = addresses
+        self.pending = [bytearray() for _ in addresses]
+
+    def flush(self, w=None):
+        for v in (range(len(self.pending)) if w is None else (w,)):
+            buffer = self.pending[v]
+            if not buffer:
+                continue
+            try:
+                self.sock.sendto(buffer, self.addresses[v])
+                self.bytes_sent += len(buffer)
+                self.header_bytes += UDP_HEADER
+                self.sends += 1
+            except OSError:
+                self.dropped += len(buffer) // RECORD.size
+            buffer.clear()
+
+    def unsent(self):
+        # records still waiting for the next flush
+        return sum(len(buffer) for buffer in self.pending) // RECORD.size
+
+    def receive(self, timeout):
+        # records of everything that arrives within timeout seconds (at most 256 datagrams per call)
+        if not select.select([self.sock], [], [], timeout)[0]:
+            return
+        for _ in range(256):
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                return
+            yield from RECORD.iter_unpack(data)
+
+    def close(self):
+        self.sock.close()
+
+
+class TCPTransport:
+    '''
+    A listening socket per worker and one TCP connection from every worker to every worker.
+    Records have a fixed size, so the stream needs no framing: a read is cut at the last whole record and
+    the rest waits for the next read. Sends are non-blocking, what the kernel does not take stays pending
+    (two workers writing to each other with full buffers can never block each other).
+    '''
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(256)
+        self.address = self.listener.getsockname()
+        self.bytes_sent = 0
+        self.header_bytes = 0
+        self.sends = 0
+        self.dropped = 0
+
+    def connect(self, addresses):
+        self.out = []
+        for address in addresses:
+            sock = socket.create_connection(address)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setblocking(False)
+            self.out.append(sock)
+        self.incoming = {}
+        for _ in addresses:
+            sock, _ = self.listener.accept()
+            sock.setblocking(False)
+            self.incoming[sock] = bytearray()
+        self.pending = [bytearray() for _ in addresses]
+
+    def flush(self, w=None):
+        for v in (range(len(self.pending)) if w is None else (w,)):
+            buffer = self.pending[v]
+            if not buffer:
+                continue
+            try:
+                sent = self.out[v].send(buffer)
+            except BlockingIOError:
+                continue
+            self.bytes_sent += sent
+            self.sends += 1
+            del buffer[:sent]
+
+    def unsent(self):
+        return sum(len(buffer) for buffer in self.pending) // RECORD.size
+
+    def receive(self, timeout):
+        writing = [self.out[v] for v in range(len(self.pending)) if self.pending[v]]
+        readable = select.select(list(self.incoming), writing, [], timeout)[0]
+        for sock in readable:
+            buffer = self.incoming[sock]
+            try:
+                buffer += sock.recv(1 << 20)
+            except BlockingIOError:
+                continue
+            whole = len(buffer) - len(buffer) % RECORD.size
+            yield from RECORD.iter_unpack(bytes(buffer[:whole]))
+            del buffer[:whole]
+
+    def close(self):
+        for sock in self.out + list(self.incoming):
+            sock.close()
+        self.listener.close()
+
+
+class SocketNetwork:
+    '''
+    The Network interface the actors use (send, after, rng, transmissions), backed by a transport.
+    after() timers (clock ticks, timeouts) are kept in a heap and run by the worker loop.
+    '''
+    def __init__(self, transport, owner, rng, t0):
+        self.transport = transport
+        self.owner = owner
+        self.rng = rng
+        self.t0 = t0
+        self.timers = []
+        self.count = 0
+        self.transmissions = 0
+        self.sent = 0
+        self.received = 0
+
+    def now(self):
+        return time.monotonic() - self.t0
+
+    def send(self, src, dst, kind, value=None, seq=0):
+        if kind == Y:
+            seq, value = value
+        w = self.owner[dst]
+        buffer = self.transport.pending[w]
+        buffer += RECORD.pack(kind, src, dst, seq, 0.0 if value is None else value)
+        self.sent += 1
+        if len(buffer) >= MAX_BATCH:
+            self.transport.flush(w)
+
+    def after(self, delay, dst, kind, seq=0):
+        self.count += 1
+        heapq.heappush(self.timers, (self.now() + delay, self.count, dst, kind, seq))
+
+
+def _worker(w, conn, protocol, indptr, indices, values, lo, hi, owner, c, rates, timeout, transport, seed, sample_every):
+    '''
+    Runs the nodes lo..hi-1: clock ticks and timeouts from the timer heap, messages from the socket(s),
+    x[lo:hi] to the parent every sample_every seconds until the parent says stop.
+    '''
+    csr = CSRGraph(range(len(values)), indptr, indices, values.copy())
+    transport = UDPTransport() if transport == "udp" else TCPTransport()
+    conn.send(transport.address)
+    transport.connect(conn.recv())
+    conn.send("ready")
+    t0 = conn.recv()
+
+    net = SocketNetwork(transport, owner, random.Random(seed), t0)
+    if protocol == "gossip":
+        x = csr.values
+        actors = [GossipActor(net, i, csr, x, rates[i], timeout) for i in range(lo, hi)]
+    else:
+        state = PDMMState(csr, c)
+        x = state.x
+        actors = [PDMMActor(net, i, csr, x, rates[i], None, state) for i in range(lo, hi)]
+    for i in range(lo, hi):
+        net.after(net.rng.expovariate(rates[i]), i, TICK)
+
+    timers = net.timers
+    next_report = sample_every
+    while True:
+        now = net.now()
+        while timers and timers[0][0] <= now:
+            _, _, i, kind, seq = heapq.heappop(timers)
+            if kind == TICK:
+                net.after(net.rng.expovariate(rates[i]), i, TICK)
+                actors[i - lo].tick()
+            else:
+                actors[i - lo].receive(kind, i, None, seq)
+        if now >= next_report:
+            conn.send((net.transmissions, x[lo:hi].copy()))
+            next_report += sample_every
+            if conn.poll():
+                # the records of the ticks of this pass still go out, they are not lost
+                transport.flush()
+                break
+        transport.flush()
+        wait_for = min(timers[0][0] if timers else next_report, next_report) - net.now()
+        for kind, src, dst, seq, value in transport.receive(max(wait_for, 0.0)):
+            net.received += 1
+            actors[dst - lo].receive(kind, src, (seq, value) if kind == Y else value, seq)
+        transport.flush()
+
+    # stopped: no more ticks or replies. Messages still in flight are only counted, until every worker has
+    # stopped (parent says "drain") and a moment after that, then the totals go to the parent
+    conn.recv()
+    conn.send("stopped")
+    while not conn.poll():
+        transport.flush()
+        for _ in transport.receive(0.01):
+            net.received += 1
+    conn.recv()
+    end = time.monotonic() + 0.1
+    while time.monotonic() < end:
+        for _ in transport.receive(0.01):
+            net.received += 1
+    conn.send({"sent": net.sent, "received": net.received, "dropped": transport.dropped, "unsent": transport.unsent(),
+               "bytes_sent": transport.bytes_sent, "header_bytes": transport.header_bytes, "sends": transport.sends})
+    transport.close()
+
+
+def _run(csr, x, protocol, TOL, workers, transport, c, rates, timeout, max_time, sample_every, seed, trace):
+    start_time = time.time()
+    n = csr.num_nodes
+    true_avg = np.mean(csr.values)
+    bounds = np.linspace(0, n, workers + 1).astype(np.int64)
+    owner = np.repeat(np.arange(workers, dtype=np.int32), np.diff(bounds)).tolist()
+    rates = np.broadcast_to(np.asarray(rates, dtype=np.float64), (n,)).tolist()
+    seeds = np.random.default_rng(seed).integers(2**63, size=workers).tolist()
+
+    pipes = [multiprocessing.Pipe() for _ in range(workers)]
+    processes = [multiprocessing.Process(target=_worker, daemon=True,
+                                         args=(w, pipes[w][1], protocol, csr.indptr, csr.indices, csr.values,
+                                               int(bounds[w]), int(bounds[w + 1]), owner, c, rates, timeout,
+                                               transport, seeds[w], sample_every))
+                 for w in range(workers)]
+    for process in processes:
+        process.start()
+    conns = [parent for parent, _ in pipes]
+    addresses = [conn.recv() for conn in conns]
+    for conn in conns:
+        conn.send(addresses)
+    for conn in conns:
+        conn.recv()
+    t0 = time.monotonic()
+    for conn in conns:
+        conn.send(t0)
+
+    # one sample of e(k) per round of reports (every worker reports every sample_every seconds)
+    std_devs, errors = make_traces(trace)
+    clock = _clock_trace(trace)
+    counts = [0] * workers
+    reports = [0] * workers
+    samples = 0
+    converged_at = None
+    while True:
+        ready = wait(conns, timeout=1.0)
+        if not ready and not all(process.is_alive() for process in processes):
+            raise RuntimeError("cluster worker exited")
+        for conn in ready:
+            w = conns.index(conn)
+            counts[w], x[bounds[w]:bounds[w + 1]] = conn.recv()
+            reports[w] += 1
+        if min(reports) == samples:
+            continue
+        samples = min(reports)
+        now = time.monotonic() - t0
+        transmissions = sum(counts)
+        error = float(np.sum((x - true_avg)**2))
+        std_devs.append(transmissions, float(np.std(x, ddof=1)))
+        errors.append(transmissions, error)
+        clock.append(transmissions, now)
+        if error <= TOL:
+            converged_at = now
+            break
+        if now > max_time:
+            break
+    run_time = time.monotonic() - t0
+
+    # every worker stops at its next report (the reports still on the way only update the counts),
+    # once all have stopped they count the messages in flight and send their totals
+    for conn in conns:
+        conn.send("stop")
+    for w, conn in enumerate(conns):
+        message = conn.recv()
+        while message != "stopped":
+            counts[w] = message[0]
+            message = conn.recv()
+    for conn in conns:
+        conn.send("drain")
+    totals = [conn.recv() for conn in conns]
+    for process in processes:
+        process.join()
+
+    stats = {key: sum(total[key] for total in totals) for key in totals[0]}
+    stats["lost"] = stats["sent"] - stats["received"] - stats["unsent"]
+    stats["wire_bytes"] = stats["bytes_sent"] + stats["header_bytes"]
+    stats["messages_per_second"] = stats["received"] / run_time
+    stats["bytes_per_second"] = stats["wire_bytes"] / run_time
+    stats["bytes_per_message"] = stats["wire_bytes"] / stats["sent"] if stats["sent"] else 0.0
+    stats["convergence_time"] = converged_at
+    stats["run_time"] = run_time
+    stats["transmissions"] = sum(counts)
+
+    if converged_at is None:
+        print("\033[91mERROR: e(k) did not reach " + str(TOL) + " within " + str(max_time) + " seconds.\033[0m")
+    print("Execution time:", time.time() - start_time, "seconds")
+    print("Transmissions: ", stats["transmissions"])
+    print("Time to TOL:", converged_at, "seconds")
+    print("Messages sent / received / lost:", stats["sent"], "/", stats["received"], "/", stats["lost"])
+    print("Messages per second:", stats["messages_per_second"])
+    print("Bytes on the wire:", stats["wire_bytes"], "(" + str(stats["sends"]) + " " + transport.upper() + " sends, "
+          + str(round(stats["bytes_per_message"], 1)) + " bytes per message)")
+    print("Average: ", x[0])
+    return x[0], std_devs, errors, stats["transmissions"], clock, stats
+
+'''
+CLUSTER RANDOM GOSSIP
+'''
+def cluster_gossip(graph, TOL, workers=4, transport="udp", rates=10.0, timeout=0.5, max_time=60.0,
+                   sample_every=0.05, seed=None, trace=None):
+    '''
+    random_gossip_noW with the nodes spread over worker processes that talk over localhost sockets (see GossipActor).
+    workers: number of processes, transport: "udp" or "tcp"
+    rates: ticks per second, one value or one per node; timeout: seconds a node waits for a reply
+    Stops when e(k) <= TOL (sampled every sample_every seconds) or after max_time seconds.
+    Returns (avg, std devs, errors, transmissions, clock, stats) like actor_gossip, stats has the messages sent /
+    received / lost, bytes on the wire, messages per second and the time to reach TOL.
+    '''
+    print("")
+    print("------- CLUSTER RANDOM GOSSIP (" + transport.upper() + ") ------- ")
+    csr = as_csr(graph)
+    return _run(csr, csr.values, "gossip", TOL, workers, transport, None, rates, timeout, max_time, sample_every, seed, trace)
+
+'''
+CLUSTER PDMM ASYNCHRONOUS
+'''
+def cluster_pdmm(graph, TOL, c=0.4, workers=4, transport="udp", rates=10.0, max_time=60.0,
+                 sample_every=0.05, seed=None, trace=None):
+    '''
+    pdmm_async with the nodes spread over worker processes that talk over localhost sockets (see PDMMActor).
+    Same arguments and result as cluster_gossip (no timeout, PDMM never waits for a reply).
+    '''
+    print("")
+    print("------- CLUSTER PDMM Asynchronous (" + transport.upper() + ") ------- ")
+    csr = as_csr(graph)
+    return _run(csr, np.zeros(csr.num_nodes), "pdmm", TOL, workers, transport, c, rates, None, max_time, sample_every, seed, trace)
@@ -0,0 +1,283 @@
+import copy
+import networkx as nx
+import numpy as np
+import random
+
+
+def _grow(array, size, fill=0):
+    # copy of array with length >= size (at least doubled), new entries set to fill
+    grown = np.full((max(size, 2 * len(array)),) + array.shape[1:], fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+'''
+COMPACT GRAPH REPRESENTATION
+using CSRGraph.from_networkx() once per run, then neighbors()/random_neighbor() in the hot loop
+'''
+class CSRGraph:
+    '''
+    Compressed sparse row (CSR) copy of an undirected networkx graph.
+
+    Nodes are stored in slots 0..n-1 following the networkx node order.
+        labels[k]   networkx label of the node in slot k
+        index       dict label -> slot
+        indptr      int32, length n+1. The neighbors of slot k are indices[indptr[k]:indptr[k+1]]
+        indices     int32, length 2*m. Every undirected edge appears once in each direction
+        values      float64, length n. Node measurements (the "temp" attribute)
+        pos         float64, n x dim. Node positions if the graph has a "pos" attribute, else None
+        start       row of slot k starts at start[k] (indptr[:-1] until remove_slot/add_slot moves rows)
+        cap         row k has room for cap[k] edges (only once the graph is no longer packed)
+
+    remove_slot() and add_slot() change one node in place in O(degree) and leave gaps in the rows (packed = False).
+    neighbors(), random_neighbor() and degree stay valid, the whole-array methods work on a compact() copy then.
+
+    The networkx graph is only read while building. The algorithms run on the arrays and
+    the graph is kept around for plotting and for the drop/add experiments.
+    '''
+    def __init__(self, labels, indptr, indices, values, pos=None):
+        self.labels = list(labels)
+        self.index = {label: k for k, label in enumerate(self.labels)}
+        self.indptr = indptr
+        self.indices = indices
+        self.values = values
+        self.pos = pos
+        self.degree = np.diff(indptr).astype(np.int32)
+        self.start = indptr[:-1]
+        self.packed = True
+        self._slots = None      # longer arrays behind values/start/degree/pos once add_slot has grown them
+
+    @classmethod
+    def from_networkx(cls, graph, attr="temp", values=None):
+        '''
+        Build the arrays from a networkx graph.
+        values (dict, optional): label -> value, overrides the node attribute for the labels it contains.
+                                 Used to carry the current state over after the topology has changed.
+        '''
+        labels = list(nx.nodes(graph))
+        index = {label: k for k, label in enumerate(labels)}
+        n = len(labels)
+
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        indices = np.empty(2 * graph.number_of_edges(), dtype=np.int32)
+        ptr = 0
+        for k, label in enumerate(labels):
+            for neighbor in graph.adj[label]:
+                indices[ptr] = index[neighbor]
+                ptr += 1
+            indptr[k + 1] = ptr
+
+        node_attrs = nx.get_node_attributes(graph, attr)
+        if values is None:
+            values = {}
+        x = np.array([values[label] if label in values else node_attrs.get(label, 0.0) for label in labels], dtype=np.float64)
+
+        positions = nx.get_node_attributes(graph, "pos")
+        if len(positions) == n and n > 0:
+            pos_arr = np.array([positions[label] for label in labels], dtype=np.float64)
+        else:
+            pos_arr = None
+
+        return cls(labels, indptr, indices, x, pos_arr)
+
+    @property
+    def num_nodes(self):
+        return len(self.labels)
+
+    @property
+    def num_edges(self):
+        return int(np.sum(self.degree)) // 2
+
+    def neighbors(self, k):
+        # slice view, no copy
+        start = self.start[k]
+        return self.indices[start:start + self.degree[k]]
+
+    def random_node(self):
+        return random.randrange(len(self.labels))
+
+    def random_neighbor(self, k):
+        return int(self.indices[self.start[k] + random.randrange(self.degree[k])])
+
+    def remove_slot(self, k):
+        '''
+        Remove the node in slot k in place, O(sum of the degrees of k and its neighbors) instead of the O(n + m) of
+        remove_slots(). The same swap-remove as PDMMState.remove_node:
+            every edge (j, k) is swapped with the last edge of row j, row j gets one shorter
+            the node in the last slot moves into slot k (its row stays where it is, the edges pointing at it
+            are renumbered), values/degree/start/pos become one shorter (views, no copy)
+        The first call copies the structure arrays, labels and index (they may be shared with other CSRGraphs).
+        '''
+        self._unpack()
+        for j in self.neighbors(k).tolist():
+            self._replace_in_row(j, k, None)
+        del self.index[self.labels[k]]
+
+        last = self.num_nodes - 1
+        if k != last:
+            self.start[k] = self.start[last]
+            self.degree[k] = self.degree[last]
+            self.cap[k] = self.cap[last]
+            self.values[k] = self.values[last]
+            if self.pos is not None:
+                self.pos[k] = self.pos[last]
+            for j in self.neighbors(k).tolist():
+                self._replace_in_row(j, last, k)
+            label = self.labels[last]
+            self.labels[k] = label
+            self.index[label] = k
+        self.labels.pop()
+        self.start = self.start[:last]
+        self.degree = self.degree[:last]
+        self.values = self.values[:last]
+        if self.pos is not None:
+            self.pos = self.pos[:last]
+
+    def add_slot(self, label, neighbors, value, pos=None):
+        '''
+        Add a node in the next slot, connected to the given slots, O(degree) amortized. Returns its slot.
+        The same as PDMMState.add_node: the new row gets room at the end of indices, a neighbor row that is full
+        moves to the end with double capacity. values/start/degree/pos are views of arrays that are doubled
+        when full, so the values of the other nodes are kept (read csr.values again afterwards).
+        '''
+        self._unpack()
+        k = self.num_nodes
+        if self._slots is None or k == len(self._slots[0]):
+            self._slots = [_grow(array, k + 1) if array is not None else None
+                           for array in (self.values, self.start, self.degree, self.pos)]
+            self.cap = _grow(self.cap, k + 1)
+        values, start, degree, positions = self._slots
+        values[k] = value
+        start[k] = self.used
+        degree[k] = 0
+        self.cap[k] = max(4, len(neighbors))
+        self.used += int(self.cap[k])
+        self._reserve(self.used)
+        if positions is not None:
+            positions[k] = pos
+        self.values, self.start, self.degree = values[:k + 1], start[:k + 1], degree[:k + 1]
+        self.pos = positions[:k + 1] if positions is not None else None
+        self.labels.append(label)
+        self.index[label] = k
+
+        for j in neighbors:
+            self._append_to_row(k, j)
+            self._append_to_row(j, k)
+        return k
+
+    def _unpack(self):
+        # own copies of the structure arrays, labels and index before the first in-place change (they may be shared)
+        if not self.packed:
+            return
+        self.indices = self.indices.copy()
+        self.start = self.start.astype(np.int64)
+        self.degree = self.degree.copy()
+        self.cap = self.degree.copy()
+        self.used = len(self.indices)       # edge positions in use or reserved by a row
+        self.labels = list(self.labels)
+        self.index = dict(self.index)
+        self.packed = False
+
+    def _reserve(self, size):
+        if size > len(self.indices):
+            self.indices = _grow(self.indices, size)
+
+    def _append_to_row(self, j, k):
+        # append edge (j, k) to row j, moving the row to the end with double capacity if it is full
+        start, d = self.start[j], self.degree[j]
+        if d == self.cap[j]:
+            new_cap = max(4, 2 * int(d))
+            self._reserve(self.used + new_cap)
+            self.indices[self.used:self.used + d] = self.indices[start:start + d]
+            start = self.start[j] = self.used
+            self.cap[j] = new_cap
+            self.used += new_cap
+        self.indices[start + d] = k
+        self.degree[j] += 1
+
+    def _replace_in_row(self, j, old, new):
+        # edge (j, old) becomes (j, new), or is removed (swapped with the last edge of row j) if new is None
+        start = self.start[j]
+        end = start + self.degree[j]
+        p = start + int(np.flatnonzero(self.indices[start:end] == old)[0])
+        if new is None:
+            self.indices[p] = self.indices[end - 1]
+            self.degree[j] -= 1
+        else:
+            self.indices[p] = new
+
+    def compact(self):
+        # packed CSRGraph with the same slots, neighbor order and values (own copies), O(n + m)
+        indptr = np.zeros(self.num_nodes + 1, dtype=np.int32)
+        np.cumsum(self.degree, out=indptr[1:])
+        positions = np.repeat(self.start - indptr[:-1], self.degree) + np.arange(indptr[-1])
+        pos = self.pos.copy() if self.pos is not None else None
+        return CSRGraph(self.labels, indptr, self.indices[positions].astype(np.int32), self.values.copy(), pos)
+
+    def remove_slots(self, slots):
+        '''
+        New CSRGraph without the nodes in the given slots, values carried over. The remaining nodes and their
+        neighbors keep their order, so the result is the same as graph.remove_node() followed by
+        from_networkx(graph, values=values_by_label()), without going through networkx.
+        '''
+        if not self.packed:
+            return self.compact().remove_slots(slots)
+        n = self.num_nodes
+        keep = np.ones(n, dtype=bool)
+        keep[np.asarray(slots, dtype=np.int64)] = False
+        new_slot = np.cumsum(keep) - 1
+        src = np.repeat(np.arange(n), self.degree)
+        edge_keep = keep[src] & keep[self.indices]
+        indices = new_slot[self.indices[edge_keep]].astype(np.int32)
+        indptr = np.zeros(int(keep.sum()) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src[edge_keep], minlength=n)[keep], out=indptr[1:])
+        labels = [self.labels[k] for k in np.flatnonzero(keep)]
+        pos = self.pos[keep] if self.pos is not None else None
+        return CSRGraph(labels, indptr, indices, self.values[keep], pos)
+
+    def copy_values(self):
+        # same (read-only) structure arrays, labels and index, own copy of the values for an algorithm to change
+        # in place. A shallow copy, so only the values cost O(n), the index dict is not rebuilt
+        if not self.packed:
+            return self.compact()
+        graph = copy.copy(self)
+        graph.values = self.values.copy()
+        return graph
+
+    def to_networkx(self, attr="temp"):
+        # networkx graph with the same labels, "pos" and measurement attributes (for plotting and drop/add)
+        if not self.packed:
+            return self.compact().to_networkx(attr)
+        graph = nx.Graph()
+        for k, label in enumerate(self.labels):
+            if self.pos is not None:
+                graph.add_node(label, pos=tuple(self.pos[k]), **{attr: self.values[k]})
+            else:
+                graph.add_node(label, **{attr: self.values[k]})
+        src = np.repeat(np.arange(self.num_nodes), self.degree)
+        upper = src < self.indices
+        graph.add_edges_from(zip([self.labels[k] for k in src[upper]], [self.labels[k] for k in self.indices[upper]]))
+        return graph
+
+    def values_by_label(self):
+        return {label: self.values[k] for k, label in enumerate(self.labels)}
+
+    def laplacian(self):
+        '''
+        Sparse graph Laplacian L = D - Adj (scipy CSR), built from the arrays without densifying.
+        '''
+        from scipy.sparse import csr_matrix, diags
+        if not self.packed:
+            return self.compact().laplacian()
+        n = self.num_nodes
+        adjacency = csr_matrix((np.ones(len(self.indices)), self.indices, self.indptr), shape=(n, n))
+        return (diags(self.degree.astype(np.float64)) - adjacency).tocsr()
+
+
+def as_csr(graph):
+    '''
+    CSRGraph for an algorithm run: built from a networkx graph, or a copy of an existing CSRGraph
+    (e.g. from rgg.random_geometric_csr) that shares the structure but not the values.
+    '''
+    if isinstance(graph, CSRGraph):
+        return graph.copy_values()
+    return CSRGraph.from_networkx(graph)
@@ -2,16 +2,64 @@
 import networkx as nx
 import numpy as np
 import random
-import statistics
 import time
-
+import warnings
+
+from csrgraph import CSRGraph, as_csr
+from metrics import ErrorTracker
+from profiling import PhaseTimer
+from spatial import GridIndex
+from topology import ChurnTracker
+from traces import make_traces
 from utils import generate_measurements, generate_rgg, vector_to_dict
 from visualization import plot_rgg_side_by_side
 
+'''
+EXTREME EIGENVALUES OF THE LAPLACIAN
+using laplacian_extreme_eigs() for alpha_opt, asym_conv_factor() on request
+'''
+def laplacian_extreme_eigs(laplacian, tol=1e-6):
+    '''
+    Largest eigenvalue eig1 and smallest nonzero eigenvalue eigN-1 of a sparse graph Laplacian,
+    without a full eigen-decomposition:
+        eig1    Lanczos (eigsh, largest algebraic)
+        eigN-1  LOBPCG for the smallest eigenvalue orthogonal to the all-ones vector (the eigenvector of 0),
+                preconditioned with 1/degree
+    Only needs matrix-vector products with L, so memory stays O(n + m).
+    Small graphs fall back to a dense solve.
+    '''
+    from scipy.sparse import diags
+    from scipy.sparse.linalg import eigsh, lobpcg
+
+    n = laplacian.shape[0]
+    if n < 100:
+        eigenvalues = np.linalg.eigvalsh(laplacian.toarray())
+        return eigenvalues[-1], eigenvalues[1]
+
+    eig_max = eigsh(laplacian, k=1, which='LA', tol=tol, return_eigenvectors=False)[0]
+
+    ones = np.ones((n, 1)) / np.sqrt(n)
+    X = np.random.default_rng(0).standard_normal((n, 1))
+    precond = diags(1 / np.maximum(laplacian.diagonal(), 1))
+    with warnings.catch_warnings():
+        # lobpcg warns when it stops at maxiter, the eigenvalue is still accurate to ~residual^2
+        warnings.simplefilter("ignore", UserWarning)
+        eig_fiedler = lobpcg(laplacian, X, M=precond, Y=ones, largest=False, tol=tol, maxiter=1000)[0][0]
+
+    # alpha = 2 / (eig1 + eigN-1) stays below 2 / eig1 for any eigN-1 >= 0, so an inexact eigN-1 only costs speed
+    return eig_max, max(eig_fiedler, 0.0)
+
+def asym_conv_factor(eig_max, eig_fiedler, alpha):
+    '''
+    Asymptotic convergence factor of x(k) = (I - alpha*L) x(k-1):
+    spectral radius of W - 11^T/n = max(|1 - alpha*eigN-1|, |1 - alpha*eig1|)
+    '''
+    return max(abs(1 - alpha * eig_fiedler), abs(1 - alpha * eig_max))
+
 '''
 SYNCH. DIST AVG
 '''
-def dist_avg_synch(graph, TOL):
+def dist_avg_synch(graph, TOL, sparse=False, conv_factor=False, trace=None, profile=False):
     '''
     1) Find optimal alpha
     2) Set up W matrix
@@ -22,36 +70,50 @@ def dist_avg_synch(graph, TOL):
         x(k-1) = x(k)
     TRANSMISSIONS: for each iteration, transmissions increase by the number of edges in the graph
     Notice: W works on every entry in x(0) at each iteration, every link is active at each iteration -- confirm numerically
+
+    sparse=True: never builds a dense matrix. alpha_opt comes from laplacian_extreme_eigs() and the update is
+    x(k) = x(k-1) - alpha*L*x(k-1) with the sparse Laplacian, so memory is O(n + m) (for large RGGs)
+    conv_factor=True: also compute and print the asymptotic convergence factor
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     print("------- SYNCH. DIST. AVG. ------- ")
     start_time = time.time()
     
     # Find optimal alpha
-    all_nodes = list(nx.nodes(graph))
-
-    laplacian = nx.laplacian_matrix(graph).toarray()
-    eigenvalues = np.linalg.eigvals(laplacian)
-    eigenvalues_list = eigenvalues.tolist()
-
-    eigenvalues_list.sort(reverse=True)                 # sort in decending order to get eig1 and eigN-1
-    alpha_opt = 2 / (eigenvalues_list[0] + eigenvalues_list[-2])
-    
-    # Set up W matrix
-    W = np.zeros((len(all_nodes), len(all_nodes)))
-    W = np.eye(len(all_nodes)) - alpha_opt * laplacian
+    csr = as_csr(graph)
+    all_nodes = list(range(csr.num_nodes))
+
+    if sparse:
+        laplacian = csr.laplacian()
+        eig_max, eig_fiedler = laplacian_extreme_eigs(laplacian)
+        alpha_opt = 2 / (eig_max + eig_fiedler)
+        num_edges = csr.num_edges
+    else:
+        # L = D - Adj, filled in from the CSR arrays
+        laplacian = np.diag(csr.degree.astype(np.float64))
+        laplacian[np.repeat(all_nodes, csr.degree), csr.indices] -= 1
+        eigenvalues = np.linalg.eigvals(laplacian)
+        eigenvalues_list = np.real(eigenvalues).tolist()
+
+        eigenvalues_list.sort(reverse=True)                 # sort in decending order to get eig1 and eigN-1
+        eig_max, eig_fiedler = eigenvalues_list[0], eigenvalues_list[-2]
+        alpha_opt = 2 / (eig_max + eig_fiedler)
+        
+        # Set up W matrix
+        W = np.eye(len(all_nodes)) - alpha_opt * laplacian
 
-    num_edges = np.count_nonzero(np.triu(W, k=1))
+        num_edges = np.count_nonzero(np.triu(W, k=1))
 
-    row_sums = np.sum(W, axis=1)
-    col_sums = np.sum(W, axis=0)
-    if not np.allclose(row_sums, 1) or not np.allclose(col_sums, 1):
-        print("\033[91mERROR: The sum of rows or columns in W does not equal 1.\033[0m")
-    elif not np.allclose(W, W.T):
-        print("\033[91mERROR: W is not symmetric.\033[0m")
+        row_sums = np.sum(W, axis=1)
+        col_sums = np.sum(W, axis=0)
+        if not np.allclose(row_sums, 1) or not np.allclose(col_sums, 1):
+            print("\033[91mERROR: The sum of rows or columns in W does not equal 1.\033[0m")
+        elif not np.allclose(W, W.T):
+            print("\033[91mERROR: W is not symmetric.\033[0m")
 
     # Set x(k-1) = x(0) for algorithm start
-    x_kminus1 = np.array(list(nx.get_node_attributes(graph, "temp").values()))   
+    x_kminus1 = csr.values
 
     # get required true average needed for the e(k) function   
     true_avg = np.mean(x_kminus1)   
@@ -59,23 +121,32 @@ def dist_avg_synch(graph, TOL):
     # initializations for the while loop                                               
     x_k = np.zeros(len(all_nodes))
     transmissions = 0
-    std_devs = []
-    errors = []
+    std_devs, errors = make_traces(trace)
 
     # while num_iterations < 25 or num_iterations > 20000 or not np.allclose(x_kminus1, true_avg):
-    while (np.linalg.norm(x_k - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
-        x_k = np.dot(W, x_kminus1)                          # update the x vector
-        std_devs.append((transmissions, np.std(x_k)))
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while (np.linalg.norm(x_k - true_avg)**2 > TOL):
+        if timer: t = timer.lap("stop check", t)
+        # update the x vector
+        if sparse:
+            x_k = x_kminus1 - alpha_opt * (laplacian @ x_kminus1)
+        else:
+            x_k = np.dot(W, x_kminus1)
+        if timer: t = timer.lap("update", t)
+        std_devs.append(transmissions, np.std(x_k))
         # e(k) = || . ||
-        errors.append((transmissions, np.linalg.norm(x_k - np.ones(len(all_nodes)) * true_avg)**2))
+        errors.append(transmissions, np.linalg.norm(x_k - true_avg)**2)
         # x(k-1) = x(k)
         x_kminus1 = x_k
 
         # TRANSMISSIONS: for each iteration, transmissions increase by the number of edges in the graph
         transmissions += num_edges
+        if timer: t = timer.lap("record", t)
 
-    asym_conv_factor = np.max(np.linalg.eigvals(W - np.ones((len(all_nodes), len(all_nodes))) / len(all_nodes)))
-    # print("Asymptotic convergence factor", asym_conv_factor)
+    if conv_factor:
+        print("Asymptotic convergence factor", asym_conv_factor(eig_max, eig_fiedler, alpha_opt))
     
     if np.max(np.mean(x_kminus1 - true_avg)) > TOL:
         print(f"\033[91mERROR: Not all values in x_k are within {TOL} of each other.\033[0m")
@@ -85,12 +156,44 @@ def dist_avg_synch(graph, TOL):
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
     print("Average: ", x_kminus1[0])
+    if timer: timer.report("dist_avg_synch")
     return x_kminus1[0], std_devs, errors, transmissions
 
+'''
+W MATRIX FOR ASYNCH DIST AVG
+using build_W_asynch() and check_W() in the validation mode of dist_avg_asynch_W()
+'''
+def build_W_asynch(num_nodes, nodes_avg):
+    '''
+    Dense W(k) for one asynchronous averaging step: 1/|S| on the block S x S with S = N(i) U i,
+    identity everywhere else
+    '''
+    W = np.eye(num_nodes)
+    W[np.ix_(nodes_avg, nodes_avg)] = 1 / len(nodes_avg)
+    return W
+
+def check_W(W, TOL):
+    '''
+    Returns an error message if W is not symmetric, doubly stochastic, nonnegative
+    and with abs(eigenvalues) <= 1 + TOL (tolerance to account for overflow), None otherwise
+    '''
+    if not np.allclose(W, W.T):
+        return "W is not symmetric."
+    row_sums = np.sum(W, axis=1)
+    col_sums = np.sum(W, axis=0)
+    if not np.allclose(row_sums, 1) or not np.allclose(col_sums, 1):
+        return "W is not doubly stochastic."
+    if not np.all(W >= 0):
+        return "W is not nonnegative."
+    eigenvalues = np.linalg.eigvals(W)
+    if not np.all(np.abs(eigenvalues) <= 1.0 + TOL):
+        return "Absolute value of eigenvalues of W is not less than or equal to 1."
+    return None
+
 '''
 ASYNCH DIST AVG
 '''
-def dist_avg_asynch_W(graph, TOL):
+def dist_avg_asynch_W(graph, TOL, validate_every=0, trace=None, profile=False):
     '''
     1) x(k-1) = x(0)
     2) while e(k) > epsilon:
@@ -106,93 +209,92 @@ def dist_avg_asynch_W(graph, TOL):
                 x(k-1) = x(k)
         e(k) = || . ||
     TRANSMISSIONS: per iteration of while loop = N(i)
+
+    W(k) is applied implicitly: it is 1/(d_i+1) on the block N(i) U i and identity elsewhere,
+    so W(k)x(k-1) only changes the entries in N(i) U i, all set to their average. O(deg) per step.
+    validate_every > 0: every validate_every-th iteration also builds the dense W(k), checks it with check_W()
+    and compares W(k)x(k-1) with the implicit update
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     print("------- ASYNCH. DIST. AVG. (W)------- ")
     start_time = time.time()
 
     # x(k-1) = x(0)
-    x_kminus1 = np.array(list(nx.get_node_attributes(graph, "temp").values())) 
+    csr = as_csr(graph)
+    x = csr.values
 
     # setup for e(k)
-    true_avg = np.mean(x_kminus1)
+    true_avg = np.mean(x)
 
     # initializations for the while loop
-    all_nodes = list(nx.nodes(graph))  
-    x_k = np.zeros(len(all_nodes))
+    num_nodes = csr.num_nodes
     transmissions = 0 
-    std_devs = []
-    errors = []
+    std_devs, errors = make_traces(trace)
+    iteration = 0
 
     # while e(k) > epsilon:
-    while (np.linalg.norm(x_k - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
         # uniformly select random node i
-        random_node_i = random.choice(all_nodes)
+        random_node_i = csr.random_node()
+        if timer: t = timer.lap("select", t)
 
         # Construct the W matrix according to the current node selected
         # find all neighbors of node i
-        list_neighbors_cur = list(nx.all_neighbors(graph, random_node_i))
-        list_neighbors_cur.append(random_node_i)
-
-        # Calculate the W matrix for node i
-        W = np.zeros((len(all_nodes), len(all_nodes))) 
-
-        for l in list_neighbors_cur:
-            for m in list_neighbors_cur:
-                W[l, m] = 1 / (graph.degree(random_node_i) + 1)
-        
-        for l in range(len(all_nodes)):
-            for m in range(len(all_nodes)):
-                if l == m and l not in list_neighbors_cur:
-                    W[l, m] = 1
-        
-        # Check if W is symmetric
-        if not np.allclose(W, W.T):
-            print("\033[91mERROR: W is not symmetric.\033[0m")
-            break
-        
-        # Check if W is doubly stochastic
-        row_sums = np.sum(W, axis=1)
-        col_sums = np.sum(W, axis=0)
-        if not np.allclose(row_sums, 1) or not np.allclose(col_sums, 1):
-            print("\033[91mERROR: W is not doubly stochastic.\033[0m")
+        list_neighbors_cur = np.append(csr.neighbors(random_node_i), random_node_i)
+        if timer: t = timer.lap("neighbor", t)
+
+        # optional validation of the explicit W(k)
+        validating = validate_every > 0 and iteration % validate_every == 0
+        iteration += 1
+        if validating:
+            W = build_W_asynch(num_nodes, list_neighbors_cur)
+            error = check_W(W, TOL)
+            if error is not None:
+                print("\033[91mERROR: " + error + "\033[0m")
+                break
+            x_check = np.dot(W, x)
+            if timer: t = timer.lap("validate", t)
+
+        # x(k) = W(k)x(k-1), only the rows in N(i) U i differ from the identity
+        cur_temps = x[list_neighbors_cur]
+        avg = np.sum(cur_temps) / len(list_neighbors_cur)
+        x[list_neighbors_cur] = avg
+        tracker.update_many(cur_temps, avg)
+        if timer: t = timer.lap("update", t)
+
+        if validating and not np.allclose(x_check, x):
+            print("\033[91mERROR: Implicit update does not match W(k)x(k-1).\033[0m")
             break
 
-        # Check if W is nonnegative
-        if not np.all(W >= 0):
-            print("\033[91mERROR: W is not nonnegative.\033[0m")
-            break
-
-        # Check if abs(eigenvalues(W)) <= 1 + TOL (must do tolerance to account for overflow)
-        eigenvalues = np.linalg.eigvals(W)
-        if not np.all(np.abs(eigenvalues) <= 1.0 + TOL):
-            print("\033[91mERROR: Absolute value of eigenvalues of W is not less than or equal to 1.\033[0m")
-            break
-        
-        # x(k) = W(k)x(k-1)
-        x_k = np.dot(W, x_kminus1)
-        std_devs.append((transmissions, np.std(x_k)))
-        errors.append((transmissions, np.linalg.norm(x_k - np.ones(len(all_nodes)) * true_avg)**2))
-        x_kminus1 = x_k
+        std_devs.append(transmissions, tracker.stdev(ddof=0))
+        errors.append(transmissions, tracker.error)
 
         # TRANSMISSIONS: per iteration of while loop = N(i)
         transmissions += len(list_neighbors_cur)
+        if timer: t = timer.lap("record", t)
 
-    if np.max(np.mean(x_kminus1 - true_avg)) > TOL:
+    if np.max(np.mean(x - true_avg)) > TOL:
         print(f"\033[91mERROR: Not all values in x_k are within {TOL} of each other.\033[0m")
     
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
-    print("Average: ", x_kminus1[0])
+    print("Average: ", x[0])
+    if timer: timer.report("dist_avg_asynch_W")
 
-    return x_kminus1[0], std_devs, errors, transmissions
+    return x[0], std_devs, errors, transmissions
 
 '''
 ASYNCH DIST AVG
 '''
-def dist_avg_asynch_noW(graph, TOL):
+def dist_avg_asynch_noW(graph, TOL, trace=None, profile=False):
     '''
     1) x(k-1) = x(0)
     2) while e(k) > epsilon:
@@ -209,6 +311,7 @@ def dist_avg_asynch_noW(graph, TOL):
                 e(k) = || . ||
                 x(k-1) = x(k)
     TRANSMISSIONS: per iteration of while loop = N(i)
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     print("------- ASYNCH. DIST. AVG. (no W)------- ")
@@ -216,55 +319,65 @@ def dist_avg_asynch_noW(graph, TOL):
     start_time = time.time()
 
     # x(k-1) = x(0)
-    all_temps = nx.get_node_attributes(graph, "temp")
+    csr = as_csr(graph)
+    x = csr.values
     
     # get true average, used for stopping criterion
-    true_avg = np.mean(list(all_temps.values()))
-    std_devs = []
-    errors = []
+    true_avg = np.mean(x)
+    std_devs, errors = make_traces(trace)
     transmissions = 0
 
-    all_nodes = list(nx.nodes(graph))
-    while (np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
+    # e(k) and std dev are updated from the deg(i)+1 changed entries only
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
         # uniformly select random node i
-        node_i = random.choice(all_nodes)
+        node_i = csr.random_node()
+        if timer: t = timer.lap("select", t)
         
         # find all neighbors of node i
-        neighbors_i = list(nx.all_neighbors(graph, node_i))
+        neighbors_i = csr.neighbors(node_i)
+        if timer: t = timer.lap("neighbor", t)
 
         # before computing the average, get values in set N(i) U i
-        cur_temps = [all_temps[node] for node in neighbors_i]
-        cur_temps.append(all_temps[node_i])
-
-        avg = sum(cur_temps) / len(cur_temps)
+        cur_temps = x[neighbors_i]
+        cur_temp = x[node_i]
+        avg = (np.sum(cur_temps) + cur_temp) / (len(neighbors_i) + 1)
 
         # update all nodes in set N(i) U i
-        for node in neighbors_i:
-            all_temps[node] = avg
-        all_temps[node_i] = avg
+        x[neighbors_i] = avg
+        x[node_i] = avg
+        tracker.update_many(cur_temps, avg)
+        tracker.update(cur_temp, avg)
 
         # TRANSMISSIONS: per iteration of while loop = N(i)
         transmissions += len(neighbors_i)
+        if timer: t = timer.lap("update", t)
 
         # update values for plotting later
-        std_dev = statistics.stdev(list(all_temps.values()))
-        std_devs.append((transmissions, std_dev))
+        std_dev = tracker.stdev()
+        std_devs.append(transmissions, std_dev)
 
         # e(k) = || . ||
-        errors.append((transmissions, np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2))
+        errors.append(transmissions, tracker.error)
+        if timer: t = timer.lap("record", t)
     
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
-    print("Average: ", all_temps[0])
+    print("Average: ", x[0])
+    if timer: timer.report("dist_avg_asynch_noW")
 
-    return all_temps[0], std_devs, errors, transmissions
+    return x[0], std_devs, errors, transmissions
 
 '''
 ASYNCH DIST AVG TF
 '''
-def dist_avg_asynch_noW_tf(graph, TOL, FAILURE_RATE=0.0):
+def dist_avg_asynch_noW_tf(graph, TOL, FAILURE_RATE=0.0, trace=None, profile=False):
     '''
     1) x(k-1) = x(0)
     2) while e(k) > epsilon:
@@ -273,6 +386,7 @@ def dist_avg_asynch_noW_tf(graph, TOL, FAILURE_RATE=0.0):
             x(k) = avg(x_i U x_ni)
             e(k) = || . ||
     TRANSMISSIONS: per iteration of while loop = N(i)
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     print("------- ASYNCH. DIST. AVG. UNDER TF------- ")
@@ -280,16 +394,21 @@ def dist_avg_asynch_noW_tf(graph, TOL, FAILURE_RATE=0.0):
     start_time = time.time()
 
     # x(k-1) = x(0)
-    all_temps = nx.get_node_attributes(graph, "temp")
+    csr = as_csr(graph)
+    x = csr.values
     
     # get true average, used for stopping criterion
-    true_avg = np.mean(list(all_temps.values()))
-    std_devs = []
-    errors = []
+    true_avg = np.mean(x)
+    std_devs, errors = make_traces(trace)
     transmissions = 0
 
-    all_nodes = list(nx.nodes(graph))
-    while (np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
+    # e(k) and std dev are updated from the deg(i)+1 changed entries only
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
         # generate a random number between 0 and 1
         random_number = random.randint(0, 1)
 
@@ -297,56 +416,62 @@ def dist_avg_asynch_noW_tf(graph, TOL, FAILURE_RATE=0.0):
             break
 
         # uniformly select random node i
-        node_i = random.choice(all_nodes)
+        node_i = csr.random_node()
+        if timer: t = timer.lap("select", t)
         
         # find all neighbors of node i
-        neighbors_i = list(nx.all_neighbors(graph, node_i))
+        neighbors_i = csr.neighbors(node_i)
+        if timer: t = timer.lap("neighbor", t)
 
         # TF: does not see neighbors which are there
         # do some failures here
         if random_number == 1 and FAILURE_RATE >0:
             num_failures = int(len(neighbors_i) * FAILURE_RATE)
-            neighbors_i = random.sample(neighbors_i, len(neighbors_i) - num_failures)
+            neighbors_i = neighbors_i[random.sample(range(len(neighbors_i)), len(neighbors_i) - num_failures)]
 
         # before computing the average, get values in set N(i) U i
-        cur_temps = [all_temps[node] for node in neighbors_i]
-        cur_temps.append(all_temps[node_i])
-
-        avg = sum(cur_temps) / len(cur_temps)
+        cur_temps = x[neighbors_i]
+        cur_temp = x[node_i]
+        avg = (np.sum(cur_temps) + cur_temp) / (len(neighbors_i) + 1)
 
         # update all nodes in set N(i) U i
         # TF Can occur here, potentially not reaching all nodes in the neighborhood
         if random_number == 0 and FAILURE_RATE >0:
             num_failures = int(len(neighbors_i) * FAILURE_RATE)
-            neighbors_i = random.sample(neighbors_i, len(neighbors_i) - num_failures)
+            neighbors_i = neighbors_i[random.sample(range(len(neighbors_i)), len(neighbors_i) - num_failures)]
+            cur_temps = x[neighbors_i]
 
-        for node in neighbors_i:
-            all_temps[node] = avg
-        all_temps[node_i] = avg
+        x[neighbors_i] = avg
+        x[node_i] = avg
+        tracker.update_many(cur_temps, avg)
+        tracker.update(cur_temp, avg)
 
         # TRANSMISSIONS: per iteration of while loop = N(i)
         transmissions += len(neighbors_i)
+        if timer: t = timer.lap("update", t)
 
         # update values for plotting later
-        std_dev = statistics.stdev(list(all_temps.values()))
-        std_devs.append((transmissions, std_dev))
+        std_dev = tracker.stdev()
+        std_devs.append(transmissions, std_dev)
 
         # e(k) = || . ||
-        errors.append((transmissions, np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2))
+        errors.append(transmissions, tracker.error)
+        if timer: t = timer.lap("record", t)
 
     
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
-    print("Average: ", all_temps[0])
+    print("Average: ", x[0])
+    if timer: timer.report("dist_avg_asynch_noW_tf")
 
-    return all_temps[0], std_devs, errors, transmissions
+    return x[0], std_devs, errors, transmissions
 
 '''
 ASYNCH DIST AVG DROP/ADD
 '''
-def dist_avg_asynch_noW_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk"):
+def dist_avg_asynch_noW_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk", trace=None, profile=False):
     '''
     1) x(k-1) = x(0)
     2) while e(k) > epsilon:
@@ -357,6 +482,11 @@ def dist_avg_asynch_noW_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="b
                 x(k) = avg(x_i U x_ni)
                 e(k) = || . ||
     TRANSMISSIONS: per iteration of while loop = N(i)
+    3 OPTIONS:
+        * Dropping nodes in bulk (type="bulk"), e(k) stays measured against the original average
+        * Droppping nodes sequentially (type="seq"), one node every 1000 transmissions, e(k) against the average of the remaining nodes
+        * Adding nodes in bulk (type="bulk")
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     if (DROP_RATE > 0.0): # Dropping nodes
@@ -368,12 +498,12 @@ def dist_avg_asynch_noW_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="b
     start_time = time.time()
 
     # x(k-1) = x(0)
-    all_temps = nx.get_node_attributes(graph, "temp")
+    csr = CSRGraph.from_networkx(graph)
+    x = csr.values
     
     # get true average, used for stopping criterion
-    true_avg = np.mean(list(all_temps.values()))
-    std_devs = []
-    errors = []
+    true_avg = np.mean(x)
+    std_devs, errors = make_traces(trace)
     transmissions = 0
 
     DROPPED_FLAG = False
@@ -386,7 +516,20 @@ def dist_avg_asynch_noW_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="b
     num_nodes_add = int(len(all_nodes) * ADD_RATE) # in total this is how many nodes you want to add
     print("Number of nodes to add: ", num_nodes_add)
 
-    while (np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
+    # cell list over the node positions, kept in sync with the graph for connecting added nodes
+    RADIUS = 0.12
+    grid = GridIndex.from_graph(graph, RADIUS)
+    churn = None
+    num_nodes_dropped_already = 0
+    next_drop = 0
+
+    # e(k) and std dev are updated from the deg(i)+1 changed entries only
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
         if transmissions > 100000:
             break
         # CASE 1: BULK DROP
@@ -396,44 +539,74 @@ def dist_avg_asynch_noW_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="b
             nodes_to_drop = random.sample(all_nodes, num_nodes_drop)
             for node in nodes_to_drop:
                 graph.remove_node(node)
+                grid.remove(node)
             if not nx.is_connected(graph):
                 print("\033[91mERROR: After the nodes have been dropped in bulk, the graph is no longer connected.\033[0m")
                 break
 
             plot_rgg_side_by_side(graph_old, graph, "Bulk Drop")
             
-            # Recalculation after nodes drop
+            # Recalculation after nodes drop, surviving nodes keep their current values
             all_nodes = list(nx.nodes(graph))
-            all_temps = {node: temp for node, temp in all_temps.items() if node in graph}
-            # true_avg = np.mean(list(all_temps.values()))
+            csr = csr.remove_slots([csr.index[node] for node in nodes_to_drop])
+            x = csr.values
+            tracker.reset(x, true_avg)
+            # true_avg = np.mean(x)
             DROPPED_FLAG = True
+
+        # CASE 2: SEQUENTIAL DROP
+        # transmissions grow by deg(i) per iteration, so drop once every 1000 transmissions have passed
+        if (transmissions > 10000 and DROPPED_FLAG == False and type == "seq" and transmissions >= next_drop and DROP_RATE > 0.0):
+            next_drop = transmissions + 1000
+            slot_to_drop = csr.random_node()
+            node_to_drop = csr.labels[slot_to_drop]
+            # connectivity is checked locally around the dropped node, true_avg is updated by subtraction
+            if churn is None:
+                churn = ChurnTracker(graph, x)
+            connected = churn.drop(node_to_drop, x[slot_to_drop])
+            grid.remove(node_to_drop)
+
+            # swap-remove in place, the tracker drops the node's term and moves to the new average: O(degree)
+            value = x[slot_to_drop]
+            csr.remove_slot(slot_to_drop)
+            x = csr.values
+            all_nodes = csr.labels
+            true_avg = churn.true_avg
+            tracker.remove(value, x, true_avg)
+
+            num_nodes_dropped_already += 1
+
+            if not connected:
+                print("\033[91mERROR: After the nodes have been dropped in sequence, the graph is no longer connected.\033[0m")
+                break
+
+            if num_nodes_dropped_already == num_nodes_drop:
+                print("Number of nodes AFTER SEQ DROP: ", len(all_nodes))
+                DROPPED_FLAG = True
         
-        # CASE 2: BULK ADD
+        # CASE 3: BULK ADD
         if (transmissions > 10000 and ADDED_FLAG == False and type == "bulk" and ADD_RATE > 0.0):
             graph_old = graph.copy()
             print("Number of nodes BEFORE BULK ADD: ", len(all_nodes))
             num_nodes_add = int(len(all_nodes) * ADD_RATE)
             new_measurements = generate_measurements(num_nodes_add)
 
+            # the last num_nodes_add existing nodes do not get connected to the new ones
+            skipped = all_nodes[-num_nodes_add:] if num_nodes_add > 0 else []
+            for node in skipped:
+                grid.remove(node)
+
             for i in range(num_nodes_add):
                 # print("Node to add: ", len(all_nodes)+i+1)
                 # is position supposed to be in this range
                 graph.add_node(len(all_nodes)+1+i, pos=(random.uniform(0, 1), random.uniform(0, 1)), temp=new_measurements[i])
-                # make sure graph position is being created as well
-
-                pos = nx.get_node_attributes(graph, 'pos') 
-                
-                # print(len(pos), "should be equal to ", len(all_nodes)+i+1)
 
                 # randomly connect it to the graph in a random geometric manner
-                RADIUS = 0.12
-                
-                for node in graph.nodes():
-                    if node != len(all_nodes) + i + 1 and node not in all_nodes[-num_nodes_add:]:
-                        distance = np.linalg.norm(np.array(graph.nodes[node]['pos']) - np.array(graph.nodes[len(all_nodes) + i + 1]['pos']))
-                        if distance <= RADIUS:
-                            if not graph.has_edge(node, len(all_nodes) + i + 1):
-                                graph.add_edge(node, len(all_nodes) + i + 1)
+                # only the grid cells around the new node are checked
+                grid.connect(graph, len(all_nodes) + i + 1, RADIUS)
+
+            for node in skipped:
+                grid.insert(node, graph.nodes[node]['pos'])
 
             # to check this was done correctly, print the graph before and after adding nodes
             plot_rgg_side_by_side(graph_old, graph, "Bulk Add")
@@ -446,45 +619,53 @@ def dist_avg_asynch_noW_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="b
             # Recalculation after nodes drop
             all_nodes = list(nx.nodes(graph))
             print("Number of nodes AFTER BULK ADD: ", len(all_nodes))
-            # all_temps = nx.get_node_attributes(graph, "temp")
-            all_temps.update({node: graph.nodes[node]['temp'] for node in all_nodes[-num_nodes_add:]})
-            # true_avg = np.mean(list(all_temps.values()))
+            # new nodes start from their 'temp' measurement
+            csr = CSRGraph.from_networkx(graph, values=csr.values_by_label())
+            x = csr.values
+            tracker.reset(x, true_avg)
+            # true_avg = np.mean(x)
             
             ADDED_FLAG = True
+        if timer: t = timer.lap("topology", t)
 
         # uniformly select random node i
-        node_i = random.choice(all_nodes)
+        node_i = csr.random_node()
+        if timer: t = timer.lap("select", t)
         
         # find all neighbors of node i
-        neighbors_i = list(nx.all_neighbors(graph, node_i))
+        neighbors_i = csr.neighbors(node_i)
+        if timer: t = timer.lap("neighbor", t)
 
         # before computing the average, get values in set N(i) U i
-        cur_temps = [all_temps[node] for node in neighbors_i]
-        cur_temps.append(all_temps[node_i])
-
-        avg = sum(cur_temps) / len(cur_temps)
+        cur_temps = x[neighbors_i]
+        cur_temp = x[node_i]
+        avg = (np.sum(cur_temps) + cur_temp) / (len(neighbors_i) + 1)
 
         # update all nodes in set N(i) U i
-        for node in neighbors_i:
-            all_temps[node] = avg
-        all_temps[node_i] = avg
+        x[neighbors_i] = avg
+        x[node_i] = avg
+        tracker.update_many(cur_temps, avg)
+        tracker.update(cur_temp, avg)
 
         # TRANSMISSIONS: per iteration of while loop = N(i)
         transmissions += len(neighbors_i)
+        if timer: t = timer.lap("update", t)
 
         # update values for plotting later
-        std_dev = statistics.stdev(list(all_temps.values()))
-        std_devs.append((transmissions, std_dev))
+        std_dev = tracker.stdev()
+        std_devs.append(transmissions, std_dev)
 
         # e(k) = || . ||
-        errors.append((transmissions, np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2))
+        errors.append(transmissions, tracker.error)
+        if timer: t = timer.lap("record", t)
 
     
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
-    print("Average: ", list(all_temps.values())[0])
+    print("Average: ", x[0])
+    if timer: timer.report("dist_avg_asynch_noW_dropadd")
 
-    return list(all_temps.values())[0], std_devs, errors, transmissions
+    return x[0], std_devs, errors, transmissions
 
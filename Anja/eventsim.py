@@ -0,0 +1,443 @@
+import heapq
+import math
+import numpy as np
+import time
+
+from csrgraph import as_csr
+from metrics import ErrorTracker
+from pdmmcore import PDMMState
+from profiling import PhaseTimer
+from runs import average_run, conflict_free_runs
+from traces import TraceRecorder, make_traces
+
+'''
+EVENT-DRIVEN ASYNCHRONOUS SIMULATION
+using event_gossip() / event_dist_avg() / event_pdmm() in place of the counter loops of random_gossip_noW,
+dist_avg_asynch_noW and pdmm_async: every node has its own Poisson clock with rate lambda_i (ticks per second),
+messages take latency (+ exponential jitter) seconds to arrive, and convergence is recorded against
+transmissions and simulated seconds (time_axis() puts e(k) on the time axis).
+Gossip goes through the batched path (_simulate_runs): about 1.5M events/s on a 2k-node RGG, the same run as the
+heap loop. Asynchronous dist. avg. and PDMM change the state at the tick and stay on the heap loop (~170-400k events/s)
+'''
+class PoissonClocks:
+    '''
+    Activations of n independent Poisson clocks with rates lambda_i, generated in blocks.
+    The superposition of the clocks is one Poisson process with rate sum(lambda_i) in which every tick
+    belongs to node i with probability lambda_i / sum(lambda_i), so a block of ticks is
+        times  = now + cumsum(Exp(1 / sum(lambda)))
+        nodes  = categorical(lambda / sum(lambda))      (uniform when all rates are equal)
+    which is the same process as n separate clocks in a heap, without a heap operation per tick.
+    '''
+    def __init__(self, rates, rng):
+        self.rates = np.asarray(rates, dtype=np.float64)
+        self.total = float(np.sum(self.rates))
+        self.uniform = bool(np.all(self.rates == self.rates[0]))
+        self.cumulative = np.cumsum(self.rates) / self.total
+        self.rng = rng
+
+    def block(self, now, size):
+        times = now + np.cumsum(self.rng.exponential(1 / self.total, size))
+        if self.uniform:
+            nodes = self.rng.integers(0, len(self.rates), size)
+        else:
+            nodes = np.minimum(np.searchsorted(self.cumulative, self.rng.random(size), side="right"), len(self.rates) - 1)
+        return times, nodes
+
+
+'''
+PROTOCOLS
+the update rules of the counter loops, split into what the activated node does at its tick (activate, returns the
+message) and what happens when the message arrives (deliver, returns the number of transmissions)
+'''
+class GossipProtocol:
+    # random_gossip_noW: node i picks a random neighbor j at its tick, the pair average is taken when the message arrives
+    # deliver_run: a conflict-free run of arrivals at once (runs.average_run), used by _simulate_runs
+    activate = None
+
+    def __init__(self, csr, tracker):
+        self.csr = csr
+        self.x = csr.values
+        self.tracker = tracker
+
+    def partners(self, nodes, rng):
+        # random neighbor of every activated node of a block, drawn at once
+        start = self.csr.indptr[nodes]
+        degree = self.csr.indptr[nodes + 1] - start
+        return self.csr.indices[start + (rng.random(len(nodes)) * degree).astype(np.int64)]
+
+    def deliver(self, i, j):
+        x = self.x
+        cur_temp = x[i]
+        neigh_temp = x[j]
+        avg = (cur_temp + neigh_temp) / 2
+        x[i] = avg
+        x[j] = avg
+        self.tracker.update(cur_temp, avg)
+        self.tracker.update(neigh_temp, avg)
+        return 1
+
+    def deliver_run(self, I, J, TOL):
+        # pairs applied (all of them, or up to the one where e(k) reaches TOL), one transmission each
+        return average_run(self.x, self.tracker, I, J, TOL)
+
+
+class DistAvgProtocol:
+    # dist_avg_asynch_noW: node i asks its neighbors for their values, N(i) U i is averaged when the replies arrive
+    activate = None
+    partners = None
+
+    def __init__(self, csr, tracker):
+        self.csr = csr
+        self.x = csr.values
+        self.tracker = tracker
+
+    def deliver(self, i, j):
+        x = self.x
+        neighbors_i = self.csr.neighbors(i)
+        cur_temps = x[neighbors_i]
+        cur_temp = x[i]
+        avg = (np.sum(cur_temps) + cur_temp) / (len(neighbors_i) + 1)
+        x[neighbors_i] = avg
+        x[i] = avg
+        self.tracker.update_many(cur_temps, avg)
+        self.tracker.update(cur_temp, avg)
+        return len(neighbors_i)
+
+
+class PDMMProtocol:
+    '''
+    pdmm_async: node i updates x_i and y_ij at its tick, and the y_ji of its neighbors as they are at the tick
+    travel to it. The message carries that copy, so z_ij = y_ji is set to the values of the tick when it arrives,
+    however much the neighbors have updated in between (with latency 0 this is pdmm_async).
+    '''
+    partners = None
+
+    def __init__(self, state, tracker):
+        self.state = state
+        self.x = state.x
+        self.tracker = tracker
+        # the topology does not change during a run: first edge and positions of the y_ji per node, looked up once
+        self.start = state.start.tolist()
+        self.incoming = [state.rev[start:start + degree] for start, degree in zip(self.start, state.degree.tolist())]
+
+    def activate(self, i, j):
+        x_old = self.x[i]
+        self.tracker.update(x_old, self.state.update_node(i))
+        return self.state.y[self.incoming[i]]
+
+    def deliver(self, i, y):
+        start = self.start[i]
+        self.state.z[start:start + len(y)] = y
+        return 1
+
+
+def simulate(protocol, tracker, num_nodes, TOL, rates=1.0, latency=0.0, jitter=0.0, max_time=math.inf,
+             seed=None, trace=None, block=1 << 16, timer=None, batched=True):
+    '''
+    Discrete-event loop shared by the event_* algorithms.
+    Activations come from PoissonClocks in blocks, messages in flight wait in a heap of
+    (arrival time, sequence number, node, message), the message is what activate returned (the partner if the
+    protocol has no activate). The next event is the earlier of the two.
+    batched=True and a protocol with deliver_run and no activate: _simulate_runs, the same run in NumPy steps.
+    latency == jitter == 0: a message arrives at the tick that sent it, no heap is used and the run is the
+    counter loop of the protocol (with rates=1.0) with simulated time attached.
+    After every delivery the stopping criterion is checked and std dev, e(k) and the simulated time are recorded
+    (only when a recorder keeps the sample, so trace={"mode": "log"} makes long runs much cheaper).
+    Returns transmissions, simulated seconds, number of events (ticks + delayed deliveries), std_devs, errors, clock
+    where clock holds (transmissions, simulated seconds).
+    '''
+    rng = np.random.default_rng(seed)
+    rates = np.broadcast_to(np.asarray(rates, dtype=np.float64), (num_nodes,))
+    clocks = PoissonClocks(rates, rng)
+    std_devs, errors = make_traces(trace)
+    clock = _clock_trace(trace)
+    if batched and protocol.activate is None and getattr(protocol, "deliver_run", None):
+        return _simulate_runs(protocol, tracker, clocks, rng, TOL, latency, jitter, max_time, block,
+                              std_devs, errors, clock, timer)
+    activate = protocol.activate
+    deliver = protocol.deliver
+    delayed = latency > 0 or jitter > 0
+
+    heap = []
+    heappush = heapq.heappush
+    heappop = heapq.heappop
+    now = 0.0
+    transmissions = 0
+    events = 0
+    seq = 0
+    k = size = 0
+    next_record = 0
+    if timer: t = timer.start()
+    while True:
+        if k == size:
+            # next block of ticks (and partners / message delays) as lists, indexing lists is faster than arrays
+            times, nodes = clocks.block(now if size == 0 else times[-1], block)
+            partners = protocol.partners(nodes, rng).tolist() if protocol.partners else [None] * block
+            delays = (latency + rng.exponential(jitter, block) if jitter > 0 else np.full(block, latency)).tolist()
+            times = times.tolist()
+            nodes = nodes.tolist()
+            k = 0
+            size = block
+            if timer: t = timer.lap("clock", t)
+
+        if heap and heap[0][0] <= times[k]:
+            now, _, i, j = heappop(heap)
+        else:
+            now = times[k]
+            if now > max_time:
+                now = max_time
+                break
+            i = nodes[k]
+            j = partners[k]
+            k += 1
+            events += 1
+            if activate is not None:
+                j = activate(i, j)
+            if delayed:
+                seq += 1
+                heappush(heap, (now + delays[k - 1], seq, i, j))
+                if timer: t = timer.lap("activate", t)
+                continue
+            if timer: t = timer.lap("activate", t)
+        if delayed:
+            events += 1
+
+        transmissions += deliver(i, j)
+        if timer: t = timer.lap("deliver", t)
+
+        # the std dev is only computed for deliveries that one of the recorders can keep
+        if transmissions >= next_record:
+            std_devs.append(transmissions, tracker.stdev())
+            errors.append(transmissions, tracker.error)
+            clock.append(transmissions, now)
+            next_record = min(std_devs.next_due(), errors.next_due(), clock.next_due())
+        if tracker.converged(TOL):
+            break
+        if timer: t = timer.lap("record", t)
+
+    # the final state is always part of the traces
+    std_devs.append(transmissions, tracker.stdev())
+    errors.append(transmissions, tracker.error)
+    clock.append(transmissions, now)
+    return transmissions, now, events, std_devs, errors, clock
+
+
+def _simulate_runs(protocol, tracker, clocks, rng, TOL, latency, jitter, max_time, block, std_devs, errors, clock, timer):
+    '''
+    simulate() for protocols whose ticks do not change the state (activate is None): only the order of the
+    arrivals matters, which is the order of (arrival time, sequence number) of the heap loop.
+    Per block of ticks (same random numbers as the heap loop):
+        arrivals of the messages in flight and of the new ticks, sorted (stable, so ties keep the sending order)
+        the arrivals up to the last tick of the block are final (later ticks arrive later still), the rest waits
+        the final ones are split into conflict-free runs (runs.conflict_free_runs), each delivered with
+        deliver_run, which stops at the exact arrival where e(k) reaches TOL
+    x, transmissions, events and simulated time are those of the heap loop, e(k), std dev and time are recorded
+    at the end of the runs (when a recorder keeps the sample).
+    '''
+    delayed = latency > 0 or jitter > 0
+    # messages in flight after the last block, in (arrival, sequence number) order
+    late_t = np.empty(0)
+    late_i = late_j = np.empty(0, dtype=np.int64)
+    now = 0.0
+    transmissions = 0
+    ticks = 0
+    delivered = 0
+    next_record = 0
+    last = 0.0
+    converged = False
+    if timer: t = timer.start()
+    while not converged:
+        times, nodes = clocks.block(last, block)
+        partners = protocol.partners(nodes, rng)
+        delays = latency + rng.exponential(jitter, block) if jitter > 0 else np.full(block, latency)
+        last = float(times[-1])
+        # ticks after max_time are not processed, the arrivals up to the first of them still are
+        stop = int(np.searchsorted(times, max_time, side="right"))
+        horizon = times[stop] if stop < block else last
+        if timer: t = timer.lap("clock", t)
+
+        if delayed:
+            arrival = np.concatenate((late_t, times[:stop] + delays[:stop]))
+            I = np.concatenate((late_i, nodes[:stop]))
+            J = np.concatenate((late_j, partners[:stop]))
+            order = np.argsort(arrival, kind="stable")
+            ready = int(np.searchsorted(arrival[order], horizon, side="right"))
+            wait = order[ready:]
+            late_t, late_i, late_j = arrival[wait], I[wait], J[wait]
+            order = order[:ready]
+            arrival, I, J = arrival[order], I[order], J[order]
+        else:
+            arrival, I, J = times[:stop], nodes[:stop], partners[:stop]
+        bounds = conflict_free_runs(I, J)
+        if timer: t = timer.lap("select", t)
+
+        run = 0
+        start = 0
+        while start < len(I):
+            end = bounds[run + 1]
+            count = protocol.deliver_run(I[start:end], J[start:end], TOL)
+            start += count
+            if start == end:
+                run += 1
+            transmissions += count
+            now = float(arrival[start - 1])
+            if timer: t = timer.lap("deliver", t)
+            if transmissions >= next_record:
+                std_devs.append(transmissions, tracker.stdev())
+                errors.append(transmissions, tracker.error)
+                clock.append(transmissions, now)
+                next_record = min(std_devs.next_due(), errors.next_due(), clock.next_due())
+            if tracker.converged(TOL):
+                converged = True
+                break
+            if timer: t = timer.lap("record", t)
+        delivered += start
+
+        if converged:
+            # the heap loop has taken the ticks before the last arrival (all of them up to it without delay)
+            ticks += int(np.searchsorted(times[:stop], now, side="left")) if delayed else start
+        else:
+            ticks += stop
+            if stop < block:
+                now = max_time
+                break
+
+    events = ticks + delivered if delayed else ticks
+    std_devs.append(transmissions, tracker.stdev())
+    errors.append(transmissions, tracker.error)
+    clock.append(transmissions, now)
+    return transmissions, now, events, std_devs, errors, clock
+
+
+def _clock_trace(trace):
+    # (transmissions, simulated seconds) recorder with the same settings as the e(k) trace
+    trace = dict(trace or {})
+    path = trace.pop("path", None)
+    return TraceRecorder(path=None if path is None else path + "_time.trace", **trace)
+
+
+def time_axis(trace, clock):
+    '''
+    Simulated seconds of every sample of trace (std_devs or errors of an event_* run), from the clock trace
+    of the same run. Time grows with transmissions, so the samples are interpolated even if the two
+    recorders kept different samples.
+    '''
+    transmissions, values = trace.arrays()
+    clock_t, clock_s = clock.arrays()
+    return np.interp(transmissions, clock_t, clock_s), values
+
+
+def _report(name, execution_time, transmissions, now, events, average, timer):
+    print("Execution time:", execution_time, "seconds")
+    print("Transmissions: ", transmissions)
+    print("Simulated time:", now, "seconds")
+    print("Events per second:", events / execution_time if execution_time > 0 else math.inf)
+    print("Average: ", average)
+    if timer: timer.report(name)
+
+
+'''
+EVENT-DRIVEN RANDOM GOSSIP
+'''
+def event_gossip(graph, TOL, rates=1.0, latency=0.0, jitter=0.0, max_time=math.inf, seed=None, trace=None, profile=False,
+                 batched=True):
+    '''
+    1) x(k-1) = x(0), every node starts a Poisson clock with rate rates[i]
+    2) while e(k) > epsilon:
+        next event = earliest of (next clock tick, next message arrival)
+        tick of node i:
+            uniformly select a neighbor j of node i, send x_i (arrives after latency + Exp(jitter) seconds)
+        arrival of the message from i at j:
+            x_i = x_j = avg(x_i, x_j)
+            e(k) = || . ||
+    TRANSMISSIONS: per arrival = 1
+    rates: one rate for all nodes or an array with one rate per node (order of the CSR slots)
+    max_time: stop after this many simulated seconds even if e(k) > epsilon
+    batched: deliver conflict-free runs of arrivals in NumPy steps (_simulate_runs), False: one event at a time in
+             the heap loop. Both give the same x, transmissions and simulated time
+    Returns (avg, std devs, errors, transmissions, clock), clock gives the simulated time (see time_axis)
+    profile=True: time every phase of the loop and print a table of time and calls per phase
+    '''
+    print("")
+    print("------- EVENT-DRIVEN RANDOM GOSSIP ------- ")
+    start_time = time.time()
+
+    csr = as_csr(graph)
+    x = csr.values
+    true_avg = np.mean(x)
+    tracker = ErrorTracker(x, true_avg)
+    timer = PhaseTimer() if profile else None
+    transmissions, now, events, std_devs, errors, clock = simulate(
+        GossipProtocol(csr, tracker), tracker, csr.num_nodes, TOL, rates, latency, jitter, max_time, seed, trace, timer=timer,
+        batched=batched)
+
+    _report("event_gossip", time.time() - start_time, transmissions, now, events, x[0], timer)
+    return x[0], std_devs, errors, transmissions, clock
+
+'''
+EVENT-DRIVEN ASYNCH DIST AVG
+'''
+def event_dist_avg(graph, TOL, rates=1.0, latency=0.0, jitter=0.0, max_time=math.inf, seed=None, trace=None, profile=False):
+    '''
+    1) x(k-1) = x(0), every node starts a Poisson clock with rate rates[i]
+    2) while e(k) > epsilon:
+        next event = earliest of (next clock tick, next message arrival)
+        tick of node i:
+            ask all neighbors of node i for their values
+        arrival of the replies (after latency + Exp(jitter) seconds):
+            x(k) = avg(x_i U x_ni) for all nodes in N(i) U i
+            e(k) = || . ||
+    TRANSMISSIONS: per arrival = N(i)
+    Returns (avg, std devs, errors, transmissions, clock), clock gives the simulated time (see time_axis)
+    profile=True: time every phase of the loop and print a table of time and calls per phase
+    '''
+    print("")
+    print("------- EVENT-DRIVEN ASYNCH. DIST. AVG. ------- ")
+    start_time = time.time()
+
+    csr = as_csr(graph)
+    x = csr.values
+    true_avg = np.mean(x)
+    tracker = ErrorTracker(x, true_avg)
+    timer = PhaseTimer() if profile else None
+    transmissions, now, events, std_devs, errors, clock = simulate(
+        DistAvgProtocol(csr, tracker), tracker, csr.num_nodes, TOL, rates, latency, jitter, max_time, seed, trace, timer=timer)
+
+    _report("event_dist_avg", time.time() - start_time, transmissions, now, events, x[0], timer)
+    return x[0], std_devs, errors, transmissions, clock
+
+'''
+EVENT-DRIVEN PDMM ASYNCHRONOUS
+'''
+def event_pdmm(graph, TOL, c=0.4, rates=1.0, latency=0.0, jitter=0.0, max_time=math.inf, seed=None, trace=None, profile=False):
+    '''
+    1) x = 0, z_ij = y_ij = 0, every node starts a Poisson clock with rate rates[i]
+    2) while e(k) > epsilon:
+        next event = earliest of (next clock tick, next message arrival)
+        tick of node i:
+            update x_i(k) = ( a_i - sum(A_ij*z_ij(k-1)) ) / (1 + c*d_i)
+            for all neighbors of i called j,
+                update y_ij(k) = z_ij(k-1) + 2*c*x_i(k)*A_ij
+            the y_ji of all neighbors j, as they are at the tick, are sent to i
+        arrival (after latency + Exp(jitter) seconds), for all neighbors of i called j:
+            z_ij = y_ji     (the values of the tick, even if the neighbors have updated in between)
+            e(k) = ||x - true_avg||_2^2
+    TRANSMISSIONS: per arrival = 1 (UNICAST VERSION, as pdmm_async)
+    Returns (avg, std devs, errors, transmissions, clock), clock gives the simulated time (see time_axis)
+    profile=True: time every phase of the loop and print a table of time and calls per phase
+    '''
+    print("")
+    print("------- EVENT-DRIVEN PDMM Asynchronous ------- ")
+    start_time = time.time()
+
+    csr = as_csr(graph)
+    true_avg = np.mean(csr.values)
+    state = PDMMState(csr, c)
+    x = state.x
+    tracker = ErrorTracker(x, true_avg)
+    timer = PhaseTimer() if profile else None
+    transmissions, now, events, std_devs, errors, clock = simulate(
+        PDMMProtocol(state, tracker), tracker, csr.num_nodes, TOL, rates, latency, jitter, max_time, seed, trace, timer=timer)
+
+    _report("event_pdmm", time.time() - start_time, transmissions, now, events, x[0], timer)
+    return x[0], std_devs, errors, transmissions, clock
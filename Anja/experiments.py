@@ -0,0 +1,169 @@
+import copy
+import inspect
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from cache import graph_fingerprint, run_key
+from results import key_name
+from shared import GraphHandle, SharedGraph, attach_graph
+from utils import generate_rgg, generate_measurements, vector_to_dict
+
+'''
+PARALLEL EXPERIMENT RUNNER
+using experiment() to describe each run, build_networks() once, then run_experiments() to execute them on a process pool
+(optionally saving every result to a results.ResultStore and reusing unchanged runs from a cache.ExperimentCache)
+'''
+def experiment(key, algorithm, network=0, **params):
+    '''
+    key:       name under which the result is returned
+    algorithm: the function to run, called as algorithm(graph, TOL, **params)
+    network:   index into the list of networks from build_networks()
+    '''
+    return (key, algorithm, network, params)
+
+
+def build_networks(count, num_nodes, radius, dimen, seed=None):
+    # independent networks (measurements + rgg), regenerated deterministically from seed
+    np.random.seed(seed)
+    random.seed(seed)
+    networks = []
+    for _ in range(count):
+        temps = generate_measurements(num_nodes)
+        graph = generate_rgg(num_nodes, radius, dimen, vector_to_dict(temps))
+        graph.graph["radius"] = radius
+        networks.append(graph)
+    return networks
+
+
+def _init_worker():
+    # workers never open figure windows (the bulk drop/add plots inside the algorithms become no-ops)
+    plt.switch_backend("Agg")
+
+
+def _run_one(key, algorithm, graph, TOL, params, seed_seq, trace=None):
+    '''
+    Runs a single experiment on its own graph with its own seed.
+    random and np.random are seeded from the spawned SeedSequence. Algorithms that take a seed
+    argument (montecarlo.py) get the SeedSequence itself, algorithms that take a trace argument get
+    trace (a "path" in it becomes a directory with one file prefix per experiment key).
+    graph is a networkx graph / CSRGraph or the GraphHandle of a shared graph, which is attached here.
+    Returns the result and the wall time of the run.
+    '''
+    if isinstance(graph, GraphHandle):
+        graph = attach_graph(graph)
+    state = seed_seq.generate_state(2)
+    random.seed(int(state[0]))
+    np.random.seed(int(state[1]))
+    accepted = inspect.signature(algorithm).parameters
+    if "seed" in accepted and "seed" not in params:
+        params = dict(params, seed=seed_seq)
+    if trace is not None and "trace" in accepted and "trace" not in params:
+        params = dict(params, trace=_run_trace(key, trace))
+    start_time = time.time()
+    result = algorithm(graph, TOL, **params)
+    return result, time.time() - start_time
+
+
+def _needs_networkx(algorithm):
+    # the drop/add algorithms change the topology of their networkx graph, every other algorithm runs on as_csr(graph)
+    return "DROP_RATE" in inspect.signature(algorithm).parameters
+
+
+def _run_trace(key, trace):
+    # the trace settings a run gets: a "path" becomes one file prefix per experiment key
+    if trace is not None and "path" in trace:
+        return dict(trace, path=os.path.join(trace["path"], key_name(key)))
+    return trace
+
+
+def _with_defaults(algorithm, params, trace=None):
+    '''
+    params plus the defaults of every argument that was not given (c, FAILURE_RATE, ... for the store index and
+    the cache key), and the run-level trace if the algorithm takes one and params do not set it (what _run_one passes)
+    '''
+    bound = inspect.signature(algorithm).bind_partial(**params)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    if trace is not None and "trace" in arguments and "trace" not in params:
+        arguments["trace"] = trace
+    return arguments
+
+
+def run_experiments(experiments, networks, TOL, seed=None, max_workers=None, trace=None, store=None, cache=None, share=True):
+    '''
+    Runs every experiment on a ProcessPoolExecutor and returns {key: result}.
+    Every experiment gets a fresh copy of its network (pickled to the worker or shared, see share, deep-copied
+    when max_workers=1), so drop/add runs can change their graph freely, and a seed spawned from
+    np.random.SeedSequence(seed), so the results do not depend on the number of workers.
+    max_workers=1 runs everything in this process, in order (useful for debugging).
+    trace: TraceRecorder settings for every run, e.g. {"mode": "log"} (see traces.make_traces), None keeps every sample.
+    store: results.ResultStore that every result is saved to, with its parameters, seed and wall time.
+    cache: cache.ExperimentCache. Runs with the same graph, algorithm, parameters and seed as a cached
+           run are not simulated again. The seeds are spawned by position, so appending experiments to
+           the list keeps the earlier ones cached.
+    share: publish every network once in shared memory (shared.SharedGraph) instead of pickling it into every
+           task. The tasks only carry a handle, a worker attaches once per network and the graph is in memory
+           once whatever the number of workers. Drop/add algorithms still get a pickled networkx copy.
+    '''
+    print("")
+    print("------- RUNNING " + str(len(experiments)) + " EXPERIMENTS ------- ")
+    start_time = time.time()
+
+    seeds = np.random.SeedSequence(seed).spawn(len(experiments))
+    results = {}
+    if trace is not None and "path" in trace:
+        os.makedirs(trace["path"], exist_ok=True)
+    wall_times = {}
+    todo = list(zip(experiments, seeds))
+    cache_keys = {}
+    if cache is not None:
+        fingerprints = [graph_fingerprint(graph) for graph in networks]
+        for (key, algorithm, network, params), seed_seq in todo:
+            full_params = _with_defaults(algorithm, params, trace)
+            cache_keys[key] = run_key(fingerprints[network], algorithm, TOL, full_params, seed_seq)
+            hit = cache.get(cache_keys[key])
+            if hit is not None:
+                results[key], wall_times[key] = hit
+        todo = [item for item in todo if item[0][0] not in results]
+        print("Cached: " + str(len(experiments) - len(todo)) + ", to run: " + str(len(todo)))
+
+    if max_workers == 1:
+        for (key, algorithm, network, params), seed_seq in todo:
+            results[key], wall_times[key] = _run_one(key, algorithm, copy.deepcopy(networks[network]), TOL, params, seed_seq, trace)
+            if cache is not None:
+                cache.put(cache_keys[key], (results[key], wall_times[key]))
+    elif todo:
+        shared = {}
+        if share:
+            for network in sorted({network for (_, algorithm, network, _), _ in todo if not _needs_networkx(algorithm)}):
+                shared[network] = SharedGraph(networks[network])
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=_init_worker) as pool:
+                futures = {}
+                for (key, algorithm, network, params), seed_seq in todo:
+                    graph = networks[network]
+                    if network in shared and not _needs_networkx(algorithm):
+                        graph = shared[network].handle()
+                    futures[key] = pool.submit(_run_one, key, algorithm, graph, TOL, params, seed_seq, trace)
+                for key, future in futures.items():
+                    results[key], wall_times[key] = future.result()
+                    if cache is not None:
+                        cache.put(cache_keys[key], (results[key], wall_times[key]))
+        finally:
+            for graph in shared.values():
+                graph.unlink()
+
+    results = {key: results[key] for key, _, _, _ in experiments}
+    if store is not None:
+        for (key, algorithm, network, params), seed_seq in zip(experiments, seeds):
+            store.save(key, results[key], algorithm.__name__, _with_defaults(algorithm, params, _run_trace(key, trace)),
+                       networks[network], seed_seq, wall_times[key])
+
+    end_time = time.time()
+    print("Total execution time:", end_time - start_time, "seconds")
+    return results
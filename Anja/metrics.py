@@ -0,0 +1,117 @@
+import math
+import numpy as np
+
+'''
+INCREMENTAL ERROR AND STD DEV TRACKING
+using ErrorTracker(x, true_avg), then update()/update_many() after every change to x and remove()/append() when a node leaves/joins
+'''
+class ErrorTracker:
+    '''
+    Keeps e(k) = ||x - true_avg||^2 and the sample std dev of x up to date from the changed entries only.
+
+    Running sums (shifted by true_avg so they stay small near convergence):
+        s1 = sum(x_i - true_avg)
+        s2 = sum((x_i - true_avg)^2)  = e(k)
+    std dev follows from the same sums: var = (s2 - s1^2/n) / (n-1)
+
+    x is referenced, not copied. Change x in place first, then report the old and new values.
+
+    Floating point drift: every update adds a rounding error relative to the size of s2 at the last
+    exact recomputation. The sums are recomputed exactly from x
+        * every refresh_every updates (default n, so O(1) amortized)
+        * whenever s2 has dropped below drift_ratio times its value at the last recomputation
+        * before converged() reports True, so the stopping criterion is always checked on the exact value
+    '''
+    def __init__(self, x, true_avg, refresh_every=None, drift_ratio=1e-3):
+        self.refresh_every = refresh_every
+        self.drift_ratio = drift_ratio
+        self.reset(x, true_avg)
+
+    def reset(self, x, true_avg):
+        # new x array or new true average, e.g. after nodes have been dropped or added
+        self.x = x
+        self.true_avg = true_avg
+        self.n = len(x)
+        self.every = self.refresh_every if self.refresh_every is not None else max(self.n, 1)
+        self.refresh()
+
+    def refresh(self):
+        dev = self.x - self.true_avg
+        self.s1 = float(np.sum(dev))
+        self.s2 = float(np.dot(dev, dev))
+        self.s2_ref = self.s2
+        self.since_refresh = 0
+
+    def update(self, old, new):
+        # a single entry went from old to new
+        d_old = old - self.true_avg
+        d_new = new - self.true_avg
+        self.s1 += d_new - d_old
+        self.s2 += d_new * d_new - d_old * d_old
+        self._count()
+
+    def update_many(self, old, new):
+        # old: array of previous values, new: array (or one value for all of them) of the new values
+        d_old = np.asarray(old) - self.true_avg
+        d_new = np.broadcast_to(np.asarray(new, dtype=np.float64) - self.true_avg, d_old.shape)
+        self.s1 += float(np.sum(d_new) - np.sum(d_old))
+        self.s2 += float(np.dot(d_new, d_new) - np.dot(d_old, d_old))
+        self._count()
+
+    def add(self, d_s1, d_s2):
+        # change of the running sums worked out by the caller (e.g. a batch of pairwise averages)
+        self.s1 += d_s1
+        self.s2 += d_s2
+        self._count()
+
+    def remove(self, value, x, true_avg):
+        '''
+        An entry with current value value has left, x is the array without it and true_avg the new average.
+        Its term is dropped from the sums and the sums are shifted to the new average in O(1):
+            s1' = s1 - n*delta,  s2' = s2 - 2*delta*s1 + n*delta^2     (delta = new - old true_avg)
+        '''
+        d = value - self.true_avg
+        self.s1 -= d
+        self.s2 -= d * d
+        self.n -= 1
+        self._shift(x, true_avg)
+
+    def append(self, value, x, true_avg):
+        # an entry with value value has joined (x is the array with it), same O(1) shift as remove()
+        d = value - self.true_avg
+        self.s1 += d
+        self.s2 += d * d
+        self.n += 1
+        self._shift(x, true_avg)
+
+    def _shift(self, x, true_avg):
+        delta = true_avg - self.true_avg
+        self.s2 += self.n * delta * delta - 2 * delta * self.s1
+        self.s1 -= self.n * delta
+        self.x = x
+        self.true_avg = true_avg
+        self._count()
+
+    def _count(self):
+        self.since_refresh += 1
+        if self.since_refresh >= self.every or self.s2 < self.drift_ratio * self.s2_ref:
+            self.refresh()
+
+    @property
+    def error(self):
+        # e(k) = ||x - true_avg||^2
+        return max(self.s2, 0.0)
+
+    def stdev(self, ddof=1):
+        # ddof=1: sample std dev (same as statistics.stdev), ddof=0: same as np.std
+        if self.n <= ddof:
+            return 0.0
+        var = (self.s2 - self.s1 * self.s1 / self.n) / (self.n - ddof)
+        return math.sqrt(max(var, 0.0))
+
+    def converged(self, TOL):
+        if self.s2 > TOL:
+            return False
+        # confirm on the exact value before stopping
+        self.refresh()
+        return self.s2 <= TOL
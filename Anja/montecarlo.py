@@ -0,0 +1,224 @@
+import numpy as np
+import time
+
+from csrgraph import as_csr
+from pdmmcore import PDMMState
+
+'''
+BATCHED MONTE-CARLO TRIALS
+R independent runs of the same algorithm on the same graph, advanced together as the rows of an R x n matrix.
+Every trial draws its own nodes/neighbors (and failures) and stops on its own when e(k) <= TOL.
+using random_gossip_batch(), dist_avg_asynch_batch(), pdmm_async_batch()
+'''
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class _BatchErrors:
+    '''
+    Per-trial e(k) = ||x_r - true_avg||^2 kept as running sums (the batched version of metrics.ErrorTracker).
+    Rows are recomputed exactly every n steps, after a 1e3 drop since their last recomputation
+    and before they are allowed to stop.
+    '''
+    def __init__(self, X, true_avg, every):
+        self.X = X
+        self.true_avg = true_avg
+        self.every = every
+        self.err = np.sum((X - true_avg)**2, axis=1)
+        self.err_ref = self.err.copy()
+        self.steps = 0
+
+    def refresh(self, rows):
+        self.err[rows] = np.sum((self.X[rows] - self.true_avg)**2, axis=1)
+        self.err_ref[rows] = self.err[rows]
+
+    def step(self, rows, delta, TOL):
+        # add the per-trial change of e(k), returns the rows that have converged
+        self.err[rows] += delta
+        self.steps += 1
+        if self.steps % self.every == 0:
+            self.refresh(rows)
+        else:
+            drifted = rows[(self.err[rows] < 1e-3 * self.err_ref[rows]) | (self.err[rows] <= TOL)]
+            if len(drifted) > 0:
+                self.refresh(drifted)
+        return rows[self.err[rows] <= TOL]
+
+
+def _run_batch(csr, TOL, R, step, X, record_every, max_steps, name):
+    '''
+    Shared driver: calls step(rows) for the still running trials until all have converged.
+    step returns (delta e(k), transmissions added) per active row.
+    '''
+    print("")
+    print("------- " + name + " (" + str(R) + " trials) ------- ")
+    start_time = time.time()
+
+    n = csr.num_nodes
+    true_avg = np.mean(csr.values)
+    errors = _BatchErrors(X, true_avg, max(n, 1))
+    transmissions = np.zeros(R, dtype=np.int64)
+    active = np.arange(R)
+
+    trans_hist = [transmissions.copy()]
+    err_hist = [errors.err.copy()]
+    steps = 0
+    while len(active) > 0 and steps < max_steps:
+        delta, sent = step(active)
+        transmissions[active] += sent
+        done = errors.step(active, delta, TOL)
+        if len(done) > 0:
+            active = np.setdiff1d(active, done, assume_unique=True)
+        steps += 1
+        if steps % record_every == 0 or len(active) == 0:
+            trans_hist.append(transmissions.copy())
+            err_hist.append(errors.err.copy())
+
+    if len(active) > 0:
+        print("\033[91mERROR: " + str(len(active)) + " trials did not reach TOL within max_steps.\033[0m")
+
+    grid, envelope = error_envelope(np.array(trans_hist), np.array(err_hist))
+
+    end_time = time.time()
+    print("Execution time:", end_time - start_time, "seconds")
+    print("Transmissions (median over trials): ", np.median(transmissions))
+    return X[:, 0].copy(), envelope, grid, transmissions
+
+
+def error_envelope(trans_hist, err_hist, quantiles=QUANTILES, num_points=500):
+    '''
+    Quantiles of e(k) over the trials on a common transmissions grid.
+    trans_hist, err_hist: (checkpoints x R). A finished trial keeps its last error.
+    Returns grid (num_points,) and envelope (len(quantiles) x num_points).
+    '''
+    grid = np.linspace(0, trans_hist[-1].max(), num_points)
+    curves = np.array([np.interp(grid, trans_hist[:, r], err_hist[:, r]) for r in range(trans_hist.shape[1])])
+    return grid, np.quantile(curves, quantiles, axis=0)
+
+
+def _neighbor_table(csr, include_self):
+    '''
+    n x D table of neighbors padded with the node itself (D = max degree, +1 if include_self puts i first),
+    plus the matching validity mask. Lets a whole batch gather neighborhoods of different sizes at once.
+    '''
+    n = csr.num_nodes
+    offset = 1 if include_self else 0
+    width = int(csr.degree.max()) + offset
+    table = np.repeat(np.arange(n)[:, None], width, axis=1)
+    mask = np.zeros((n, width), dtype=bool)
+    if include_self:
+        mask[:, 0] = True
+    rows = np.repeat(np.arange(n), csr.degree)
+    cols = np.arange(len(csr.indices)) - np.repeat(csr.indptr[:-1], csr.degree) + offset
+    table[rows, cols] = csr.indices
+    mask[rows, cols] = True
+    return table, mask
+
+
+'''
+BATCHED RANDOM GOSSIP
+'''
+def random_gossip_batch(graph, TOL, R=100, FAILURE_RATE=0.0, seed=None, record_every=None, max_steps=10**8):
+    '''
+    R trials of random_gossip_TF (random_gossip_noW for FAILURE_RATE=0) in lockstep.
+    Per step and per running trial r: draw node i_r and neighbor j_r, x_r[i_r] = x_r[j_r] = avg.
+    TRANSMISSIONS: 1 per step, also for failed steps
+    Returns the final x_0 per trial, the quantile envelope of e(k), its transmissions grid and the
+    transmissions per trial
+    '''
+    rng = np.random.default_rng(seed)
+    csr = as_csr(graph)
+    n = csr.num_nodes
+    true_avg = np.mean(csr.values)
+    X = np.tile(csr.values, (R, 1))
+
+    def step(rows):
+        delta = np.zeros(len(rows))
+        ok = rng.random(len(rows)) >= FAILURE_RATE if FAILURE_RATE > 0 else np.ones(len(rows), dtype=bool)
+        r = rows[ok]
+        i = rng.integers(0, n, len(r))
+        j = csr.indices[csr.indptr[i] + (rng.random(len(r)) * csr.degree[i]).astype(np.int64)]
+        xi = X[r, i]
+        xj = X[r, j]
+        avg = (xi + xj) / 2
+        X[r, i] = avg
+        X[r, j] = avg
+        delta[ok] = 2 * (avg - true_avg)**2 - (xi - true_avg)**2 - (xj - true_avg)**2
+        return delta, 1
+
+    return _run_batch(csr, TOL, R, step, X, record_every or n, max_steps, "RANDOM GOSSIP BATCH")
+
+
+'''
+BATCHED ASYNCH DIST AVG
+'''
+def dist_avg_asynch_batch(graph, TOL, R=100, seed=None, record_every=None, max_steps=10**8):
+    '''
+    R trials of dist_avg_asynch_noW in lockstep.
+    Per step and per running trial r: draw node i_r, set x_r on N(i_r) U i_r to its average.
+    TRANSMISSIONS: deg(i_r) per step
+    '''
+    rng = np.random.default_rng(seed)
+    csr = as_csr(graph)
+    n = csr.num_nodes
+    true_avg = np.mean(csr.values)
+    X = np.tile(csr.values, (R, 1))
+    table, mask = _neighbor_table(csr, include_self=True)
+
+    def step(rows):
+        i = rng.integers(0, n, len(rows))
+        nodes = table[i]
+        valid = mask[i]
+        values = X[rows[:, None], nodes]
+        avg = np.sum(values * valid, axis=1) / (csr.degree[i] + 1)
+        # padded entries point to i itself, which is set to avg as well
+        X[rows[:, None], nodes] = avg[:, None]
+        delta = np.sum(((avg[:, None] - true_avg)**2 - (values - true_avg)**2) * valid, axis=1)
+        return delta, csr.degree[i]
+
+    return _run_batch(csr, TOL, R, step, X, record_every or n, max_steps, "ASYNCH. DIST. AVG. BATCH")
+
+
+'''
+BATCHED PDMM ASYNCHRONOUS
+'''
+def pdmm_async_batch(graph, TOL, c=0.4, R=100, FAILURE_RATE=0.0, seed=None, record_every=None, max_steps=10**8):
+    '''
+    R trials of pdmm_async_tf (pdmm_async for FAILURE_RATE=0) in lockstep, z and y as R x (2m+1) matrices.
+    The extra column is a dummy edge with A_ij = 0 used to pad nodes with fewer than max degree edges.
+    TRANSMISSIONS: 1 per step, also for failed steps
+    '''
+    rng = np.random.default_rng(seed)
+    csr = as_csr(graph)
+    state = PDMMState(csr, c)
+    n = csr.num_nodes
+    num_edges = len(csr.indices)
+    true_avg = np.mean(csr.values)
+
+    X = np.zeros((R, n))
+    Z = np.zeros((R, num_edges + 1))
+    Y = np.zeros((R, num_edges + 1))
+    sign = np.append(state.sign.astype(np.float64), 0.0)
+    rev = np.append(state.rev, num_edges)
+
+    # n x max degree table of edge ids, padded with the dummy edge
+    width = int(csr.degree.max())
+    edges = np.full((n, width), num_edges)
+    edges[state.src, np.arange(num_edges) - np.repeat(csr.indptr[:-1], csr.degree)] = np.arange(num_edges)
+
+    def step(rows):
+        delta = np.zeros(len(rows))
+        ok = rng.random(len(rows)) >= FAILURE_RATE if FAILURE_RATE > 0 else np.ones(len(rows), dtype=bool)
+        r = rows[ok]
+        i = rng.integers(0, n, len(r))
+        e = edges[i]
+        s = sign[e]
+        z = Z[r[:, None], e]
+        x_old = X[r, i]
+        x_new = (csr.values[i] - np.sum(s * z, axis=1)) / state.denom[i]
+        X[r, i] = x_new
+        Y[r[:, None], e] = z + 2 * c * x_new[:, None] * s
+        Z[r[:, None], e] = Y[r[:, None], rev[e]]
+        delta[ok] = (x_new - true_avg)**2 - (x_old - true_avg)**2
+        return delta, 1
+
+    return _run_batch(csr, TOL, R, step, X, record_every or n, max_steps, "PDMM ASYNCH BATCH")
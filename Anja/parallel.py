@@ -0,0 +1,483 @@
+import math
+import multiprocessing
+import numpy as np
+import os
+import queue
+import time
+
+from csrgraph import as_csr
+from distavg import laplacian_extreme_eigs
+from eventsim import _clock_trace
+from shared import SharedArrays
+from traces import make_traces
+
+'''
+GRAPH-PARTITIONED PARALLEL SIMULATION
+using parallel_dist_avg_synch() / parallel_pdmm_synch() / parallel_pdmm_async() in place of dist_avg_synch(sparse=True),
+pdmm_synch and pdmm_async for networks too large for one process: the nodes are renumbered along a space-filling
+curve over pos and split into one contiguous range per worker process. Node and edge state live in shared memory
+(shared.SharedArrays), every worker only writes its own range and only reads the values of other ranges on the
+edges that cross the partition boundary. A barrier per round keeps the workers in step.
+'''
+def spatial_order(pos, bits=None):
+    '''
+    Order of the nodes along a Z-order (Morton) curve: the coordinates are scaled to integers of `bits` bits per
+    dimension and their bits are interleaved. Nodes close on the curve are close in space, so every contiguous
+    range of the order is a compact region with a short boundary.
+    '''
+    n, dim = pos.shape
+    bits = bits or min(16, 63 // dim)
+    low = pos.min(axis=0)
+    span = float(np.max(pos.max(axis=0) - low)) or 1.0
+    q = ((pos - low) / span * ((1 << bits) - 1)).astype(np.uint64)
+    code = np.zeros(n, dtype=np.uint64)
+    for b in range(bits):
+        for d in range(dim):
+            code |= ((q[:, d] >> np.uint64(b)) & np.uint64(1)) << np.uint64(b * dim + d)
+    return np.argsort(code, kind="stable")
+
+
+def partition(csr, workers, reverse=False):
+    '''
+    Renumber the nodes along spatial_order(pos) (slot order if the graph has no positions) and split them into
+    `workers` contiguous ranges with about the same number of nodes + edges each.
+    Returns a dict with
+        order       new slot k is old slot order[k]
+        indptr      int64, indices int32: CSR arrays in the new numbering, every row sorted by neighbor
+        values      measurements in the new order
+        bounds      worker w owns the slots bounds[w]:bounds[w+1] and the edges indptr[bounds[w]]:indptr[bounds[w+1]]
+        cut         number of directed edges between two different workers
+        rev         (reverse=True) int64, rev[e] is the position of the edge (j, i) for e = (i, j)
+    '''
+    n = csr.num_nodes
+    order = spatial_order(csr.pos) if csr.pos is not None else np.arange(n)
+    new = np.empty(n, dtype=np.int64)
+    new[order] = np.arange(n)
+    degree = csr.degree[order].astype(np.int64)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(degree, out=indptr[1:])
+
+    # old edge positions in the new row order, then every row sorted by neighbor: the rows are already in order,
+    # so a stable sort of row*n + neighbor only reorders inside the rows
+    take = np.repeat(csr.indptr[:-1].astype(np.int64)[order] - indptr[:-1], degree) + np.arange(indptr[-1])
+    cols = new[csr.indices[take]]
+    del take
+    rows = np.repeat(np.arange(n, dtype=np.int64), degree)
+    keys = rows * n + cols
+    perm = np.argsort(keys, kind="stable")
+    keys = keys[perm]
+    cols = cols[perm]
+    del perm
+
+    work = indptr + np.arange(n + 1)
+    bounds = np.searchsorted(work, np.linspace(0, work[-1], workers + 1)).astype(np.int64)
+    bounds[0], bounds[-1] = 0, n
+    owner = np.repeat(np.arange(workers), np.diff(bounds))
+    result = {
+        "order": order,
+        "indptr": indptr,
+        "indices": cols.astype(np.int32),
+        "values": csr.values[order],
+        "bounds": bounds,
+        "cut": int(np.count_nonzero(owner[rows] != owner[cols])),
+    }
+    if reverse:
+        # z_ij = y_ji: (j, i) is found in the sorted keys
+        result["rev"] = np.searchsorted(keys, cols * n + rows)
+    return result
+
+
+def _row_sums(values, starts, nonempty):
+    # sum of values[starts[k]:starts[k+1]] for every row k, 0 for rows without edges
+    if nonempty is None:
+        return np.add.reduceat(values, starts) if len(values) else np.zeros(len(starts))
+    sums = np.zeros(len(starts))
+    sums[nonempty] = np.add.reduceat(values, starts[nonempty])
+    return sums
+
+
+def _local_rows(indptr, lo, hi):
+    # row starts relative to the first edge of the range, and the mask of rows with edges (None if all have edges)
+    degree = np.diff(indptr[lo:hi + 1])
+    starts = indptr[lo:hi] - indptr[lo]
+    nonempty = degree > 0
+    return degree, starts, (None if nonempty.all() else nonempty)
+
+
+def _combine(partial, n, ddof):
+    # e(k) and std dev from the per-worker sums S = sum((x - avg)^2) and M = sum(x - avg)
+    S, M = partial[:, 0].sum(), partial[:, 1].sum()
+    return S, math.sqrt(max(S - M * M / n, 0.0) / (n - ddof))
+
+
+def _dist_avg_worker(w, handle, bounds, alpha, TOL, barrier, results):
+    '''
+    Rows lo..hi of x(k) = x(k-1) - alpha*L*x(k-1) = (1 - alpha*d_i)*x_i + alpha*sum(x_j), x double buffered:
+    round k reads x[k % 2] and writes x[(k + 1) % 2], so one barrier per round is enough.
+    '''
+    shared = SharedArrays.attach(handle)
+    indptr, indices, x, partial = shared["indptr"], shared["indices"], shared["x"], shared["partial"]
+    n = x.shape[1]
+    lo, hi = bounds[w], bounds[w + 1]
+    degree, starts, nonempty = _local_rows(indptr, lo, hi)
+    neighbors = indices[indptr[lo]:indptr[hi]]
+    keep = 1 - alpha * degree
+    true_avg = shared["avg"][0]
+
+    std_devs, errors = [], []
+    k = 0
+    while True:
+        current, following = x[k % 2], x[(k + 1) % 2]
+        x_own = keep * current[lo:hi] + alpha * _row_sums(current[neighbors], starts, nonempty)
+        following[lo:hi] = x_own
+        diff = x_own - true_avg
+        partial[k % 2, w] = (np.dot(diff, diff), diff.sum())
+        barrier.wait()
+        error, std_dev = _combine(partial[k % 2], n, 0)
+        std_devs.append(std_dev)
+        errors.append(error)
+        k += 1
+        if error <= TOL:
+            break
+    if w == 0:
+        results.put((k, std_devs, errors))
+    shared.close()
+
+
+def _pdmm_worker(w, handle, bounds, c, TOL, barrier, results):
+    '''
+    Rows lo..hi of synchronous PDMM (PDMMState.synch_round):
+        x_i(k) = ( a_i - sum(A_ij*z_ij(k-1)) ) / (1 + c*d_i)
+        y_ij(k) = z_ij(k-1) + 2*c*x_i(k)*A_ij       written to y[k % 2]
+        -- barrier --
+        z_ij(k) = y_ji(k)                           read from y[k % 2], other workers' y only on boundary edges
+    '''
+    shared = SharedArrays.attach(handle)
+    indptr, sign, rev, a = shared["indptr"], shared["sign"], shared["rev"], shared["a"]
+    x, z, y, partial = shared["x"], shared["z"], shared["y"], shared["partial"]
+    n = len(x)
+    lo, hi = bounds[w], bounds[w + 1]
+    e_lo, e_hi = indptr[lo], indptr[hi]
+    degree, starts, nonempty = _local_rows(indptr, lo, hi)
+    src = np.repeat(np.arange(hi - lo), degree)
+    sign_own = sign[e_lo:e_hi].astype(np.float64)
+    rev_own = rev[e_lo:e_hi]
+    denom = 1 + c * degree
+    a_own = a[lo:hi]
+    z_own = z[e_lo:e_hi]
+    true_avg = shared["avg"][0]
+
+    std_devs, errors = [], []
+    k = 0
+    while True:
+        x_own = (a_own - _row_sums(sign_own * z_own, starts, nonempty)) / denom
+        x[lo:hi] = x_own
+        y_k = y[k % 2]
+        y_k[e_lo:e_hi] = z_own + (2 * c) * sign_own * x_own[src]
+        diff = x_own - true_avg
+        partial[k % 2, w] = (np.dot(diff, diff), diff.sum())
+        barrier.wait()
+        z_own[:] = y_k[rev_own]
+        error, std_dev = _combine(partial[k % 2], n, 1)
+        std_devs.append(std_dev)
+        errors.append(error)
+        k += 1
+        if error <= TOL:
+            break
+    if w == 0:
+        results.put((k, std_devs, errors))
+    shared.close()
+
+
+def _pdmm_async_worker(w, handle, bounds, c, TOL, rates, latency, jitter, max_time, seeds, inboxes, barrier, results):
+    '''
+    Asynchronous PDMM (PDMMActor semantics: y_ij travels in the message, z_ji = y_ij when it arrives) with
+    conservative synchronization: time advances in windows of `latency` seconds. A message sent in a window
+    arrives at least latency seconds later, so in a later window: within a window every tick only depends on
+    the z values at the window start and the messages that arrive in the window, which are all known.
+    Per window:
+        ticks       Poisson clocks of the own nodes (superposition, like eventsim.PoissonClocks)
+        z at tick   the last message to that edge that arrived before the tick, else z at the window start
+        update      x_i and y_ij of every tick at once, y_ij is sent to j (arrives after latency + jitter)
+        exchange    messages to nodes of other workers go to their inbox, every worker waits for the
+                    messages of its neighbor workers before the window is closed (barrier)
+    '''
+    shared = SharedArrays.attach(handle)
+    indptr, indices, sign, rev, a = shared["indptr"], shared["indices"], shared["sign"], shared["rev"], shared["a"]
+    x, z, partial = shared["x"], shared["z"], shared["partial"]
+    n = len(x)
+    lo, hi = bounds[w], bounds[w + 1]
+    e_lo, e_hi = indptr[lo], indptr[hi]
+    degree = np.diff(indptr[lo:hi + 1])
+    denom = 1 + c * degree
+    true_avg = shared["avg"][0]
+    rng = np.random.default_rng(seeds[w])
+    own_rates = rates[lo:hi]
+    total_rate = float(own_rates.sum())
+    cumulative = np.cumsum(own_rates) / total_rate
+    uniform = bool(np.all(own_rates == own_rates[0]))
+
+    # worker of the receiving node of every own edge, and the workers this one exchanges messages with
+    owner = np.searchsorted(bounds, indices[e_lo:e_hi], side="right") - 1
+    neighbors = [v for v in np.unique(owner).tolist() if v != w]
+
+    pending_t, pending_r, pending_v = np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0)
+    std_devs, errors, counts, clock = [], [], [], []
+    activations = 0
+    k = 0
+    now = 0.0
+    while True:
+        end = (k + 1) * latency
+        due = pending_t < end
+        d_t, d_r, d_v = pending_t[due], pending_r[due], pending_v[due]
+        pending_t, pending_r, pending_v = pending_t[~due], pending_r[~due], pending_v[~due]
+
+        size = rng.poisson(total_rate * latency)
+        times = np.sort(now + rng.random(size) * latency)
+        if uniform:
+            nodes = rng.integers(0, hi - lo, size)
+        else:
+            nodes = np.minimum(np.searchsorted(cumulative, rng.random(size), side="right"), hi - lo - 1)
+
+        # every (tick, edge) pair of the window
+        tick_degree = degree[nodes]
+        tick = np.repeat(np.arange(size), tick_degree)
+        first = np.cumsum(tick_degree) - tick_degree
+        edge = np.repeat(indptr[lo + nodes] - first, tick_degree) + np.arange(len(tick))
+        z_seen = z[edge]
+        if len(d_t):
+            # rank all times of the window, the last message to edge e before a tick is then a binary search on
+            # (edge, rank) keys
+            rank = np.empty(len(d_t) + size, dtype=np.int64)
+            rank[np.argsort(np.concatenate((d_t, times)), kind="stable")] = np.arange(len(rank))
+            span = len(rank)
+            d_key = d_r * span + rank[:len(d_t)]
+            by_key = np.argsort(d_key)
+            d_key, d_r, d_v = d_key[by_key], d_r[by_key], d_v[by_key]
+            found = np.searchsorted(d_key, edge * span + rank[len(d_t):][tick]) - 1
+            hit = (found >= 0) & (d_r[np.maximum(found, 0)] == edge)
+            z_seen = np.where(hit, d_v[np.maximum(found, 0)], z_seen)
+            # z at the window end: the last message to every edge
+            last = np.append(d_r[1:] != d_r[:-1], True)
+            z[d_r[last]] = d_v[last]
+
+        sign_seen = sign[edge]
+        x_tick = (a[lo + nodes] - _row_sums(sign_seen * z_seen, first, tick_degree > 0)) / denom[nodes]
+        y_out = z_seen + (2 * c) * sign_seen * x_tick[tick]
+        # ticks are in time order, so the last tick of a node sets its x
+        latest = np.unique(nodes[::-1], return_index=True)
+        x[lo + latest[0]] = x_tick[size - 1 - latest[1]]
+
+        arrival = times[tick] + latency
+        if jitter > 0:
+            arrival = arrival + rng.exponential(jitter, len(arrival))
+        target = rev[edge]
+        dest = owner[edge - e_lo]
+        for v in neighbors:
+            mine = dest == v
+            inboxes[v].put((arrival[mine], target[mine], y_out[mine]))
+        mine = dest == w
+        pending_t = np.concatenate((pending_t, arrival[mine]))
+        pending_r = np.concatenate((pending_r, target[mine]))
+        pending_v = np.concatenate((pending_v, y_out[mine]))
+        for _ in neighbors:
+            t, r, v = inboxes[w].get()
+            pending_t = np.concatenate((pending_t, t))
+            pending_r = np.concatenate((pending_r, r))
+            pending_v = np.concatenate((pending_v, v))
+
+        activations += size
+        diff = x[lo:hi] - true_avg
+        partial[k % 2, w] = (np.dot(diff, diff), diff.sum(), activations)
+        barrier.wait()
+        error, std_dev = _combine(partial[k % 2], n, 1)
+        now = end
+        std_devs.append(std_dev)
+        errors.append(error)
+        counts.append(int(partial[k % 2, :, 2].sum()))
+        clock.append(now)
+        k += 1
+        if error <= TOL or now >= max_time:
+            break
+    if w == 0:
+        results.put((k, std_devs, errors, counts, clock))
+    shared.close()
+
+
+def _run(target, layout, fill, workers, args):
+    '''
+    Creates the shared arrays, fills them (fill(shared)), runs target(w, handle, *args, barrier, results) in
+    every worker and returns what worker 0 puts in results and a copy of the final x. A failing worker breaks the barrier so the
+    others do not wait forever.
+    '''
+    shared = SharedArrays.create(layout)
+    try:
+        fill(shared)
+        barrier = multiprocessing.Barrier(workers)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=target, args=(w, shared.handle()) + args + (barrier, results), daemon=True)
+                     for w in range(workers)]
+        for process in processes:
+            process.start()
+        result = None
+        while result is None:
+            try:
+                result = results.get(timeout=0.5)
+            except queue.Empty:
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    barrier.abort()
+                    for process in processes:
+                        process.terminate()
+                    raise RuntimeError("parallel worker failed")
+        for process in processes:
+            process.join()
+        return result, np.array(shared["x"])
+    finally:
+        shared.unlink()
+
+
+def _report(start_time, transmissions, x, parts, workers):
+    print("Execution time:", time.time() - start_time, "seconds")
+    print("Transmissions: ", transmissions)
+    print("Workers:", workers, "/ boundary edges:", parts["cut"] // 2, "of", len(parts["indices"]) // 2)
+    print("Average: ", x[0])
+
+
+def _original_order(x_new, order):
+    x = np.empty_like(x_new)
+    x[order] = x_new
+    return x
+
+'''
+PARALLEL SYNCH DIST AVG
+'''
+def parallel_dist_avg_synch(graph, TOL, workers=None, alpha=None, trace=None):
+    '''
+    dist_avg_synch(sparse=True) on `workers` processes (os.cpu_count() by default), see _dist_avg_worker.
+    alpha: step size, alpha_opt = 2 / (eig1 + eigN-1) from laplacian_extreme_eigs if None
+    Same transmissions and (up to rounding) the same e(k) per round as dist_avg_synch.
+    '''
+    print("")
+    print("------- PARALLEL SYNCH. DIST. AVG. ------- ")
+    start_time = time.time()
+    workers = workers or os.cpu_count()
+    csr = as_csr(graph)
+    n = csr.num_nodes
+    if alpha is None:
+        eig_max, eig_fiedler = laplacian_extreme_eigs(csr.laplacian())
+        alpha = 2 / (eig_max + eig_fiedler)
+    parts = partition(csr, workers)
+    true_avg = np.mean(csr.values)
+
+    layout = [("indptr", np.int64, (n + 1,)), ("indices", np.int32, parts["indices"].shape),
+              ("x", np.float64, (2, n)), ("avg", np.float64, (1,)), ("partial", np.float64, (2, workers, 2))]
+    def fill(shared):
+        shared["indptr"][:] = parts["indptr"]
+        shared["indices"][:] = parts["indices"]
+        shared["x"][0] = parts["values"]
+        shared["avg"][0] = true_avg
+    (rounds, stds, errs), x = _run(_dist_avg_worker, layout, fill, workers, (parts["bounds"], alpha, TOL))
+
+    # same bookkeeping as dist_avg_synch: round k is recorded at k*num_edges transmissions
+    std_devs, errors = make_traces(trace)
+    for k in range(rounds):
+        std_devs.append(k * csr.num_edges, stds[k])
+        errors.append(k * csr.num_edges, errs[k])
+    transmissions = rounds * csr.num_edges
+    x = _original_order(x[rounds % 2], parts["order"])
+    _report(start_time, transmissions, x, parts, workers)
+    return x[0], std_devs, errors, transmissions
+
+'''
+PARALLEL PDMM SYNCHRONOUS
+'''
+def parallel_pdmm_synch(graph, TOL, c=0.3, workers=None, trace=None):
+    '''
+    pdmm_synch on `workers` processes (os.cpu_count() by default), see _pdmm_worker.
+    Same transmissions and (up to rounding) the same e(k) per round as pdmm_synch: A_ij follows the new
+    numbering, which only flips the sign of z and y on some edges, x(k) does not depend on it.
+    '''
+    print("")
+    print("------- PARALLEL PDMM Synchronous ------- ")
+    start_time = time.time()
+    workers = workers or os.cpu_count()
+    csr = as_csr(graph)
+    n = csr.num_nodes
+    parts = partition(csr, workers, reverse=True)
+    m2 = len(parts["indices"])
+    true_avg = np.mean(csr.values)
+
+    layout = [("indptr", np.int64, (n + 1,)), ("sign", np.int8, (m2,)), ("rev", np.int64, (m2,)),
+              ("a", np.float64, (n,)), ("x", np.float64, (n,)), ("z", np.float64, (m2,)), ("y", np.float64, (2, m2)),
+              ("avg", np.float64, (1,)), ("partial", np.float64, (2, workers, 2))]
+    def fill(shared):
+        shared["indptr"][:] = parts["indptr"]
+        src = np.repeat(np.arange(n), np.diff(parts["indptr"]))
+        shared["sign"][:] = np.where(src < parts["indices"], 1, -1)
+        shared["rev"][:] = parts["rev"]
+        shared["a"][:] = parts["values"]
+        shared["avg"][0] = true_avg
+    (rounds, stds, errs), x = _run(_pdmm_worker, layout, fill, workers, (parts["bounds"], c, TOL))
+
+    std_devs, errors = make_traces(trace)
+    for k in range(rounds):
+        std_devs.append((k + 1) * n, stds[k])
+        errors.append((k + 1) * n, errs[k])
+    transmissions = rounds * n
+    x = _original_order(x, parts["order"])
+    _report(start_time, transmissions, x, parts, workers)
+    return x[0], std_devs, errors, transmissions
+
+'''
+PARALLEL PDMM ASYNCHRONOUS
+'''
+def parallel_pdmm_async(graph, TOL, c=0.4, workers=None, rates=1.0, latency=0.01, jitter=0.0, max_time=math.inf,
+                        seed=None, trace=None):
+    '''
+    Asynchronous PDMM on `workers` processes with Poisson node clocks (rates, ticks per second) and messages that
+    arrive after latency + exponential jitter seconds, see _pdmm_async_worker. latency > 0 is the lookahead of
+    the conservative synchronization (one barrier per latency seconds of simulated time).
+    e(k) is recorded at the window ends. Returns (avg, std devs, errors, transmissions, clock) like event_pdmm.
+    '''
+    print("")
+    print("------- PARALLEL PDMM Asynchronous ------- ")
+    if latency <= 0:
+        raise ValueError("parallel_pdmm_async needs latency > 0 (the synchronization window)")
+    start_time = time.time()
+    workers = workers or os.cpu_count()
+    csr = as_csr(graph)
+    n = csr.num_nodes
+    parts = partition(csr, workers, reverse=True)
+    m2 = len(parts["indices"])
+    true_avg = np.mean(csr.values)
+    rates = np.broadcast_to(np.asarray(rates, dtype=np.float64), (n,))[parts["order"]]
+    seeds = np.random.default_rng(seed).integers(2**63, size=workers)
+
+    layout = [("indptr", np.int64, (n + 1,)), ("indices", np.int32, (m2,)), ("sign", np.int8, (m2,)),
+              ("rev", np.int64, (m2,)), ("a", np.float64, (n,)), ("x", np.float64, (n,)), ("z", np.float64, (m2,)),
+              ("avg", np.float64, (1,)), ("partial", np.float64, (2, workers, 3))]
+    def fill(shared):
+        shared["indptr"][:] = parts["indptr"]
+        shared["indices"][:] = parts["indices"]
+        src = np.repeat(np.arange(n), np.diff(parts["indptr"]))
+        shared["sign"][:] = np.where(src < parts["indices"], 1, -1)
+        shared["rev"][:] = parts["rev"]
+        shared["a"][:] = parts["values"]
+        shared["avg"][0] = true_avg
+    inboxes = [multiprocessing.Queue() for _ in range(workers)]
+    (windows, stds, errs, counts, times), x = _run(_pdmm_async_worker, layout, fill, workers,
+                                                   (parts["bounds"], c, TOL, rates, latency, jitter, max_time, seeds, inboxes))
+
+    std_devs, errors = make_traces(trace)
+    clock = _clock_trace(trace)
+    for k in range(windows):
+        std_devs.append(counts[k], stds[k])
+        errors.append(counts[k], errs[k])
+        clock.append(counts[k], times[k])
+    transmissions = counts[-1]
+    if errs[-1] > TOL:
+        print("\033[91mERROR: e(k) did not reach " + str(TOL) + " within " + str(max_time) + " seconds.\033[0m")
+    x = _original_order(x, parts["order"])
+    _report(start_time, transmissions, x, parts, workers)
+    print("Simulated time:", times[-1], "seconds")
+    return x[0], std_devs, errors, transmissions, clock
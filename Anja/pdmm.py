@@ -2,9 +2,15 @@
 import networkx as nx
 import numpy as np
 import random
-import statistics
 import time
 
+from csrgraph import CSRGraph, as_csr
+from metrics import ErrorTracker
+from spatial import GridIndex
+from topology import select_drops
+from pdmmcore import PDMMState
+from profiling import PhaseTimer
+from traces import make_traces
 from utils import generate_measurements, generate_rgg, vector_to_dict
 from visualization import plot_rgg_side_by_side
 
@@ -12,16 +18,16 @@ from visualization import plot_rgg_side_by_side
 '''
 PDMM SYNCHRONOUS
 '''
-def pdmm_synch(graph, TOL, c=0.3):
+def pdmm_synch(graph, TOL, c=0.3, trace=None, profile=False):
     '''
     1) Initialize variables
     x_0 = 0                                     (dimension = # nodes (n) x 1)
     a = sensor measurements vector              (dimension = # nodes (n) x 1)
-    z_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as dict
-    y_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as dict
+    z_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as edge array
+    y_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as edge array
     c = 0.1 (based on graph, good initial point)
     d = graph degree vector                     (dimension = # nodes (n) x 1)
-    A = not adjacency matrix  (make method)     (dimension = # edges (m) x # nodes (n)) # implemented as dict
+    A = not adjacency matrix  (make method)     (dimension = # edges (m) x # nodes (n)) # implemented as +-1 per directed edge
 
     2) while e(k) > epsilon:
         for all nodes i,
@@ -37,6 +43,7 @@ def pdmm_synch(graph, TOL, c=0.3):
                 z_ij = y_ji  
         e(k) = ||a - true_avg||_2^2
     TRANSMISSIONS: for all nodes i, for N(i), one transmission made
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     print("------- PDMM Synchronous ------- ")
@@ -44,65 +51,58 @@ def pdmm_synch(graph, TOL, c=0.3):
     start_time = time.time()
 
     # Initialize variables
-    all_nodes = list(nx.nodes(graph))
-    all_edges = list(nx.edges(graph))
-    a = np.array(list(nx.get_node_attributes(graph, "temp").values()))
-    x = np.zeros(len(all_nodes))
-    list_neighbors = [list(nx.all_neighbors(graph, node)) for node in all_nodes]
-
-    # Dimension of these should always be 2*num_edges
-    z_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}      # check every time you update that its a valid edge
-    y_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}      # check every time you update that its a valid edge
-    d = np.array([graph.degree(node) for node in all_nodes])
-
-    # Make A: Implemented as a dictionary to avoid indexing issues
-    A = {}
-    for i, edge in enumerate(all_edges):
-        A[(edge[0], edge[1])] = 1
-        A[(edge[1], edge[0])] = -1
+    csr = as_csr(graph)
+    all_nodes = list(range(csr.num_nodes))
+    a = csr.values
+
+    # x, z_ij, y_ij and A_ij as arrays, z/y/A have dimension 2*num_edges (one entry per directed edge)
+    state = PDMMState(csr, c)
+    x = state.x
     
     # Get true average, used for stopping criterion
     true_avg = np.mean(a)
-    std_devs = []
-    errors = []
+    std_devs, errors = make_traces(trace)
     transmissions = 0
     
-    while (np.linalg.norm(x - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
-        for i in all_nodes:
-            transmissions += 1
-            x[i] = (a[i] - np.sum( A[(i, j)] * z_ij[(i, j)] for j in list_neighbors[i])) / (1 + c * d[i])
-            for j in list_neighbors[i]:
-                y_ij[(i, j)] = z_ij[(i, j)] + 2 * c * x[i] * A[(i, j)]
-        for i in all_nodes:
-            for j in list_neighbors[i]:
-                z_ij[(i, j)] = y_ij[(j, i)]
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while (np.linalg.norm(x - true_avg)**2 > TOL):
+        if timer: t = timer.lap("stop check", t)
+        # x, y and z for all nodes in one vectorized round
+        state.synch_round()
+        if timer: t = timer.lap("update", t)
+        # TRANSMISSIONS: one per node per round
+        transmissions += len(all_nodes)
         
-        std_dev = statistics.stdev(x)
-        std_devs.append((transmissions, std_dev))
+        std_dev = np.std(x, ddof=1)
+        std_devs.append(transmissions, std_dev)
 
-        errors.append((transmissions, np.linalg.norm(x - np.ones(len(all_nodes)) * true_avg)**2))
+        errors.append(transmissions, np.linalg.norm(x - true_avg)**2)
+        if timer: t = timer.lap("record", t)
     
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
     print("Average: ", x[0])
+    if timer: timer.report("pdmm_synch")
 
     return x[0], std_devs, errors, transmissions
 
 '''
 PDMM ASYNCHRONOUS
 '''
-def pdmm_async(graph, TOL, c=0.4):
+def pdmm_async(graph, TOL, c=0.4, trace=None, profile=False):
     '''
     1) Initialize variables
     x_0 = 0                                     (dimension = # nodes (n) x 1)
     a = sensor measurements vector              (dimension = # nodes (n) x 1)
-    z_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as dict
-    y_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as dict
+    z_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as edge array
+    y_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as edge array
     c = 0.1 (based on graph, good initial point)
     d = graph degree vector                     (dimension = # nodes (n) x 1)
-    A = not adjacency matrix  (make method)     (dimension = # edges (m) x # nodes (n)) # implemented as dict
+    A = not adjacency matrix  (make method)     (dimension = # edges (m) x # nodes (n)) # implemented as +-1 per directed edge
 
     2) while e(k) > epsilon:
         select a random node i
@@ -119,6 +119,7 @@ def pdmm_async(graph, TOL, c=0.4):
         e(k) = ||a - true_avg||_2^2
     TRANSMISSIONS: for all nodes i, for N(i), one transmission made
     UNICAST VERSION
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     print("------- PDMM Asynchronous ------- ")
@@ -126,64 +127,64 @@ def pdmm_async(graph, TOL, c=0.4):
     start_time = time.time()
 
     # Initialize variables
-    all_nodes = list(nx.nodes(graph))
-    all_edges = list(nx.edges(graph))
-    a = np.array(list(nx.get_node_attributes(graph, "temp").values()))
-    x = np.zeros(len(all_nodes))
-    list_neighbors = [list(nx.all_neighbors(graph, node)) for node in all_nodes]
-
-    # Dimension of these should always be 2*num_edges
-    z_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}      # check every time you update that its a valid edge
-    y_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}      # check every time you update that its a valid edge
-    d = np.array([graph.degree(node) for node in all_nodes])
-
-    # Make A: Implemented as a dictionary to avoid indexing issues
-    A = {}
-    for i, edge in enumerate(all_edges):
-        A[(edge[0], edge[1])] = 1
-        A[(edge[1], edge[0])] = -1
+    csr = as_csr(graph)
+    all_nodes = list(range(csr.num_nodes))
+    a = csr.values
+
+    # x, z_ij, y_ij and A_ij as arrays, z/y/A have dimension 2*num_edges (one entry per directed edge)
+    state = PDMMState(csr, c)
+    x = state.x
     
     # Get true average, used for stopping criterion
     true_avg = np.mean(a)
-    std_devs = []
-    errors = []
+    std_devs, errors = make_traces(trace)
     transmissions = 0
     
-    while (np.linalg.norm(x - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
-        i = random.choice(all_nodes)
+    # e(k) and std dev are updated from the single changed x_i
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
+        i = csr.random_node()
+        if timer: t = timer.lap("select", t)
         transmissions += 1
-        x[i] = (a[i] - np.sum( A[(i, j)] * z_ij[(i, j)] for j in list_neighbors[i])) / (1 + c * d[i])
-        for j in list_neighbors[i]:
-            y_ij[(i, j)] = z_ij[(i, j)] + 2 * c * x[i] * A[(i, j)]
-        for j in list_neighbors[i]:
-            z_ij[(i, j)] = y_ij[(j, i)]
+        x_old = x[i]
+        state.update_node(i)
+        tracker.update(x_old, x[i])
+        if timer: t = timer.lap("update", t)
+        state.receive(i)
+        if timer: t = timer.lap("exchange", t)
         
-        std_dev = statistics.stdev(x)
-        std_devs.append((transmissions, std_dev))
+        std_dev = tracker.stdev()
+        std_devs.append(transmissions, std_dev)
 
-        errors.append((transmissions, np.linalg.norm(x - np.ones(len(all_nodes)) * true_avg)**2))
+        errors.append(transmissions, tracker.error)
+        if timer: t = timer.lap("record", t)
     
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
     print("Average: ", x[0])
+    if timer: timer.report("pdmm_async")
 
     return x[0], std_devs, errors, transmissions
 
 '''
 PDMM Asynchronous with Transmission Failures
 '''
-def pdmm_async_tf(graph, TOL, c=0.4, FAILURE_RATE=0.0):
+def pdmm_async_tf(graph, TOL, c=0.4, FAILURE_RATE=0.0, trace=None, profile=False):
     '''
     1) Initialize variables
     x_0 = 0                                     (dimension = # nodes (n) x 1)
     a = sensor measurements vector              (dimension = # nodes (n) x 1)
-    z_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as dict
-    y_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as dict
+    z_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as edge array
+    y_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as edge array
     c = 0.1 (based on graph, good initial point)
     d = graph degree vector                     (dimension = # nodes (n) x 1)
-    A = not adjacency matrix  (make method)     (dimension = # edges (m) x # nodes (n)) # implemented as dict
+    A = not adjacency matrix  (make method)     (dimension = # edges (m) x # nodes (n)) # implemented as +-1 per directed edge
 
     2) while e(k) > epsilon:
         if transmission failure case, skip iteration of while loop
@@ -201,6 +202,7 @@ def pdmm_async_tf(graph, TOL, c=0.4, FAILURE_RATE=0.0):
         e(k) = ||a - true_avg||_2^2
     TRANSMISSIONS: for all nodes i, for N(i), one transmission made
     UNICAST VERSION
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     print("------- PDMM Asynchronous TF ------- ")
@@ -208,74 +210,76 @@ def pdmm_async_tf(graph, TOL, c=0.4, FAILURE_RATE=0.0):
     start_time = time.time()
 
     # Initialize variables
-    all_nodes = list(nx.nodes(graph))
-    all_edges = list(nx.edges(graph))
-    a = np.array(list(nx.get_node_attributes(graph, "temp").values()))
-    x = np.zeros(len(all_nodes))
-    list_neighbors = [list(nx.all_neighbors(graph, node)) for node in all_nodes]
-
-    # Dimension of these should always be 2*num_edges
-    z_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}      # check every time you update that its a valid edge
-    y_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}      # check every time you update that its a valid edge
-    d = np.array([graph.degree(node) for node in all_nodes])
-
-    # Make A: Implemented as a dictionary to avoid indexing issues
-    A = {}
-    for i, edge in enumerate(all_edges):
-        A[(edge[0], edge[1])] = 1
-        A[(edge[1], edge[0])] = -1
+    csr = as_csr(graph)
+    all_nodes = list(range(csr.num_nodes))
+    a = csr.values
+
+    # x, z_ij, y_ij and A_ij as arrays, z/y/A have dimension 2*num_edges (one entry per directed edge)
+    state = PDMMState(csr, c)
+    x = state.x
     
     # Get true average, used for stopping criterion
     true_avg = np.mean(a)
-    std_devs = []
-    errors = []
+    std_devs, errors = make_traces(trace)
     transmissions = 0
     
-    while (np.linalg.norm(x - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
+    # e(k) and std dev are updated from the single changed x_i
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
         if (random.random() < FAILURE_RATE):        # 25% of the time, transmission fails, skip loop iteration
             transmissions += 1
+            if timer: t = timer.lap("failure", t)
             continue
 
-        i = random.choice(all_nodes)
+        i = csr.random_node()
+        if timer: t = timer.lap("select", t)
         transmissions += 1
-        x[i] = (a[i] - np.sum( A[(i, j)] * z_ij[(i, j)] for j in list_neighbors[i])) / (1 + c * d[i])
-        for j in list_neighbors[i]:
-            y_ij[(i, j)] = z_ij[(i, j)] + 2 * c * x[i] * A[(i, j)]
-        for j in list_neighbors[i]:
-            z_ij[(i, j)] = y_ij[(j, i)]
+        x_old = x[i]
+        state.update_node(i)
+        tracker.update(x_old, x[i])
+        if timer: t = timer.lap("update", t)
+        state.receive(i)
+        if timer: t = timer.lap("exchange", t)
         
-        std_dev = statistics.stdev(x)
-        std_devs.append((transmissions, std_dev))
+        std_dev = tracker.stdev()
+        std_devs.append(transmissions, std_dev)
 
-        errors.append((transmissions, np.linalg.norm(x - np.ones(len(all_nodes)) * true_avg)**2))
+        errors.append(transmissions, tracker.error)
+        if timer: t = timer.lap("record", t)
     
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
     print("Average: ", x[0])
+    if timer: timer.report("pdmm_async_tf")
 
     return x[0], std_devs, errors, transmissions
 
 '''
 PDMM Asynchronous with Bulk Drop/Add
 '''
-def pdmm_asynch_dropadd(graph, TOL, c=0.4, DROP_RATE=0.0, ADD_RATE=0.0):
+def pdmm_asynch_dropadd(graph, TOL, c=0.4, DROP_RATE=0.0, ADD_RATE=0.0, warm_start=True, drop="random", trace=None, profile=False):
     '''
     1) Initialize variables
     x_0 = 0                                     (dimension = # nodes (n) x 1)
     a = sensor measurements vector              (dimension = # nodes (n) x 1)
-    z_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as dict
-    y_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as dict
+    z_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as edge array
+    y_00 = 0                                    (dimension = [[# N(1) x 1 ], [# N(2) x 1], ... , [# N(n) x 1]]) # implemented as edge array
     c = 0.1 (based on graph, good initial point)
     d = graph degree vector                     (dimension = # nodes (n) x 1)
-    A = not adjacency matrix  (make method)     (dimension = # edges (m) x # nodes (n)) # implemented as dict
+    A = not adjacency matrix  (make method)     (dimension = # edges (m) x # nodes (n)) # implemented as +-1 per directed edge
 
     2) while e(k) > epsilon:
         If iteration is 2000:
             Calculate how many nodes to drop
-            Drop the nodes starting from the highest number (as not to mess with indexing)
-            Recalculate all necessary variables
+            Drop the nodes chosen by select_drops (random by default), any node can be dropped
+            because the state swaps the last slot into the freed one
+            Remove/insert only the edges of the changed nodes, z_ij and y_ij of all other edges are kept (warm start)
         select a random node i
             update x_i(k) = ( a_i - sum(A_ij*z_ij(k-1)) ) / (1 + c*d_i)          # a_ij*z_ij(k-1) -> sum of all neighbors of i
             for all neighbors of i called j,
@@ -290,6 +294,10 @@ def pdmm_asynch_dropadd(graph, TOL, c=0.4, DROP_RATE=0.0, ADD_RATE=0.0):
         e(k) = ||a - true_avg||_2^2
     TRANSMISSIONS: for all nodes i, for N(i), one transmission made
     UNICAST VERSION
+    drop="random" / "tail" / "cluster" chooses which nodes fail (see topology.select_drops).
+    warm_start=False resets all z_ij and y_ij to 0 after the change (the old behaviour), for comparison.
+    Prints the transmissions needed to converge again after the change.
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     print("------- PDMM Asynchronous Bulk Drop/Add ------- ")
@@ -297,44 +305,49 @@ def pdmm_asynch_dropadd(graph, TOL, c=0.4, DROP_RATE=0.0, ADD_RATE=0.0):
     start_time = time.time()
 
     # Initialize variables
+    csr = CSRGraph.from_networkx(graph)
     all_nodes = list(nx.nodes(graph))
-    all_edges = list(nx.edges(graph))
-    a = np.array(list(nx.get_node_attributes(graph, "temp").values()))
+    a = csr.values
     # Get true average, used for stopping criterion
     true_avg = np.mean(a)
-    x = np.zeros(len(all_nodes))
-    list_neighbors = [list(nx.all_neighbors(graph, node)) for node in all_nodes]
-
-    # Dimension of these should always be 2*num_edges
-    z_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}      # check every time you update that its a valid edge
-    y_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}      # check every time you update that its a valid edge
-    d = np.array([graph.degree(node) for node in all_nodes])
-
-    # Make A: Implemented as a dictionary to avoid indexing issues
-    A = {}
-    for i, edge in enumerate(all_edges):
-        A[(edge[0], edge[1])] = 1
-        A[(edge[1], edge[0])] = -1
+
+    # x, z_ij, y_ij and A_ij as arrays, z/y/A have dimension 2*num_edges (one entry per directed edge)
+    state = PDMMState(csr, c)
+    x = state.x
     
-    std_devs = []
-    errors = []
+    std_devs, errors = make_traces(trace)
     transmissions = 0
     DROPPED_FLAG = False
     ADDED_FLAG = False
     num_nodes_drop = 0
-
-    while (np.linalg.norm(x - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
+    changed_at = None
+
+    # cell list over the node positions, kept in sync with the graph for connecting added nodes
+    RADIUS = np.sqrt(np.log(2*len(all_nodes)) / len(all_nodes))
+    grid = GridIndex.from_graph(graph, RADIUS)
+
+    # e(k) and std dev are updated from the single changed x_i
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
         # if (transmissions % 100 == 0):
-        #     print(np.linalg.norm(x - np.ones(len(all_nodes)) * true_avg)**2)
+        #     print(np.linalg.norm(x - true_avg)**2)
         
         # BULK DROP
         if (transmissions > 2000 and DROP_RATE > 0.0 and DROPPED_FLAG == False):
             graph_old = graph.copy()
             print("Number of nodes BEFORE DROP: ", len(all_nodes))
             num_nodes_drop = int(len(all_nodes) * DROP_RATE)
-            nodes_to_drop = all_nodes[-num_nodes_drop:]
+            nodes_to_drop = select_drops(graph, num_nodes_drop, drop)
             print(nodes_to_drop)
             graph.remove_nodes_from(nodes_to_drop)
+            for node in nodes_to_drop:
+                grid.remove(node)
+                # only the edges of the dropped node are touched, the last slot moves into its place
+                state.remove_node(state.index[node])
 
             # Check visually that nodes were removed
             plot_rgg_side_by_side(graph_old, graph, "Bulk Drop")
@@ -344,26 +357,23 @@ def pdmm_asynch_dropadd(graph, TOL, c=0.4, DROP_RATE=0.0, ADD_RATE=0.0):
                 print("\033[91mERROR: After the nodes have been dropped in bulk, the graph is no longer connected.\033[0m")
                 break
 
+            # the edge arrays were changed in place, check them once (O(m)) before continuing
+            error = state.check()
+            if error:
+                print("\033[91mERROR: After the nodes have been dropped in bulk, " + error + "\033[0m")
+                break
+
             # Recalculate necessary variables
             all_nodes = list(nx.nodes(graph))
             print("Number of nodes AFTER DROP: ", len(all_nodes))
-            all_edges = list(nx.edges(graph))
-            a = np.array(list(nx.get_node_attributes(graph, "temp").values()))
-            # x = np.zeros(len(all_nodes))
-            x = x[:-num_nodes_drop]
-            # print("size of x is ", len(x))
-            list_neighbors = [list(nx.all_neighbors(graph, node)) for node in all_nodes]
-            true_avg = np.mean(a)
-
-            z_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}
-            y_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}
-            d = np.array([graph.degree(node) for node in all_nodes])
-
-            A = {}
-            for i, edge in enumerate(all_edges):
-                if edge[0] in all_nodes and edge[1] in all_nodes:
-                    A[(edge[0], edge[1])] = 1
-                    A[(edge[1], edge[0])] = -1
+            x = state.x[:state.num_slots]
+            true_avg = np.mean(state.a[:state.num_slots])
+
+            if not warm_start:
+                state.z[:] = 0
+                state.y[:] = 0
+            tracker.reset(x, true_avg)
+            changed_at = transmissions
             DROPPED_FLAG = True
             print(DROPPED_FLAG)
 
@@ -374,25 +384,24 @@ def pdmm_asynch_dropadd(graph, TOL, c=0.4, DROP_RATE=0.0, ADD_RATE=0.0):
             print("Number of nodes BEFORE ADD: ", len(all_nodes))
             num_nodes_add = int(len(all_nodes) * ADD_RATE)
             new_measurements = generate_measurements(num_nodes_add)
+            # labels are no longer 0..n-1 after a drop, new nodes get labels above all existing ones
+            first_label = max(all_nodes) + 1
 
             # Add nodes to graph and connect them in a random geometric manner
             for i in range(num_nodes_add):
                 # graph.add_node(len(all_nodes)+1+i, pos=(random.uniform(0, 1), random.uniform(0, 1)), temp=new_measurements[i])
-                graph.add_node(len(all_nodes)+i, pos=(random.uniform(0, 1), random.uniform(0, 1)), temp=new_measurements[i])
-                pos = nx.get_node_attributes(graph, 'pos') 
+                graph.add_node(first_label+i, pos=(random.uniform(0, 1), random.uniform(0, 1)), temp=new_measurements[i])
                 # RADIUS = np.sqrt(np.log(2*len(all_nodes)+i+1)) / len(all_nodes)+i+1
                 # RADIUS = np.sqrt(np.log(2*len(all_nodes)+i)) / len(all_nodes)+i
 
                 RADIUS = np.sqrt(np.log(2*old_num_nodes) / old_num_nodes)
 
-                for node in graph.nodes():
-                    # if node != len(all_nodes) + i + 1:
-                    if node != len(all_nodes) + i:
-                        # distance = np.linalg.norm(np.array(graph.nodes[node]['pos']) - np.array(graph.nodes[len(all_nodes) + i + 1]['pos']))
-                        distance = np.linalg.norm(np.array(graph.nodes[node]['pos']) - np.array(graph.nodes[len(all_nodes) + i]['pos']))
-                        if distance <= RADIUS:
-                            # graph.add_edge(node, len(all_nodes) + i + 1)
-                            graph.add_edge(node, len(all_nodes) + i)
+                # only the grid cells around the new node are checked
+                grid.connect(graph, first_label + i, RADIUS)
+
+                # only the edges of the new node are inserted, new node starts from x = 0
+                neighbors = [state.index[node] for node in graph.adj[first_label + i]]
+                state.add_node(new_measurements[i], neighbors, first_label + i)
             
             # Check visually that nodes were added
             plot_rgg_side_by_side(graph_old, graph, "Bulk Add")
@@ -402,50 +411,52 @@ def pdmm_asynch_dropadd(graph, TOL, c=0.4, DROP_RATE=0.0, ADD_RATE=0.0):
                 print("\033[91mERROR: After the nodes have been added in bulk, the graph is no longer connected.\033[0m")
                 break
 
+            # the edge arrays were changed in place, check them once (O(m)) before continuing
+            error = state.check()
+            if error:
+                print("\033[91mERROR: After the nodes have been added in bulk, " + error + "\033[0m")
+                break
+
             # Recalculate necessary variables
             all_nodes = list(nx.nodes(graph))
             print("Number of nodes AFTER ADD: ", len(all_nodes))
-            all_edges = list(nx.edges(graph))
-            a = np.array(list(nx.get_node_attributes(graph, "temp").values()))
-            # x = np.zeros(len(all_nodes))
-            x = np.concatenate((x, np.zeros(num_nodes_add)))
-            # print("size of x is ", len(x))
-            list_neighbors = [list(nx.all_neighbors(graph, node)) for node in all_nodes]
-            true_avg = np.mean(a)
-
-            z_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}
-            y_ij = {(i, j): 0.0 for i in all_nodes for j in list_neighbors[i]}
-            d = np.array([graph.degree(node) for node in all_nodes])
-
-            A = {}
-            for i, edge in enumerate(all_edges):
-                if edge[0] in all_nodes and edge[1] in all_nodes:
-                    A[(edge[0], edge[1])] = 1
-                    A[(edge[1], edge[0])] = -1
+            x = state.x[:state.num_slots]     # the state arrays may have grown
+            true_avg = np.mean(state.a[:state.num_slots])
+
+            if not warm_start:
+                state.z[:] = 0
+                state.y[:] = 0
+            tracker.reset(x, true_avg)
+            changed_at = transmissions
             
             ADDED_FLAG = True
             print(ADDED_FLAG)
 
-        all_nodes = list(nx.nodes(graph))
-        # print(all_nodes)
-        i = random.choice(all_nodes)
+        if timer: t = timer.lap("topology", t)
+        i = state.random_node(random)
+        if timer: t = timer.lap("select", t)
         transmissions += 1
         
-        x[i] = (a[i] - np.sum( A[(i, j)] * z_ij[(i, j)] for j in list_neighbors[i])) / (1 + c * d[i])
-        for j in list_neighbors[i]:
-            y_ij[(i, j)] = z_ij[(i, j)] + 2 * c * x[i] * A[(i, j)]
-        for j in list_neighbors[i]:
-            z_ij[(i, j)] = y_ij[(j, i)]
+        x_old = x[i]
+        state.update_node(i)
+        tracker.update(x_old, x[i])
+        if timer: t = timer.lap("update", t)
+        state.receive(i)
+        if timer: t = timer.lap("exchange", t)
         
-        std_dev = statistics.stdev(x)
-        std_devs.append((transmissions, std_dev))
-        errors.append((transmissions, np.linalg.norm(x - np.ones(len(all_nodes)) * true_avg)**2))
+        std_dev = tracker.stdev()
+        std_devs.append(transmissions, std_dev)
+        errors.append(transmissions, tracker.error)
+        if timer: t = timer.lap("record", t)
     
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
+    if changed_at is not None:
+        print("Transmissions to recover after the change (" + ("warm" if warm_start else "cold") + " start): ", transmissions - changed_at)
     print("Average: ", x[0])
+    if timer: timer.report("pdmm_asynch_dropadd")
 
     return x[0], std_devs, errors, transmissions
     
@@ -0,0 +1,283 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from csrgraph import _grow
+
+'''
+EDGE-INDEXED PDMM STATE
+using PDMMState(csr, c), then update_node(i) / receive(i) for asynchronous PDMM
+or synch_round() for synchronous PDMM
+remove_node(i) / add_node(a_i, neighbors, label) change the topology in O(degree), z and y of the other edges are kept
+'''
+def reverse_edge_index(indptr, indices):
+    '''
+    For every directed edge e = (i, j) in the CSR arrays, return the position of (j, i).
+    The directed edges are numbered by their position in indices, so edge e leaves node src[e]
+    and ends in node indices[e].
+    '''
+    n = len(indptr) - 1
+    src = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    dst = indices.astype(np.int64)
+    keys = src * n + dst
+    order = np.argsort(keys, kind="stable")
+    rev = order[np.searchsorted(keys[order], dst * n + src)]
+    return rev.astype(np.int32)
+
+
+class PDMMState:
+    '''
+    PDMM variables stored per directed edge instead of in (i, j)-keyed dicts.
+    The edges of node i are the positions start[i] : start[i] + degree[i] of the edge arrays, a row has room
+    for cap[i] edges. Built from a CSRGraph the rows are packed (start = indptr, cap = degree); rows only get
+    gaps or move after remove_node / add_node.
+        z, y    float64. z[e] = z_ij, y[e] = y_ij for e = (i, j)
+        sign    int8. A_ij, +1 if slot i < slot j when the edge was created (same orientation as nx.edges),
+                0 in unused positions. Stays with the edge when slots are renumbered, so A_ji = -A_ij always
+        rev     int32. rev[e] is the edge (j, i)
+        src     int32. src[e] = i
+        x       float64, one per node slot. Primal variables, x[:num_slots] are in use
+        a       float64, one per node slot. Measurements
+        labels  labels[i] is the networkx label of slot i, index is the inverse (label -> slot)
+    The nodes always occupy slots 0..num_slots-1: remove_node swaps the last slot into the freed one
+    (swap-remove), so any node can leave in O(degree) and x/a never need more than a slice.
+    '''
+    def __init__(self, csr, c, x=None):
+        n = csr.num_nodes
+        self.c = c
+        self.indices = csr.indices.copy()
+        self.a = csr.values.copy()
+        self.degree = csr.degree.copy()
+        self.start = csr.indptr[:-1].astype(np.int64)
+        self.cap = csr.degree.copy()
+        self.denom = 1 + c * self.degree
+        self.num_slots = n
+        self.used = len(self.indices)       # edge positions in use or reserved by a row
+
+        self.src = np.repeat(np.arange(n, dtype=np.int32), csr.degree)
+        self.sign = np.where(self.src < self.indices, 1, -1).astype(np.int8)
+        self.rev = reverse_edge_index(csr.indptr, csr.indices)
+
+        self.z = np.zeros(len(self.indices))
+        self.y = np.zeros(len(self.indices))
+        self.x = np.zeros(n) if x is None else x
+        self.labels = list(csr.labels)
+        self.index = dict(csr.index)
+        self._incidence = None
+
+    def update_node(self, i):
+        '''
+        x_i(k) = ( a_i - sum(A_ij*z_ij(k-1)) ) / (1 + c*d_i)
+        y_ij(k) = z_ij(k-1) + 2*c*x_i(k)*A_ij       for all neighbors j
+        '''
+        start = self.start[i]
+        end = start + self.degree[i]
+        sign = self.sign[start:end]
+        z = self.z[start:end]
+        x_i = (self.a[i] - np.dot(sign, z)) / self.denom[i]
+        self.x[i] = x_i
+        self.y[start:end] = z + (2 * self.c * x_i) * sign
+        return x_i
+
+    def receive(self, i):
+        # z_ij = y_ji for all neighbors j of node i
+        start = self.start[i]
+        end = start + self.degree[i]
+        self.z[start:end] = self.y[self.rev[start:end]]
+
+    def exchange(self):
+        # synchronous version: z_ij = y_ji for every edge at once (unused positions point to themselves)
+        self.z = self.y[self.rev]
+
+    def incidence(self):
+        '''
+        Sparse n x 2m matrix B with B[i, e] = A_ij for every edge e = (i, j) leaving node i.
+        B @ z gives sum_j(A_ij*z_ij) for all nodes at once. Built on first use, and again after a topology change.
+        Only the positions in use (sign != 0) are entries of B, the free positions of the rows are left out.
+        '''
+        if self._incidence is None:
+            used = self.used
+            live = np.flatnonzero(self.sign[:used])
+            src = self.src[live]
+            order = live[np.argsort(src, kind="stable")]
+            indptr = np.zeros(self.num_slots + 1, dtype=np.int64)
+            np.cumsum(np.bincount(src, minlength=self.num_slots), out=indptr[1:])
+            self._incidence = csr_matrix((self.sign[order].astype(np.float64), order, indptr), shape=(self.num_slots, used))
+        return self._incidence
+
+    def synch_round(self):
+        '''
+        One synchronous PDMM iteration for every node in a single NumPy pass:
+            x(k)  = ( a - B z(k-1) ) / (1 + c*d)
+            y(k)  = z(k-1) + 2*c*A_ij*x_i(k)     (x gathered per edge through src)
+            z(k)  = y(k)[rev]                    (z_ij = y_ji is a permutation of y)
+        '''
+        used = self.used
+        self.x[:self.num_slots] = (self.a[:self.num_slots] - self.incidence() @ self.z[:used]) / self.denom[:self.num_slots]
+        self.y[:used] = self.z[:used] + (2 * self.c) * self.sign[:used] * self.x[self.src[:used]]
+        self.exchange()
+
+    def check(self):
+        '''
+        Returns an error message if the edge arrays are inconsistent, None otherwise (O(m), for after topology changes):
+        every position in use lies in the row of its src, (j, i) = rev of (i, j) with A_ji = -A_ij, the degrees
+        count the positions in use and no position refers to a slot >= num_slots
+        '''
+        used = self.used
+        n = self.num_slots
+        live = np.flatnonzero(self.sign[:used])
+        src = self.src[live].astype(np.int64)
+        if np.any(self.src[:used] >= n) or np.any(self.indices[live] >= n):
+            return "An edge position refers to a slot that is no longer in use."
+        if np.any(live < self.start[src]) or np.any(live >= self.start[src] + self.degree[src]):
+            return "An edge lies outside the row of its node."
+        if int(np.sum(self.degree[:n])) != len(live):
+            return "The degrees do not match the edges in use."
+        rev = self.rev[live]
+        if np.any(self.rev[rev] != live) or np.any(self.sign[rev] != -self.sign[live]) or np.any(self.indices[rev] != src):
+            return "An edge and its reverse do not match."
+        if len(self.labels) != n or any(self.index[label] != i for i, label in enumerate(self.labels)):
+            return "The labels and index do not match the slots."
+        return None
+
+    def random_node(self, rng):
+        # uniformly random slot, rng is the random module (or a random.Random)
+        return rng.randrange(self.num_slots)
+
+    def remove_node(self, i):
+        '''
+        Remove the node in slot i and its edges in O(degree): every edge (j, i) is swapped with the last edge of row j.
+        The node in the last slot then moves into slot i (its row stays where it is, only src and the
+        indices pointing at it are renumbered). z/y of all other edges are kept.
+        '''
+        start = self.start[i]
+        for e in range(start, start + self.degree[i]):
+            self._remove_position(int(self.indices[e]), int(self.rev[e]))
+            self._clear(e)
+        del self.index[self.labels[i]]
+
+        last = self.num_slots - 1
+        if i != last:
+            self._move_slot(last, i)
+        self.labels.pop()
+        self.a[last] = 0
+        self.x[last] = 0
+        self.degree[last] = 0
+        self.cap[last] = 0
+        self.denom[last] = 1
+        self.num_slots -= 1
+        self._incidence = None
+
+    def add_node(self, a_i, neighbors, label=None, x_i=0.0):
+        '''
+        Add a node with measurement a_i connected to the given slots, O(degree) amortized. Returns its slot.
+        The new edges start with z = y = 0, the rest of the state is kept.
+        '''
+        i = self.num_slots
+        if i == len(self.a):
+            self.a = _grow(self.a, i + 1)
+            self.x = _grow(self.x, i + 1)
+            self.degree = _grow(self.degree, i + 1)
+            self.cap = _grow(self.cap, i + 1)
+            self.start = _grow(self.start, i + 1)
+            self.denom = _grow(self.denom, i + 1, 1)
+        self.num_slots += 1
+        self.a[i] = a_i
+        self.x[i] = x_i
+        self.degree[i] = 0
+        self.cap[i] = 0
+        self.start[i] = self.used
+        label = i if label is None else label
+        self.labels.append(label)
+        self.index[label] = i
+        for j in neighbors:
+            p = self._append_position(i, j)
+            q = self._append_position(j, i)
+            self.rev[p] = q
+            self.rev[q] = p
+            self.sign[p] = 1 if i < j else -1
+            self.sign[q] = -self.sign[p]
+        self._incidence = None
+        return i
+
+    def _move_slot(self, old, new):
+        # node in slot old takes over slot new (which has no edges left)
+        self.a[new] = self.a[old]
+        self.x[new] = self.x[old]
+        self.degree[new] = self.degree[old]
+        self.cap[new] = self.cap[old]
+        self.start[new] = self.start[old]
+        self.denom[new] = self.denom[old]
+        start = self.start[new]
+        for e in range(start, start + self.degree[new]):
+            self.src[e] = new
+            self.indices[self.rev[e]] = new
+        label = self.labels[old]
+        self.labels[new] = label
+        self.index[label] = new
+
+    def _clear(self, e):
+        # free position: no sign, no values, points to itself and to slot 0 (a freed slot may not exist any more)
+        self.src[e] = 0
+        self.sign[e] = 0
+        self.z[e] = 0
+        self.y[e] = 0
+        self.rev[e] = e
+
+    def _remove_position(self, j, p):
+        # remove edge position p from row j by moving the last edge of the row into it
+        last = self.start[j] + self.degree[j] - 1
+        if p != last:
+            self.indices[p] = self.indices[last]
+            self.sign[p] = self.sign[last]
+            self.z[p] = self.z[last]
+            self.y[p] = self.y[last]
+            self.rev[p] = self.rev[last]
+            self.rev[self.rev[p]] = p
+        self._clear(last)
+        self.degree[j] -= 1
+        self.denom[j] = 1 + self.c * self.degree[j]
+
+    def _append_position(self, i, j):
+        # append edge (i, j) to row i, moving the row to the end with double capacity if it is full
+        if self.degree[i] == self.cap[i]:
+            new_cap = max(4, 2 * int(self.cap[i]))
+            self._reserve(self.used + new_cap)
+            old, new = self.start[i], self.used
+            d = self.degree[i]
+            for k in range(d):
+                self._move(old + k, new + k)
+            self.start[i] = new
+            self.cap[i] = new_cap
+            self.used += new_cap
+        p = self.start[i] + self.degree[i]
+        self.indices[p] = j
+        self.src[p] = i
+        self.z[p] = 0
+        self.y[p] = 0
+        self.degree[i] += 1
+        self.denom[i] = 1 + self.c * self.degree[i]
+        return p
+
+    def _move(self, old, new):
+        self.indices[new] = self.indices[old]
+        self.src[new] = self.src[old]
+        self.sign[new] = self.sign[old]
+        self.z[new] = self.z[old]
+        self.y[new] = self.y[old]
+        r = self.rev[old]
+        self.rev[new] = r
+        self.rev[r] = new
+        self._clear(old)
+
+    def _reserve(self, size):
+        if size <= len(self.indices):
+            return
+        n = len(self.indices)
+        self.indices = _grow(self.indices, size)
+        self.src = _grow(self.src, size)
+        self.sign = _grow(self.sign, size)
+        self.z = _grow(self.z, size)
+        self.y = _grow(self.y, size)
+        rev = _grow(self.rev, size)
+        rev[n:] = np.arange(n, len(rev))
+        self.rev = rev
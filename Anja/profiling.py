@@ -0,0 +1,40 @@
+import time
+
+'''
+PER-PHASE PROFILING
+using timer = PhaseTimer() if profile else None before the loop, then t = timer.lap("phase", t) after every
+phase of an iteration (guarded by "if timer:", so a run without profile=True only pays for that check)
+and timer.report() with the result
+'''
+class PhaseTimer:
+    '''
+    Accumulates wall time and number of calls per phase of an algorithm loop.
+        t = timer.start()
+        ... select a node ...
+        t = timer.lap("select", t)     # time since t goes to "select", returns the new reference time
+    '''
+    def __init__(self):
+        self.time = {}
+        self.calls = {}
+
+    def start(self):
+        return time.perf_counter()
+
+    def lap(self, phase, t):
+        now = time.perf_counter()
+        self.time[phase] = self.time.get(phase, 0.0) + (now - t)
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        return now
+
+    def summary(self):
+        # (phase, calls, total seconds, microseconds per call, share of the profiled time), longest phase first
+        total = sum(self.time.values()) or 1.0
+        rows = [(phase, self.calls[phase], seconds, 1e6 * seconds / self.calls[phase], seconds / total)
+                for phase, seconds in self.time.items()]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def report(self, name=""):
+        print("Profile " + name + ":")
+        print("    {:<14s}{:>12s}{:>12s}{:>12s}{:>8s}".format("phase", "calls", "total s", "us/call", "share"))
+        for phase, calls, seconds, per_call, share in self.summary():
+            print("    {:<14s}{:>12d}{:>12.3f}{:>12.3f}{:>7.1f}%".format(phase, calls, seconds, per_call, 100 * share))
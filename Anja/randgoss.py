@@ -2,9 +2,15 @@
 import networkx as nx
 import numpy as np
 import random
-import statistics
 import time
 
+from csrgraph import CSRGraph, as_csr
+from metrics import ErrorTracker
+from profiling import PhaseTimer
+from runs import average_run, conflict_free_runs
+from spatial import GridIndex
+from topology import ChurnTracker
+from traces import make_traces
 from utils import generate_measurements, generate_rgg, vector_to_dict
 from visualization import plot_rgg_side_by_side
 
@@ -12,7 +18,7 @@ from visualization import plot_rgg_side_by_side
 '''
 RANDOMIZED GOSSIP
 '''
-def random_gossip_noW(graph, TOL):
+def random_gossip_noW(graph, TOL, trace=None, profile=False):
     '''
     1) x(k-1) = x(0)
     2) while e(k) > epsilon:
@@ -30,6 +36,7 @@ def random_gossip_noW(graph, TOL):
                 x(k-1) = x(k)
     TRANSMISSIONS: per iteration of while loop = 1
     * decided to only implement the without W implementation because matrix multiplications implodes the time
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     print("------- RANDOM GOSSIP (no W)------- ")
@@ -37,52 +44,141 @@ def random_gossip_noW(graph, TOL):
     start_time = time.time()
 
     # x(k-1) = x(0)
-    all_temps = nx.get_node_attributes(graph, "temp")
+    csr = as_csr(graph)
+    x = csr.values
     
     # get true average, used for stopping criterion
-    true_avg = np.mean(list(all_temps.values()))
-    std_devs = []
-    errors = []
+    true_avg = np.mean(x)
+    std_devs, errors = make_traces(trace)
     transmissions = 0
 
-    all_nodes = list(nx.nodes(graph))
-    while (np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
+    # e(k) and std dev are updated from the two changed entries only
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
         # uniformly select random node i
-        node_i = random.choice(all_nodes)
+        node_i = csr.random_node()
+        if timer: t = timer.lap("select", t)
         
         # uniformly select a neighbor of node i      
-        neighbors_i = list(nx.all_neighbors(graph, node_i))
-        rand_neigh = random.choice(neighbors_i) 
+        rand_neigh = csr.random_neighbor(node_i)
+        if timer: t = timer.lap("neighbor", t)
 
         # x(k) = avg(x_i, one_rand_neighbor)
-        cur_temp = all_temps[node_i]
-        neigh_temp = all_temps[rand_neigh]
+        cur_temp = x[node_i]
+        neigh_temp = x[rand_neigh]
         avg = (cur_temp + neigh_temp)/2
-        all_temps.update({node_i: avg, rand_neigh: avg})
+        x[node_i] = avg
+        x[rand_neigh] = avg
+        tracker.update(cur_temp, avg)
+        tracker.update(neigh_temp, avg)
 
         # TRANSMISSIONS: per iteration of while loop = 1
         transmissions += 1
+        if timer: t = timer.lap("update", t)
 
         # update values for plotting later
-        std_dev = statistics.stdev(list(all_temps.values()))
-        std_devs.append((transmissions, std_dev))
+        std_dev = tracker.stdev()
+        std_devs.append(transmissions, std_dev)
 
         # e(k) = || . ||
-        errors.append((transmissions, np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2))
+        errors.append(transmissions, tracker.error)
+        if timer: t = timer.lap("record", t)
 
     
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
-    print("Average: ", all_temps[0])
+    print("Average: ", x[0])
+    if timer: timer.report("random_gossip_noW")
+
+    return x[0], std_devs, errors, transmissions
+
+'''
+RANDOMIZED GOSSIP (conflict-free batches)
+'''
+def random_gossip_batched(graph, TOL, block=1 << 16, seed=None, trace=None, profile=False):
+    '''
+    Same process as random_gossip_noW (uniform node i, uniform neighbor j, x_i = x_j = avg(x_i, x_j)),
+    applied in vectorized runs instead of one pair per iteration:
+    1) x(k-1) = x(0)
+    2) while e(k) > epsilon:
+        draw a block of pairs (i, j) at once
+        split the block into maximal runs in which no node appears twice (conflict_free_runs)
+        for every run:
+            avg = (x_I + x_J)/2, x_I = avg, x_J = avg       (one NumPy step for the whole run)
+            e(k) and std dev are recorded at the end of the run
+    Every run is a prefix of the remaining pairs, so x after a run is exactly x of the one-by-one process after
+    the same pairs. e(k) never increases under pairwise averaging, so when a run ends below TOL the exact
+    step where e(k) first reached TOL is found inside that run (cumulative sum of the per-pair decrease
+    (x_i - x_j)^2/2) and the run is cut there: the transmissions match the one-by-one process.
+    TRANSMISSIONS: one per pair
+    block: pairs drawn at once, seed: np.random.default_rng seed
+    profile=True: time every phase of the loop and print a table of time and calls per phase
+    '''
+    print("")
+    print("------- RANDOM GOSSIP (conflict-free batches) ------- ")
+
+    start_time = time.time()
+
+    # x(k-1) = x(0)
+    csr = as_csr(graph)
+    x = csr.values
+    rng = np.random.default_rng(seed)
+    degree = csr.degree.astype(np.int64)
+
+    # get true average, used for stopping criterion
+    true_avg = np.mean(x)
+    std_devs, errors = make_traces(trace)
+    transmissions = 0
+
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
+        # draw a block of pairs: uniform node i, uniform neighbor j of i
+        node_i = rng.integers(0, csr.num_nodes, block)
+        node_j = csr.indices[csr.indptr[node_i] + rng.integers(0, degree[node_i])]
+        bounds = conflict_free_runs(node_i, node_j)
+        if timer: t = timer.lap("select", t)
+
+        run = 0
+        start = 0
+        while start < block and not tracker.converged(TOL):
+            # the run is cut where e(k) reaches TOL, its other pairs follow if the exact check disagrees
+            end = bounds[run + 1]
+            count = average_run(x, tracker, node_i[start:end], node_j[start:end], TOL)
+            start += count
+            if start == end:
+                run += 1
+
+            # TRANSMISSIONS: one per pair
+            transmissions += count
+            if timer: t = timer.lap("update", t)
+
+            std_devs.append(transmissions, tracker.stdev())
+            errors.append(transmissions, tracker.error)
+            if timer: t = timer.lap("record", t)
+
+    end_time = time.time()
+    execution_time = end_time - start_time
+    print("Execution time:", execution_time, "seconds")
+    print("Transmissions: ", transmissions)
+    print("Average: ", x[0])
+    if timer: timer.report("random_gossip_batched")
 
-    return all_temps[0], std_devs, errors, transmissions
+    return x[0], std_devs, errors, transmissions
 
 '''
 RANDOMIZED GOSSIP WITH TRANSMISSION FAILURES
 '''
-def random_gossip_TF(graph, TOL, FAILURE_RATE=0.0):
+def random_gossip_TF(graph, TOL, FAILURE_RATE=0.0, trace=None, profile=False):
     '''
     1) x(k-1) = x(0)
     2) while e(k) > epsilon:
@@ -100,6 +196,7 @@ def random_gossip_TF(graph, TOL, FAILURE_RATE=0.0):
                 x(k-1) = x(k)
     TRANSMISSIONS: per iteration of while loop = 1
     * decided to only implement the without W implementation because matrix multiplications implodes the time
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     print("------- RANDOM GOSSIP w/ Transmission Failures------- ")
@@ -107,56 +204,69 @@ def random_gossip_TF(graph, TOL, FAILURE_RATE=0.0):
     start_time = time.time()
 
     # x(k-1) = x(0)
-    all_temps = nx.get_node_attributes(graph, "temp")
+    csr = as_csr(graph)
+    x = csr.values
     
     # get true average, used for stopping criterion
-    true_avg = np.mean(list(all_temps.values()))
-    std_devs = []
-    errors = []
+    true_avg = np.mean(x)
+    std_devs, errors = make_traces(trace)
     transmissions = 0
 
-    all_nodes = list(nx.nodes(graph))
-    while (np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
+    # e(k) and std dev are updated from the two changed entries only
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
         if (random.random() < FAILURE_RATE):        # 25% of the time, transmission fails, skip loop iteration
             transmissions += 1
+            if timer: t = timer.lap("failure", t)
             continue
 
         # uniformly select random node i
-        node_i = random.choice(all_nodes)
+        node_i = csr.random_node()
+        if timer: t = timer.lap("select", t)
         
         # uniformly select a neighbor of node i      
-        neighbors_i = list(nx.all_neighbors(graph, node_i))
-        rand_neigh = random.choice(neighbors_i) 
+        rand_neigh = csr.random_neighbor(node_i)
+        if timer: t = timer.lap("neighbor", t)
 
         # x(k) = avg(x_i, one_rand_neighbor)
-        cur_temp = all_temps[node_i]
-        neigh_temp = all_temps[rand_neigh]
+        cur_temp = x[node_i]
+        neigh_temp = x[rand_neigh]
         avg = (cur_temp + neigh_temp)/2
-        all_temps.update({node_i: avg, rand_neigh: avg})
+        x[node_i] = avg
+        x[rand_neigh] = avg
+        tracker.update(cur_temp, avg)
+        tracker.update(neigh_temp, avg)
 
         # TRANSMISSIONS: per iteration of while loop = 1
         transmissions += 1
+        if timer: t = timer.lap("update", t)
 
         # update values for plotting later
-        std_dev = statistics.stdev(list(all_temps.values()))
-        std_devs.append((transmissions, std_dev))
+        std_dev = tracker.stdev()
+        std_devs.append(transmissions, std_dev)
 
         # e(k) = || . ||
-        errors.append((transmissions, np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2))
+        errors.append(transmissions, tracker.error)
+        if timer: t = timer.lap("record", t)
 
     
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
-    print("Average: ", all_temps[0])
+    print("Average: ", x[0])
+    if timer: timer.report("random_gossip_TF")
 
-    return all_temps[0], std_devs, errors, transmissions
+    return x[0], std_devs, errors, transmissions
 
 '''
 RANDOMIZED GOSSIP WITH NODE DROP/ADD
 '''
-def random_gossip_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk"):
+def random_gossip_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk", trace=None, profile=False):
     '''
     Random Gossip Algorithm
     4 OPTIONS:
@@ -166,6 +276,7 @@ def random_gossip_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk"):
         * Adding nodes sequentially
     Access these options by setting EITHER DROP_RATE > 0.0 OR ADD_RATE > 0.0
     and by setting type to either "bulk" or "seq"
+    profile=True: time every phase of the loop and print a table of time and calls per phase
     '''
     print("")
     if (DROP_RATE > 0.0): # Dropping nodes
@@ -177,12 +288,12 @@ def random_gossip_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk"):
     start_time = time.time()
 
     # x(k-1) = x(0)
-    all_temps = nx.get_node_attributes(graph, "temp")
+    csr = CSRGraph.from_networkx(graph)
+    x = csr.values
     
     # get true average, used for stopping criterion
-    true_avg = np.mean(list(all_temps.values()))
-    std_devs = []
-    errors = []
+    true_avg = np.mean(x)
+    std_devs, errors = make_traces(trace)
     transmissions = 0
     DROPPED_FLAG = False
     ADDED_FLAG = False
@@ -196,8 +307,17 @@ def random_gossip_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk"):
     print("Number of nodes to add: ", num_nodes_add)
     num_nodes_added_already = 0
 
-    
-    while (np.linalg.norm(list(all_temps.values()) - np.ones(len(all_nodes)) * true_avg)**2 > TOL):
+    # cell list over the node positions, kept in sync with the graph for connecting added nodes
+    grid = GridIndex.from_graph(graph, np.sqrt(np.log(2*len(all_nodes)) / len(all_nodes)))
+    churn = None
+
+    # e(k) and std dev are updated from the two changed entries only
+    tracker = ErrorTracker(x, true_avg)
+    # per-phase timing (profiling.PhaseTimer), only when profile=True
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
+    while not tracker.converged(TOL):
+        if timer: t = timer.lap("stop check", t)
         
         # CASE 1: BULK DROP
         if (transmissions > 10000 and DROPPED_FLAG == False and type == "bulk" and DROP_RATE > 0.0):
@@ -209,6 +329,7 @@ def random_gossip_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk"):
             for node in nodes_to_drop:
                 # print("Node to drop: ", node)
                 graph.remove_node(node)
+                grid.remove(node)
             # Check if the graph is connected
             if not nx.is_connected(graph):
                 print("\033[91mERROR: After the nodes have been dropped in bulk, the graph is no longer connected.\033[0m")
@@ -219,29 +340,38 @@ def random_gossip_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk"):
             # Recalculation after nodes drop
             all_nodes = list(nx.nodes(graph))
             print("Number of nodes AFTER BULK DROP: ", len(all_nodes))
-            # all_temps = nx.get_node_attributes(graph, "temp")
-            all_temps = {node: temp for node, temp in all_temps.items() if node in graph}
+            # drop the slots from the arrays, surviving nodes keep their current values
+            csr = csr.remove_slots([csr.index[node] for node in nodes_to_drop])
+            x = csr.values
 
-            true_avg = np.mean(list(all_temps.values()))
+            true_avg = np.mean(x)
+            tracker.reset(x, true_avg)
             
             DROPPED_FLAG = True
 
         # CASE 2: SEQUENTIAL DROP
         if (transmissions > 10000 and DROPPED_FLAG == False and type == "seq" and transmissions % 1000 == 0 and DROP_RATE > 0.0): # only drop every 100 iterations of the while loop
-            all_nodes = list(nx.nodes(graph))           # get current list of nodes
-            node_to_drop = random.choice(all_nodes)     # drop a single random node from the graph
-            graph.remove_node(node_to_drop) # drop a single random node from the graph
+            slot_to_drop = csr.random_node()            # drop a single random node from the graph
+            node_to_drop = csr.labels[slot_to_drop]
+            # connectivity is checked locally around the dropped node, true_avg is updated by subtraction
+            if churn is None:
+                churn = ChurnTracker(graph, x)
+            connected = churn.drop(node_to_drop, x[slot_to_drop])
+            grid.remove(node_to_drop)
 
             # recalculate necessary things for computations later to continue
-            # all_temps = nx.get_node_attributes(graph, "temp")
-            all_temps = {node: temp for node, temp in all_temps.items() if node in graph}
-            all_nodes = list(nx.nodes(graph))
-            true_avg = np.mean(list(all_temps.values()))
+            # swap-remove in place, the tracker drops the node's term and moves to the new average: O(degree)
+            value = x[slot_to_drop]
+            csr.remove_slot(slot_to_drop)
+            x = csr.values
+            all_nodes = csr.labels
+            true_avg = churn.true_avg
+            tracker.remove(value, x, true_avg)
 
             num_nodes_dropped_already += 1
 
             # Check if the graph is connected
-            if not nx.is_connected(graph):
+            if not connected:
                 print("\033[91mERROR: After the nodes have been dropped in sequence, the graph is no longer connected.\033[0m")
                 break
 
@@ -262,18 +392,11 @@ def random_gossip_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk"):
                 graph.add_node(len(all_nodes)+1+i, pos=(random.uniform(0, 1), random.uniform(0, 1)), temp=new_measurements[i])
                 # make sure graph position is being created as well
 
-                pos = nx.get_node_attributes(graph, 'pos') 
-                
-                # print(len(pos), "should be equal to ", len(all_nodes)+i+1)
-
                 # randomly connect it to the graph in a random geometric manner
-                RADIUS = np.sqrt(np.log(2*len(all_nodes)+i+1)) / len(all_nodes)+i+1
+                RADIUS = np.sqrt(np.log(2*(len(all_nodes)+i+1)) / (len(all_nodes)+i+1))
                 # print("Radius: ", RADIUS)
-                for node in graph.nodes():
-                    if node != len(all_nodes) + i + 1:
-                        distance = np.linalg.norm(np.array(graph.nodes[node]['pos']) - np.array(graph.nodes[len(all_nodes) + i + 1]['pos']))
-                        if distance <= RADIUS:
-                            graph.add_edge(node, len(all_nodes) + i + 1)
+                # only the grid cells around the new node are checked
+                grid.connect(graph, len(all_nodes) + i + 1, RADIUS)
 
             # to check this was done correctly, print the graph before and after adding nodes
             plot_rgg_side_by_side(graph_old, graph, "Bulk Add")
@@ -286,84 +409,91 @@ def random_gossip_dropadd(graph, TOL, DROP_RATE=0.0, ADD_RATE=0.0, type="bulk"):
             # Recalculation after nodes drop
             all_nodes = list(nx.nodes(graph))
             print("Number of nodes AFTER BULK ADD: ", len(all_nodes))
-            # all_temps = nx.get_node_attributes(graph, "temp")
-            all_temps.update({node: graph.nodes[node]['temp'] for node in all_nodes[-num_nodes_add:]})
-            true_avg = np.mean(list(all_temps.values()))
+            # rebuild the arrays, new nodes start from their 'temp' measurement
+            csr = CSRGraph.from_networkx(graph, values=csr.values_by_label())
+            x = csr.values
+            true_avg = np.mean(x)
+            tracker.reset(x, true_avg)
             
             ADDED_FLAG = True
         
         # CASE 4: SEQUENTIAL ADD
         if (transmissions > 5000 and ADDED_FLAG == False and type == "seq" and transmissions % 1000 == 0 and ADD_RATE > 0.0): # only add every 100 iterations of the while loop
-            graph_old = graph.copy()
-            all_nodes = list(nx.nodes(graph))           # get current list of nodes
+            all_nodes = csr.labels                      # get current list of nodes
+            new_node = len(all_nodes) + 1
+            while new_node in csr.index:                # after drops that label can still be in use
+                new_node += 1
             new_measurement = generate_measurements(1)
-            graph.add_node(len(all_nodes)+1, pos=(random.uniform(0, 1), random.uniform(0, 1)), temp=new_measurement[0])
-            pos = nx.get_node_attributes(graph, 'pos') 
-            # print(len(pos), "should be equal to ", len(all_nodes) + 1)
+            if churn is None:
+                churn = ChurnTracker(graph, x)
+            graph.add_node(new_node, pos=(random.uniform(0, 1), random.uniform(0, 1)), temp=new_measurement[0])
 
             # randomly connect it to the graph in a random geometric manner
-            RADIUS = np.sqrt(np.log(2*len(all_nodes)+1)) / len(all_nodes)+1
+            RADIUS = np.sqrt(np.log(2*(len(all_nodes)+1)) / (len(all_nodes)+1))
             # print("Radius: ", RADIUS)
-            for node in graph.nodes():
-                if node != len(all_nodes) + 1:
-                    distance = np.linalg.norm(np.array(graph.nodes[node]['pos']) - np.array(graph.nodes[len(all_nodes) + 1]['pos']))
-                    if distance <= RADIUS:
-                        graph.add_edge(node, len(all_nodes) + 1)
-
-            # to check this was done correctly, print the graph before and after adding singular node
-            # plot_rgg_side_by_side(graph_old, graph)
+            # only the grid cells around the new node are checked
+            grid.connect(graph, new_node, RADIUS)
 
             # recalculate necessary things for computations later to continue
-            # all_temps = nx.get_node_attributes(graph, "temp")
-            all_nodes = list(nx.nodes(graph))
-            # print("Number of nodes in all_nodes: ", len(all_nodes))
-            all_temps.update({node: graph.nodes[node]['temp'] for node in all_nodes[-num_nodes_add:]})
-            # print("Number of nodes in all_temps: ", len(all_temps))
-            true_avg = np.mean(list(all_temps.values()))
+            # appended in place, only the new node starts from its measurement: O(degree)
+            value = new_measurement[0]
+            csr.add_slot(new_node, [csr.index[j] for j in graph.adj[new_node]], value, graph.nodes[new_node]["pos"])
+            x = csr.values
+            all_nodes = csr.labels
+            connected = churn.add(new_node, value)
+            true_avg = churn.true_avg
+            tracker.append(value, x, true_avg)
 
             num_nodes_added_already += 1
 
             # Check if the graph is connected
-            if not nx.is_connected(graph):
-                print("\033[91mERROR: After the nodes have been dropped in sequence, the graph is no longer connected.\033[0m")
+            if not connected:
+                print("\033[91mERROR: After the nodes have been added in sequence, the graph is no longer connected.\033[0m")
                 break
 
             if num_nodes_added_already == num_nodes_add:
-                print("Number of nodes AFTER SEQ DROP: ", len(all_nodes))
+                print("Number of nodes AFTER SEQ ADD: ", len(all_nodes))
                 ADDED_FLAG = True
 
+        if timer: t = timer.lap("topology", t)
 
         # uniformly select random node i
-        node_i = random.choice(all_nodes)
+        node_i = csr.random_node()
+        if timer: t = timer.lap("select", t)
         
         # uniformly select a neighbor of node i      
-        neighbors_i = list(nx.all_neighbors(graph, node_i))
-        rand_neigh = random.choice(neighbors_i) 
+        rand_neigh = csr.random_neighbor(node_i)
+        if timer: t = timer.lap("neighbor", t)
 
         # x(k) = avg(x_i, one_rand_neighbor)
-        cur_temp = all_temps[node_i]
-        neigh_temp = all_temps[rand_neigh]
+        cur_temp = x[node_i]
+        neigh_temp = x[rand_neigh]
         avg = (cur_temp + neigh_temp)/2
-        all_temps.update({node_i: avg, rand_neigh: avg})
+        x[node_i] = avg
+        x[rand_neigh] = avg
+        tracker.update(cur_temp, avg)
+        tracker.update(neigh_temp, avg)
 
         # TRANSMISSIONS: per iteration of while loop = 1
         transmissions += 1
+        if timer: t = timer.lap("update", t)
 
         # update values for plotting later
-        std_dev = statistics.stdev(list(all_temps.values()))
-        std_devs.append((transmissions, std_dev))
+        std_dev = tracker.stdev()
+        std_devs.append(transmissions, std_dev)
 
-        # print("length of list of all_temps values", len(list(all_temps.values())))
         # e(k) = || . ||
-        errors.append((transmissions, np.linalg.norm(list(all_temps.values()) - np.ones(len(list(all_temps.values()))) * true_avg)**2))
+        errors.append(transmissions, tracker.error)
+        if timer: t = timer.lap("record", t)
     
 
     end_time = time.time()
     execution_time = end_time - start_time
     print("Execution time:", execution_time, "seconds")
     print("Transmissions: ", transmissions)
-    print("Average: ", list(all_temps.values())[0])
+    print("Average: ", x[0])
+    if timer: timer.report("random_gossip_dropadd")
 
-    return list(all_temps.values())[0], std_devs, errors, transmissions
+    return x[0], std_devs, errors, transmissions
 
 
@@ -0,0 +1,167 @@
+import json
+import os
+import shutil
+import numpy as np
+
+'''
+ON-DISK RESULT STORE
+using ResultStore(directory) with run_experiments(..., store=store) to keep every result,
+then store.results() to plot again without rerunning (traces are opened as np.memmap)
+'''
+def key_name(key):
+    # directory / file name for an experiment key, e.g. ("rg_tf", 0.25) -> rg_tf_0.25
+    parts = key if isinstance(key, tuple) else (key,)
+    return "_".join(str(part) for part in parts)
+
+
+class StoredTrace:
+    '''
+    A (transmissions, value) trace saved as two .npy columns, opened read-only with mmap_mode="r",
+    so only the pages that are plotted or compared are read from disk.
+    Works wherever a TraceRecorder does (arrays(), iteration as pairs, len, indexing).
+    '''
+    def __init__(self, t_path, v_path):
+        self.t_path = t_path
+        self.v_path = v_path
+
+    def arrays(self):
+        return np.load(self.t_path, mmap_mode="r"), np.load(self.v_path, mmap_mode="r")
+
+    def __len__(self):
+        return len(self.arrays()[0])
+
+    def __iter__(self):
+        transmissions, values = self.arrays()
+        return zip(transmissions.tolist(), values.tolist())
+
+    def __getitem__(self, k):
+        transmissions, values = self.arrays()
+        return int(transmissions[k]), float(values[k])
+
+
+class ResultStore:
+    '''
+    Directory with one subdirectory per run and a small index.json:
+        index.json          list of metadata dicts, one per run:
+                            key, algorithm, N, radius, c, failure_rate, seed, wall_time, params, fields
+        <key_name>/k_t.npy, k_v.npy    element k of the result tuple if it is a trace (TraceRecorder or (t, value) list)
+        <key_name>/k.npy               element k if it is an array (Monte-Carlo envelopes, grids)
+    Scalars (average, transmissions) are kept in the index. Saving a key again replaces the old run.
+    Runs are found by their key, not by their directory: a different key with the same key_name (("pd", 0.4)
+    and "pd_0.4") gets its own directory <key_name>-2, -3, ... instead of replacing the other run.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.json")
+        self.index = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+
+    def save(self, key, result, algorithm, params=None, graph=None, seed=None, wall_time=None):
+        '''
+        Store one algorithm result (the tuple it returned) with its metadata.
+        params should include the defaults of the algorithm (see experiments._run_one), graph gives N and
+        the radius it was built with, seed is a np.random.SeedSequence or an int.
+        '''
+        params = dict(params or {})
+        old = self._find(key)
+        if old is not None:
+            name = old["name"]
+        else:
+            name = key_name(key)
+            taken = {run["name"] for run in self.index}
+            suffix = 2
+            while name in taken:
+                name = key_name(key) + "-" + str(suffix)
+                suffix += 1
+        run_dir = os.path.join(self.directory, name)
+        if os.path.exists(run_dir):
+            shutil.rmtree(run_dir)
+        os.makedirs(run_dir)
+
+        fields = []
+        for k, item in enumerate(result):
+            if hasattr(item, "arrays") or (isinstance(item, list) and item and isinstance(item[0], tuple)):
+                if hasattr(item, "arrays"):
+                    transmissions, values = item.arrays()
+                else:
+                    transmissions = np.array([t for t, _ in item], dtype=np.int64)
+                    values = np.array([v for _, v in item], dtype=np.float64)
+                np.save(os.path.join(run_dir, str(k) + "_t.npy"), transmissions)
+                np.save(os.path.join(run_dir, str(k) + "_v.npy"), values)
+                fields.append("trace")
+            elif isinstance(item, np.ndarray) and item.ndim > 0:
+                np.save(os.path.join(run_dir, str(k) + ".npy"), item)
+                fields.append("array")
+            else:
+                fields.append(_to_json(item))
+
+        if isinstance(seed, np.random.SeedSequence):
+            seed = {"entropy": seed.entropy, "spawn_key": list(seed.spawn_key)}
+        entry = {
+            "key": list(key) if isinstance(key, tuple) else key,
+            "name": name,
+            "algorithm": algorithm,
+            "N": graph.number_of_nodes() if graph is not None else None,
+            "radius": graph.graph.get("radius") if graph is not None else None,
+            "c": params.get("c"),
+            "failure_rate": params.get("FAILURE_RATE", 0.0),
+            "seed": seed,
+            "wall_time": wall_time,
+            "params": {k: _to_json(v) for k, v in params.items()},
+            "fields": fields,
+        }
+        self.index = [run for run in self.index if run["name"] != name] + [entry]
+        with open(self.index_path, "w") as f:
+            json.dump(self.index, f, indent=1)
+        return entry
+
+    def runs(self, **filters):
+        # metadata of all stored runs matching the filters, e.g. runs(algorithm="pdmm_async", N=200)
+        return [run for run in self.index if all(run.get(k) == v for k, v in filters.items())]
+
+    def load(self, key):
+        '''
+        The stored result tuple of key, traces as StoredTrace and arrays as read-only np.memmap.
+        '''
+        run = self._find(key)
+        if run is None:
+            print("\033[91mERROR: no stored run for " + str(key) + ".\033[0m")
+            return None
+        run_dir = os.path.join(self.directory, run["name"])
+        result = []
+        for k, field in enumerate(run["fields"]):
+            if field == "trace":
+                result.append(StoredTrace(os.path.join(run_dir, str(k) + "_t.npy"), os.path.join(run_dir, str(k) + "_v.npy")))
+            elif field == "array":
+                result.append(np.load(os.path.join(run_dir, str(k) + ".npy"), mmap_mode="r"))
+            else:
+                result.append(field)
+        return tuple(result)
+
+    def _find(self, key):
+        # index entry of key (keys are stored as json, tuples as lists), None if it was never saved
+        return next((run for run in self.index if _from_json_key(run["key"]) == key), None)
+
+    def results(self, **filters):
+        # {key: result} for every stored run matching the filters, same layout as run_experiments returns
+        return {_from_json_key(run["key"]): self.load(_from_json_key(run["key"])) for run in self.runs(**filters)}
+
+
+def _to_json(value):
+    # numpy scalars and other values that json cannot write are stored as python numbers or strings
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _to_json(v) for k, v in value.items()}
+    return str(value)
+
+
+def _from_json_key(key):
+    return tuple(key) if isinstance(key, list) else key
@@ -0,0 +1,145 @@
+import numpy as np
+from itertools import product
+
+from csrgraph import CSRGraph
+
+'''
+FAST RANDOM GEOMETRIC GRAPH
+using random_geometric_csr() to get a CSRGraph directly (no networkx, no plotting)
+or utils.generate_rgg() for a networkx graph built on top of it
+'''
+def rgg_edges(points, radius, block=1 << 17):
+    '''
+    All pairs (i, j), i < j, with ||p_i - p_j||_2 <= radius, for points in the unit cube.
+    Grid bucketing: the cube is split into m^dim cells of side 1/m >= radius, so every neighbor of a point lies
+    in its own cell or in one of the adjacent cells. Points are sorted by cell, after which every cell is a
+    contiguous range, and the candidate pairs for a block of points are generated with np.repeat per
+    cell offset. Only half of the offsets are visited so every pair is found once.
+    Expects points already sorted by cell (see _sort_by_cell).
+    '''
+    n, dim = points.shape
+    m = max(1, int(np.floor(1 / radius)))
+    coords = np.minimum((points * m).astype(np.int64), m - 1)
+    cell = np.ravel_multi_index(coords.T, (m,) * dim)
+    start = np.searchsorted(cell, np.arange(m**dim + 1))
+
+    # zero offset (same cell, j > i) plus the lexicographically positive half of the other offsets
+    offsets = [o for o in product((-1, 0, 1), repeat=dim) if o > (0,) * dim]
+    offsets = [(0,) * dim] + offsets
+    r2 = radius * radius
+    columns = [np.ascontiguousarray(points[:, d]) for d in range(dim)]
+
+    src_all, dst_all = [], []
+    for lo in range(0, n, block):
+        hi = min(lo + block, n)
+        ids = np.arange(lo, hi)
+        for offset in offsets:
+            target = coords[lo:hi] + np.array(offset)
+            valid = np.all((target >= 0) & (target < m), axis=1)
+            src = ids[valid]
+            target_cell = np.ravel_multi_index(target[valid].T, (m,) * dim)
+            if offset == (0,) * dim:
+                # only points after i in the same cell
+                first = src + 1
+            else:
+                first = start[target_cell]
+            last = start[target_cell + 1]
+            counts = np.maximum(last - first, 0)
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            src = np.repeat(src, counts)
+            dst = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(total)
+            dist2 = np.zeros(total)
+            for column in columns:
+                dist2 += (column[src] - column[dst])**2
+            close = dist2 <= r2
+            src_all.append(src[close])
+            dst_all.append(dst[close])
+
+    if not src_all:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    src = np.concatenate(src_all)
+    dst = np.concatenate(dst_all)
+    return np.minimum(src, dst), np.maximum(src, dst)
+
+
+def _sort_by_cell(points, radius):
+    # reorder the points so every grid cell is a contiguous range (also keeps neighbors close in memory)
+    n, dim = points.shape
+    m = max(1, int(np.floor(1 / radius)))
+    coords = np.minimum((points * m).astype(np.int64), m - 1)
+    order = np.argsort(np.ravel_multi_index(coords.T, (m,) * dim), kind="stable")
+    return points[order]
+
+
+def connected_components(num_nodes, src, dst):
+    '''
+    Component label of every node (the smallest node id in its component) with an array union-find:
+    every round hooks the larger root of each edge under the smaller one, then compresses the paths
+    by pointer jumping until every node points directly at its root.
+    '''
+    parent = np.arange(num_nodes)
+    while True:
+        a = parent[src]
+        b = parent[dst]
+        differ = a != b
+        if not np.any(differ):
+            return parent
+        np.minimum.at(parent, np.maximum(a, b)[differ], np.minimum(a, b)[differ])
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+
+def edges_to_csr(num_nodes, src, dst):
+    # undirected edge list (each edge once) -> indptr, indices with both directions
+    rows = np.concatenate((src, dst))
+    cols = np.concatenate((dst, src))
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(num_nodes + 1, dtype=np.int32)
+    np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+    return indptr, cols[order].astype(np.int32)
+
+
+def random_geometric_csr(num_nodes, radius, dimen=2, values=None, connectivity="reject", max_tries=100, rng=None):
+    '''
+    Random geometric graph on the unit cube [0, 1)^dimen as a CSRGraph, same model as nx.random_geometric_graph
+    (uniform positions, edge when the euclidean distance is <= radius).
+    Node k is the k-th point in grid cell order, which is still a uniformly random labelling of the points.
+
+    values:         measurements per node (length num_nodes), zeros if None
+    connectivity:   "reject"  draw new positions until the graph is connected (like generate_rgg always did),
+                              RuntimeError after max_tries draws
+                    "giant"   keep only the largest connected component, nodes are renumbered 0..k-1
+                    "none"    return the graph as drawn
+    rng:            np.random.Generator, the global np.random state if None
+    '''
+    values = np.zeros(num_nodes) if values is None else np.asarray(values, dtype=np.float64)
+    sample = rng.random if rng is not None else np.random.random_sample
+
+    for _ in range(max_tries):
+        points = _sort_by_cell(sample((num_nodes, dimen)), radius)
+        src, dst = rgg_edges(points, radius)
+        if connectivity == "none":
+            break
+        roots = connected_components(num_nodes, src, dst)
+        if connectivity == "giant":
+            labels, sizes = np.unique(roots, return_counts=True)
+            keep = roots == labels[np.argmax(sizes)]
+            new_id = np.cumsum(keep) - 1
+            edge_keep = keep[src]
+            src, dst = new_id[src[edge_keep]], new_id[dst[edge_keep]]
+            points, values = points[keep], values[keep]
+            num_nodes = len(points)
+            break
+        if np.all(roots == 0):
+            break
+    else:
+        # a disconnected graph never reaches the true average, the algorithms would run until max_iter
+        raise RuntimeError("no connected graph found in " + str(max_tries) + " tries, increase the radius or use connectivity=\"giant\"")
+
+    indptr, indices = edges_to_csr(num_nodes, src, dst)
+    return CSRGraph(range(num_nodes), indptr, indices, values.copy(), points)
@@ -0,0 +1,59 @@
+import numpy as np
+
+'''
+CONFLICT-FREE RUNS OF PAIRWISE AVERAGES
+using conflict_free_runs(node_i, node_j) on a block of pairs, then average_run() on every run: a run of pairs that
+touch different nodes is averaged in one NumPy step (randgoss.random_gossip_batched, eventsim._simulate_runs)
+'''
+def conflict_free_runs(node_i, node_j):
+    '''
+    Boundaries of the maximal runs of the pairs (node_i[k], node_j[k]) in which no node appears twice,
+    run r is the pairs bounds[r]:bounds[r+1]. The pairs of a run touch different nodes, so they can be
+    averaged all at once and give the same x as averaging them one after the other.
+        prev[k]   last earlier pair that shares a node with pair k (-1 if none), from the sorted
+                  keys node*2*size + position (unique, so a plain sort keeps the positions of a node in order)
+        a run starting at s ends at the first k with prev[k] >= s, which is the first k where the
+        running maximum of prev reaches s (one searchsorted for all s, then a walk over the runs)
+    '''
+    size = len(node_i)
+    keys = np.empty(2 * size, dtype=np.int64)
+    keys[0::2] = node_i
+    keys[1::2] = node_j
+    keys = np.sort(keys * (2 * size) + np.arange(2 * size))
+    position = keys % (2 * size)
+    same = keys[1:] // (2 * size) == keys[:-1] // (2 * size)
+    prev_entry = np.full(2 * size, -1, dtype=np.int64)
+    prev_entry[position[1:][same]] = position[:-1][same] // 2
+    prev = np.maximum(prev_entry[0::2], prev_entry[1::2])
+    end = np.searchsorted(np.maximum.accumulate(prev), np.arange(size), side="left")
+
+    bounds = [0]
+    while bounds[-1] < size:
+        bounds.append(int(end[bounds[-1]]))
+    return bounds
+
+
+def average_run(x, tracker, I, J, TOL):
+    '''
+    x_i = x_j = avg(x_i, x_j) for every pair of a conflict-free run (no node twice) in one NumPy step, tracker updated.
+    Averaging x_i and x_j lowers e(k) by (x_i - x_j)^2/2 and keeps the sum of x. e(k) never increases, so when it
+    reaches TOL inside the run only the pairs up to the first one where it does are applied (cumulative sum of the
+    per-pair decrease). Returns the number of pairs applied.
+    '''
+    x_i = x[I]
+    x_j = x[J]
+    avg = (x_i + x_j)/2
+    diff = x_i - x_j
+    decrease = np.dot(diff, diff)/2
+    count = len(I)
+    if tracker.s2 - decrease <= TOL:
+        remaining = tracker.s2 - np.cumsum(diff * diff/2)
+        cut = int(np.searchsorted(-remaining, -TOL, side="left")) + 1
+        if cut < count:
+            count = cut
+            I, J, avg = I[:cut], J[:cut], avg[:cut]
+            decrease = tracker.s2 - remaining[cut - 1]
+    x[I] = avg
+    x[J] = avg
+    tracker.add(0.0, -decrease)
+    return count
@@ -0,0 +1,124 @@
+import numpy as np
+import pickle
+from multiprocessing import shared_memory
+
+from csrgraph import CSRGraph
+
+'''
+NAMED ARRAYS IN SHARED MEMORY
+using SharedArrays.create(layout) in the parent, handle() to the worker processes and SharedArrays.attach(handle)
+there: every process sees the same NumPy arrays without copying them. The parent calls unlink() when done.
+'''
+ALIGN = 64
+
+
+class SharedArrays:
+    '''
+    Several NumPy arrays in one multiprocessing.shared_memory block.
+        layout      list of (name, dtype, shape), every array starts at a multiple of 64 bytes
+        arrays      dict name -> ndarray view on the block (also arrays["name"] as shared["name"])
+    The handle (block name, layout) is small and picklable, a worker attaches in O(1) whatever the size.
+    '''
+    def __init__(self, shm, layout, owner):
+        self.shm = shm
+        self.layout = [(name, np.dtype(dtype).str, tuple(shape)) for name, dtype, shape in layout]
+        self.owner = owner
+        self.arrays = {}
+        offset = 0
+        for name, dtype, shape in self.layout:
+            size = int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+            self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            offset += -(-size // ALIGN) * ALIGN
+
+    @staticmethod
+    def nbytes(layout):
+        return sum(-(-int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize // ALIGN) * ALIGN
+                   for _, dtype, shape in layout)
+
+    @classmethod
+    def create(cls, layout, name=None):
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(cls.nbytes(layout), 1))
+        return cls(shm, layout, owner=True)
+
+    @classmethod
+    def attach(cls, handle):
+        name, layout = handle
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, layout, owner=False)
+
+    def handle(self):
+        return (self.shm.name, self.layout)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def close(self):
+        self.arrays = {}
+        self.shm.close()
+
+    def unlink(self):
+        # close and remove the block (creating process only)
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+'''
+SHARED READ-ONLY GRAPH
+using SharedGraph(graph) once in the parent, handle() in the task arguments instead of the graph and attach_graph(handle)
+in the worker: the graph is published once, a task only carries the handle and attaches in O(1)
+'''
+class GraphHandle:
+    # picklable reference to a SharedGraph: the SharedArrays handle of its block, a few hundred bytes
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+
+class SharedGraph:
+    '''
+    The CSRGraph arrays (indptr, indices, values, pos) and the labels in one SharedArrays block.
+    Labels 0..n-1 are not stored, other labels are stored pickled (as uint8).
+    Built from a networkx graph (CSRGraph.from_networkx) or from a CSRGraph. The parent calls unlink() when the
+    workers are done.
+    '''
+    def __init__(self, graph):
+        csr = graph if isinstance(graph, CSRGraph) else CSRGraph.from_networkx(graph)
+        labels = b"" if csr.labels == list(range(csr.num_nodes)) else pickle.dumps(csr.labels)
+        layout = [("indptr", csr.indptr.dtype, csr.indptr.shape), ("indices", csr.indices.dtype, csr.indices.shape),
+                  ("values", csr.values.dtype, csr.values.shape), ("labels", np.uint8, (len(labels),))]
+        if csr.pos is not None:
+            layout.append(("pos", csr.pos.dtype, csr.pos.shape))
+        self.shared = SharedArrays.create(layout)
+        self.shared["indptr"][:] = csr.indptr
+        self.shared["indices"][:] = csr.indices
+        self.shared["values"][:] = csr.values
+        self.shared["labels"][:] = np.frombuffer(labels, dtype=np.uint8)
+        if csr.pos is not None:
+            self.shared["pos"][:] = csr.pos
+
+    def handle(self):
+        return GraphHandle(self.shared.handle())
+
+    def unlink(self):
+        self.shared.unlink()
+
+
+_attached = {}
+
+
+def attach_graph(handle):
+    '''
+    Read-only CSRGraph on the arrays of a SharedGraph. Built once per process and block (labels, index and degree
+    are O(n) the first time), every later task in the same process gets the same object back.
+    as_csr(graph) gives every run its own copy of the values, writing to the shared arrays raises an error.
+    '''
+    name = handle.arrays[0]
+    if name not in _attached:
+        shared = SharedArrays.attach(handle.arrays)
+        for array in shared.arrays.values():
+            array.flags.writeable = False
+        packed = shared["labels"]
+        labels = pickle.loads(packed.tobytes()) if len(packed) else range(len(shared["values"]))
+        graph = CSRGraph(labels, shared["indptr"], shared["indices"], shared["values"], shared.arrays.get("pos"))
+        _attached[name] = (shared, graph)
+    return _attached[name][1]
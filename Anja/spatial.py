@@ -0,0 +1,78 @@
+import math
+import networkx as nx
+
+'''
+SPATIAL INDEX FOR RANDOM GEOMETRIC GRAPHS
+using GridIndex.from_graph() once per run, then connect() for every added node and remove() for every dropped node
+'''
+class GridIndex:
+    '''
+    Uniform grid (cell list) over the node positions with cell size = connection radius.
+    All nodes within distance r of a point lie in the ceil(r / cell_size) rings of cells around it,
+    so with r = cell_size a query only looks at the 3x3 (3^dim) surrounding cells instead of every node.
+        cells       dict cell -> list of labels in that cell
+        positions   dict label -> position tuple
+    '''
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.positions = {}
+
+    @classmethod
+    def from_graph(cls, graph, radius, attr="pos"):
+        index = cls(radius)
+        for label, pos in nx.get_node_attributes(graph, attr).items():
+            index.insert(label, pos)
+        return index
+
+    def _cell(self, pos):
+        return tuple(int(math.floor(p / self.cell_size)) for p in pos)
+
+    def insert(self, label, pos):
+        pos = tuple(float(p) for p in pos)
+        self.positions[label] = pos
+        self.cells.setdefault(self._cell(pos), []).append(label)
+
+    def remove(self, label):
+        pos = self.positions.pop(label, None)
+        if pos is None:
+            return
+        cell = self._cell(pos)
+        members = self.cells[cell]
+        members.remove(label)
+        if not members:
+            del self.cells[cell]
+
+    def query(self, pos, radius=None):
+        # labels of all indexed nodes with distance <= radius to pos (radius defaults to the cell size)
+        radius = self.cell_size if radius is None else radius
+        rings = max(1, int(math.ceil(radius / self.cell_size)))
+        center = self._cell(pos)
+        found = []
+        for offset in _offsets(len(center), rings):
+            members = self.cells.get(tuple(c + o for c, o in zip(center, offset)))
+            if members is None:
+                continue
+            for label in members:
+                if math.dist(self.positions[label], pos) <= radius:
+                    found.append(label)
+        return found
+
+    def connect(self, graph, label, radius=None, attr="pos"):
+        '''
+        Connect an already added node to every indexed node within radius, then index it.
+        Replaces the loop over graph.nodes() when adding nodes to the random geometric graph.
+        '''
+        pos = graph.nodes[label][attr]
+        for node in self.query(pos, radius):
+            if node != label:
+                graph.add_edge(node, label)
+        self.insert(label, pos)
+
+
+def _offsets(dim, rings):
+    # all cell offsets in {-rings..rings}^dim
+    offsets = [()]
+    for _ in range(dim):
+        offsets = [o + (d,) for o in offsets for d in range(-rings, rings + 1)]
+    return offsets
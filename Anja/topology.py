@@ -0,0 +1,126 @@
+import math
+import random
+import numpy as np
+from collections import deque
+
+'''
+INCREMENTAL NODE DROPS
+using ChurnTracker(graph, x) once per run, then drop() for every node that leaves the network
+select_drops() chooses which nodes fail: random, the highest labels (old behaviour) or a spatial cluster
+'''
+def connected_without(graph, node):
+    '''
+    For a connected graph: is it still connected after removing node?
+    graph - node is connected iff all neighbors of node are still connected to each other, so one BFS is started
+    from every neighbor (never passing through node). The searches take turns expanding one node each and
+    merge when they meet: one search left means connected, a search that runs out of nodes first means the
+    graph falls apart. In a random geometric graph the neighbors of a node are close together, so this only
+    visits a small neighborhood instead of the n + m of nx.is_connected. If node is an articulation point the
+    smallest side runs out first, which costs O(degree of node * size of that side), not a BFS of the large side.
+    '''
+    neighbors = list(graph.adj[node])
+    if len(neighbors) <= 1:
+        return True
+    owner = {v: v for v in neighbors}       # node -> the search that reached it first
+    parent = dict(owner)                    # merged searches (union-find over the starting neighbors)
+    queues = {v: deque([v]) for v in neighbors}
+    turns = deque(neighbors)
+    searches = len(neighbors)
+
+    def find(r):
+        while parent[r] != r:
+            parent[r] = parent[parent[r]]
+            r = parent[r]
+        return r
+
+    while True:
+        r = turns.popleft()
+        if parent[r] != r:
+            continue                        # merged into another search, its queue went there
+        queue = queues[r]
+        u = queue.popleft()
+        for w in graph.adj[u]:
+            if w == node:
+                continue
+            if w not in owner:
+                owner[w] = r
+                queue.append(w)
+                continue
+            other = find(owner[w])
+            if other != r:
+                # the smaller queue is appended to the larger one
+                if len(queues[other]) > len(queue):
+                    queue, queues[other] = queues[other], queue
+                queue.extend(queues.pop(other))
+                queues[r] = queue
+                parent[other] = r
+                searches -= 1
+                if searches == 1:
+                    return True
+        if not queue:
+            return False
+        turns.append(r)
+
+
+class ChurnTracker:
+    '''
+    Keeps the connectivity of the graph and the true average of x up to date while nodes drop out or join one by one.
+        total, count    running sum and number of the values, true_avg = total / count
+    Gossip and averaging steps keep sum(x) constant, so a drop only has to subtract the value of the
+    node that left (or add the one that joined) instead of recomputing np.mean over all nodes.
+    '''
+    def __init__(self, graph, x):
+        self.graph = graph
+        self.total = float(np.sum(x))
+        self.count = len(x)
+        self.connected = True
+
+    @property
+    def true_avg(self):
+        return self.total / self.count
+
+    def drop(self, node, value):
+        '''
+        Remove node (current value value) from the graph. Returns False if that disconnected the graph.
+        '''
+        if self.connected:
+            self.connected = connected_without(self.graph, node)
+        self.graph.remove_node(node)
+        self.total -= value
+        self.count -= 1
+        return self.connected
+
+    def add(self, node, value):
+        '''
+        node (value value) has been added to the graph with its edges. A connected graph stays connected
+        as long as the new node has at least one edge, so only its degree is checked.
+        '''
+        if self.connected:
+            self.connected = self.graph.degree(node) > 0
+        self.total += value
+        self.count += 1
+        return self.connected
+
+
+def select_drops(graph, num, mode="random", attr="pos"):
+    '''
+    Labels of num nodes to drop from graph.
+        "random"    uniformly random nodes (random.sample)
+        "tail"      the last nodes in graph order, only kept for comparing with the old experiments
+        "cluster"   the num nodes closest to a uniformly random point, a spatially correlated failure
+    The array-backed states (CSRGraph.remove_slots/remove_slot, PDMMState.remove_node) handle any of these,
+    the labels of the surviving nodes do not have to stay contiguous.
+    '''
+    nodes = list(graph.nodes)
+    if num <= 0:
+        return []
+    if mode == "random":
+        return random.sample(nodes, num)
+    if mode == "tail":
+        return nodes[-num:]
+    if mode == "cluster":
+        pos = graph.nodes[nodes[0]][attr]
+        center = tuple(random.uniform(0, 1) for _ in pos)
+        return sorted(nodes, key=lambda node: math.dist(graph.nodes[node][attr], center))[:num]
+    print("\033[91mERROR: unknown drop mode " + str(mode) + ".\033[0m")
+    return []
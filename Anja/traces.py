@@ -0,0 +1,183 @@
+import math
+import operator
+import numpy as np
+
+'''
+CONVERGENCE TRACE RECORDER
+using make_traces(trace) in place of std_devs = [] / errors = [], then append(transmissions, value) every step
+the recorders iterate as (transmissions, value) pairs like the old lists, arrays() gives both columns at once
+'''
+SAMPLE = np.dtype([("transmissions", np.int64), ("value", np.float64)])
+
+
+class TraceRecorder:
+    '''
+    Decimated (transmissions, value) trace with bounded memory.
+    mode:
+        "every"      keep every k-th transmission (every=1 keeps everything, like the old lists)
+        "log"        keep points_per_decade samples per factor 10 of transmissions
+        "threshold"  keep a sample whenever the value crosses one of the thresholds (default: points_per_decade
+                     log-spaced levels per decade), in either direction, so drops/adds that raise the error show up
+    Samples go into typed buffers (int64 transmissions, float64 values) that double up to max_points entries.
+    When they are full:
+        path is None    every other sample is dropped and the mode is made twice as coarse
+                        (every k -> 2k, half the points per decade, every other threshold)
+        path given      the buffer is appended to that file (raw SAMPLE records) and reused,
+                        so the full trace ends up on disk and only max_points samples stay in memory
+    The last appended sample is always part of the trace, even if the mode did not keep it.
+    '''
+    def __init__(self, mode="every", every=1, points_per_decade=20, thresholds=None, max_points=1 << 20, path=None):
+        self.mode = mode
+        self.every = every
+        self.ratio = 10 ** (1 / points_per_decade)
+        if thresholds is None:
+            thresholds = np.logspace(-30, 10, 40 * points_per_decade + 1)
+        self.thresholds = np.sort(np.asarray(thresholds, dtype=np.float64))
+        self.max_points = max_points
+        self.path = path
+        if path is not None:
+            open(path, "wb").close()
+        self.on_disk = 0
+        self.t_buffer = np.empty(min(1024, max_points), dtype=np.int64)
+        self.v_buffer = np.empty(min(1024, max_points))
+        self.size = 0
+        self.last_t = None
+        self.last_value = None
+        self._kept_t = None         # transmissions of the last kept sample (in the buffer or on disk)
+        # next sample is kept when t >= _next_t and value is outside (_low, _high)
+        # every/log: the interval is empty, so only t decides. threshold: t is always due
+        self._next_t = 0
+        self._low = math.inf
+        self._high = -math.inf
+
+    def append(self, t, value):
+        self.last_t = t
+        self.last_value = value
+        if t >= self._next_t and not (self._low < value < self._high):
+            self._record(t, value)
+
+    def next_due(self):
+        # smallest t that append() can keep (threshold mode: every t, the value decides), so a loop can skip
+        # computing values that would be dropped and append the last one after the loop
+        return self._next_t
+
+    def _record(self, t, value):
+        size = self.size
+        if size == len(self.t_buffer):
+            if size < self.max_points:
+                self._grow()
+            elif self.path is not None:
+                self._flush()
+            else:
+                self._decimate()
+            size = self.size
+        self.t_buffer[size] = t
+        self.v_buffer[size] = value
+        self.size = size + 1
+        self._kept_t = t
+        if self.mode == "every":
+            self._next_t = t + self.every
+        else:
+            self._schedule(t, value)
+
+    def _grow(self):
+        capacity = min(max(2 * len(self.t_buffer), 1024), self.max_points)
+        t_buffer = np.empty(capacity, dtype=np.int64)
+        v_buffer = np.empty(capacity)
+        t_buffer[:self.size] = self.t_buffer[:self.size]
+        v_buffer[:self.size] = self.v_buffer[:self.size]
+        self.t_buffer, self.v_buffer = t_buffer, v_buffer
+
+    def _schedule(self, t, value):
+        if self.mode == "every":
+            self._next_t = t + self.every
+        elif self.mode == "log":
+            self._next_t = max(t + 1, math.ceil(t * self.ratio))
+        elif self.mode == "threshold":
+            k = np.searchsorted(self.thresholds, value)
+            self._low = self.thresholds[k - 1] if k > 0 else -math.inf
+            self._high = self.thresholds[k] if k < len(self.thresholds) else math.inf
+
+    def _flush(self):
+        records = np.empty(self.size, dtype=SAMPLE)
+        records["transmissions"] = self.t_buffer[:self.size]
+        records["value"] = self.v_buffer[:self.size]
+        with open(self.path, "ab") as f:
+            records.tofile(f)
+        self.on_disk += self.size
+        self.size = 0
+
+    def _decimate(self):
+        size = (self.size + 1) // 2
+        self.t_buffer[:size] = self.t_buffer[:self.size:2].copy()
+        self.v_buffer[:size] = self.v_buffer[:self.size:2].copy()
+        self.size = size
+        self.every *= 2
+        self.ratio *= self.ratio
+        self.thresholds = self.thresholds[::2]
+        self._schedule(int(self.t_buffer[size - 1]), float(self.v_buffer[size - 1]))
+
+    def arrays(self):
+        # transmissions (int64) and values (float64) of all kept samples (read back from disk if needed),
+        # plus the last appended one, ready for plotting
+        t_parts = []
+        v_parts = []
+        if self.on_disk:
+            records = np.fromfile(self.path, dtype=SAMPLE)
+            t_parts.append(records["transmissions"])
+            v_parts.append(records["value"])
+        t_parts.append(self.t_buffer[:self.size])
+        v_parts.append(self.v_buffer[:self.size])
+        if self._has_tail():
+            t_parts.append(np.array([self.last_t], dtype=np.int64))
+            v_parts.append(np.array([self.last_value], dtype=np.float64))
+        return np.concatenate(t_parts), np.concatenate(v_parts)
+
+    def _has_tail(self):
+        # the last appended sample was not kept by the mode and is added at the end
+        return self.last_t is not None and self.last_t != self._kept_t
+
+    def __len__(self):
+        return self.on_disk + self.size + self._has_tail()
+
+    def __iter__(self):
+        transmissions, values = self.arrays()
+        return zip(transmissions.tolist(), values.tolist())
+
+    def __getitem__(self, k):
+        # one sample without building the arrays: from the file (a single record), the buffer or the last one
+        n = len(self)
+        k = operator.index(k)
+        if k < 0:
+            k += n
+        if not 0 <= k < n:
+            raise IndexError("trace index out of range")
+        if k < self.on_disk:
+            with open(self.path, "rb") as f:
+                f.seek(k * SAMPLE.itemsize)
+                record = np.fromfile(f, dtype=SAMPLE, count=1)[0]
+            return int(record["transmissions"]), float(record["value"])
+        k -= self.on_disk
+        if k < self.size:
+            return int(self.t_buffer[k]), float(self.v_buffer[k])
+        return int(self.last_t), float(self.last_value)
+
+    def __getstate__(self):
+        # only the used part of the buffers is pickled (results coming back from the process pool)
+        state = dict(self.__dict__)
+        state["t_buffer"] = self.t_buffer[:self.size].copy()
+        state["v_buffer"] = self.v_buffer[:self.size].copy()
+        return state
+
+
+def make_traces(trace=None):
+    '''
+    std_devs and errors recorders for one run.
+    trace is None (keep every sample) or a dict of TraceRecorder arguments, e.g. {"mode": "log"}.
+    A "path" in trace is used as prefix: path + "_std.trace" and path + "_err.trace".
+    '''
+    trace = dict(trace or {})
+    path = trace.pop("path", None)
+    if path is None:
+        return TraceRecorder(**trace), TraceRecorder(**trace)
+    return TraceRecorder(path=path + "_std.trace", **trace), TraceRecorder(path=path + "_err.trace", **trace)
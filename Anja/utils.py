@@ -3,6 +3,8 @@ import networkx as nx
 import numpy as np
 import matplotlib.pyplot as plt
 
+from rgg import random_geometric_csr
+
 '''
 GENERATING RANDOM GEOMETRIC GRAPH
 using generate_rgg(), generate_measurements(), vector_to_dict
@@ -15,23 +17,20 @@ def generate_measurements(num_nodes):
          y[i] = t + n[i]
     return y
 
-def generate_rgg(num_nodes, radius, dimen, meas):
-    # assuming a connected graph -- do we need to consider non connected graphs?
-    is_connected = False
-    while(not is_connected):
-        rgg = nx.random_geometric_graph(num_nodes, radius, dim=dimen, p=2)
-        is_connected = nx.is_connected(rgg)
-
-    pos = nx.get_node_attributes(rgg, 'pos') 
-    nx.draw(rgg, pos, with_labels=True, node_size=300, node_color='skyblue', font_size=12)
+def generate_rgg(num_nodes, radius, dimen, meas, plot=False, connectivity="reject"):
+    # connected graph by default (see rgg.random_geometric_csr for "giant"), built with grid bucketing instead of nx
+    values = np.array([meas[k] for k in range(num_nodes)])
+    rgg = random_geometric_csr(num_nodes, radius, dimen, values, connectivity).to_networkx()
 
-    plt.axis('equal')
-    plt.xlabel('100 km^2')
-    plt.ylabel('100 km^2')
-    plt.title("Graph of {} nodes with radius {} and dimension {}".format(num_nodes, radius, dimen))  # Modified title
-    plt.show()
+    if plot:
+        pos = nx.get_node_attributes(rgg, 'pos') 
+        nx.draw(rgg, pos, with_labels=True, node_size=300, node_color='skyblue', font_size=12)
 
-    nx.set_node_attributes(rgg, meas, "temp")
+        plt.axis('equal')
+        plt.xlabel('100 km^2')
+        plt.ylabel('100 km^2')
+        plt.title("Graph of {} nodes with radius {} and dimension {}".format(num_nodes, radius, dimen))  # Modified title
+        plt.show()
 
     return rgg
 
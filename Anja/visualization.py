@@ -3,12 +3,20 @@ import matplotlib.pyplot as plt
 from math import log
 import networkx as nx
 
+from eventsim import time_axis
+
 '''
 PLOTTING CONVERGENCE TIME e(k)
 ''' 
+def trace_columns(array):
+    # transmissions and values of a TraceRecorder or results.StoredTrace (read directly, no tuples)
+    # or of a list of (transmissions, value)
+    if hasattr(array, "arrays"):
+        return array.arrays()
+    return [x for x, _ in array], [y for _, y in array]
+
 def plot_single_error(array, name):
-    x_values = [x for x, _ in array]
-    y_values = [y for _, y in array]
+    x_values, y_values = trace_columns(array)
     plt.plot(x_values, y_values)
     plt.xlabel('Transmissions')
     plt.ylabel('||x_k - x_avg||^2')
@@ -19,8 +27,7 @@ def plot_single_error(array, name):
 
 def plot_multiple_pairs(pairs, plot_name='e(k) vs. Transmissions'):
     for array, name in pairs:
-        x_values = [x for x, _ in array]
-        y_values = [y for _, y in array]
+        x_values, y_values = trace_columns(array)
         plt.plot(x_values, y_values, label=name)
     plt.xlabel('Transmissions')
     plt.ylabel('||x_k - x_avg||^2')
@@ -29,6 +36,35 @@ def plot_multiple_pairs(pairs, plot_name='e(k) vs. Transmissions'):
     plt.legend([name for _, name in pairs])
     plt.show()
 
+def plot_time_pairs(runs, plot_name='e(k) vs. Simulated Time'):
+    # runs: (errors, clock, name) of event-driven runs (eventsim.py), e(k) against simulated seconds
+    for errors, clock, name in runs:
+        x_values, y_values = time_axis(errors, clock)
+        plt.plot(x_values, y_values, label=name)
+    plt.xlabel('Simulated time (s)')
+    plt.ylabel('||x_k - x_avg||^2')
+    plt.title(plot_name, fontweight='bold')
+    plt.yscale('log')
+    plt.legend([name for _, _, name in runs])
+    plt.show()
+
+def plot_stored_runs(store, runs, plot_name='e(k) vs. Transmissions'):
+    # runs: (key, name) of runs in a results.ResultStore, e(k) is read from the memory-mapped columns
+    plot_multiple_pairs([(store.load(key)[2], name) for key, name in runs], plot_name)
+
+def plot_envelopes(runs, plot_name='e(k) vs. Transmissions (Monte-Carlo)'):
+    # runs: (grid, envelope, name) from montecarlo.py, envelope rows are the quantiles (0.05, 0.25, 0.5, 0.75, 0.95)
+    for grid, envelope, name in runs:
+        line, = plt.plot(grid, envelope[2], label=name)
+        plt.fill_between(grid, envelope[1], envelope[3], color=line.get_color(), alpha=0.3)
+        plt.fill_between(grid, envelope[0], envelope[4], color=line.get_color(), alpha=0.1)
+    plt.xlabel('Transmissions')
+    plt.ylabel('||x_k - x_avg||^2')
+    plt.title(plot_name, fontweight='bold')
+    plt.yscale('log')
+    plt.legend()
+    plt.show()
+
 def plot_rgg_side_by_side(rgg1, rgg2, name='Modified Graph'):
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 5))
     
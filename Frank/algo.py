@@ -3,91 +3,133 @@ import matplotlib.pyplot as plt
 import networkx as nx
 from utils import *
 import random
+from scipy.sparse import csr_matrix
 # np.random.seed(10)
 
 ####Asynchronous algorithms
-def random_gossip(temperature, A, tolerance=0.00001):
+def pair_average(temperature, node_i, node_j, avg_temp):
+    """
+    Average the values of node_i and node_j in place (the random gossip update W(i,j)*temperature).
+
+    Returns:
+    float: The change in the loss sum((temperature - avg_temp)**2) caused by the update.
+    """
+    t_i = temperature[node_i]
+    t_j = temperature[node_j]
+    avg = (t_i + t_j) / 2
+    temperature[node_i] = avg
+    temperature[node_j] = avg
+    return 2 * (avg - avg_temp)**2 - (t_i - avg_temp)**2 - (t_j - avg_temp)**2
+
+def random_gossip(temperature, A, tolerance=0.00001, profile=False):
     """
     Perform random gossip algorithm to update the temperature values.
 
+    Each exchange is an O(1) pair average and the loss is updated from the two changed values.
+    The loss is recomputed exactly every num_nodes exchanges, whenever it has dropped by a factor 1000
+    since the last recomputation, and before declaring convergence, so rounding errors stay far below tolerance.
+
     Parameters:
     temperature (numpy.ndarray): The initial temperature values for each node.
     num_nodes (int): The total number of nodes in the network.
-    A (numpy.ndarray): The adjacency matrix representing the network connections.
+    A (numpy.ndarray or scipy.sparse matrix): The adjacency matrix representing the network connections.
     tolerance (float, optional): The convergence tolerance. Defaults to 0.00001.
+    profile (bool, optional): Time every phase of the loop and print a table per phase (PhaseTimer). Defaults to False.
 
     Returns:
     numpy.ndarray: The loss values at each iteration until convergence.
 
     """
     num_nodes = np.shape(A)[0]
+    indptr, indices = calc_neighbor_arrays(A)
+    shape = np.shape(temperature)
+    temperature = np.array(temperature, dtype=float).reshape(-1)
     converged = False
-    loss = np.array([])
+    loss = LossBuffer()
     avg_temp = np.mean(temperature)
+    err = err_ref = np.sum((temperature - avg_temp)**2)
+    since_exact = 0
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged:
         node_i = int(np.random.uniform(low=0, high=num_nodes))
-        i_neigh = np.transpose(np.nonzero(A[node_i, :]))
-        j_index = int(np.random.uniform(low=0, high=np.shape(i_neigh)[0]))
-        node_j = i_neigh[j_index][0]
+        if timer: t = timer.lap("select", t)
+        j_index = int(np.random.uniform(low=0, high=indptr[node_i + 1] - indptr[node_i]))
+        node_j = indices[indptr[node_i] + j_index]
+        if timer: t = timer.lap("neighbor", t)
 
         # update equation
-        W = W_construct_rand_gossip(node_i, node_j, num_nodes)
-        temperature = np.dot(W, temperature)
-        # avg=(temperature[node_i]+temperature[node_j])/2
-        # temperature[node_i]=avg
-        # temperature[node_j]=avg
-
-        if np.sum((temperature - avg_temp)**2)< tolerance:
-            loss = np.append(loss, np.sum((temperature - avg_temp)**2))
+        err += pair_average(temperature, node_i, node_j, avg_temp)
+        since_exact += 1
+        if timer: t = timer.lap("update", t)
+        if since_exact >= num_nodes or err < 1e-3 * err_ref or err < tolerance:
+            err = err_ref = np.sum((temperature - avg_temp)**2)
+            since_exact = 0
+
+        loss.append(err)
+        if err < tolerance:
             converged = True
-        else:
-            loss= np.append(loss, np.sum((temperature - avg_temp)**2))
+        if timer: t = timer.lap("loss", t)
     # print(temperature[0:5])
-    return loss,temperature
+    if timer: timer.report("random_gossip")
+    return loss.to_array(),temperature.reshape(shape)
 
-def random_gossip_TF(temperature, A, tolerance=0.00001, transmission_failure=0.1):
+def random_gossip_TF(temperature, A, tolerance=0.00001, transmission_failure=0.1, profile=False):
     """
     Perform random gossip algorithm to update the temperature values.
 
+    Same O(1) pair update and loss bookkeeping as random_gossip.
+
     Parameters:
     temperature (numpy.ndarray): The initial temperature values for each node.
     num_nodes (int): The total number of nodes in the network.
-    A (numpy.ndarray): The adjacency matrix representing the network connections.
+    A (numpy.ndarray or scipy.sparse matrix): The adjacency matrix representing the network connections.
     tolerance (float, optional): The convergence tolerance. Defaults to 0.00001.
+    profile (bool, optional): Time every phase of the loop and print a table per phase (PhaseTimer). Defaults to False.
 
     Returns:
     numpy.ndarray: The loss values at each iteration until convergence.
 
     """
     num_nodes = np.shape(A)[0]
+    indptr, indices = calc_neighbor_arrays(A)
+    shape = np.shape(temperature)
+    temperature = np.array(temperature, dtype=float).reshape(-1)
     converged = False
-    loss = np.array([])
+    loss = LossBuffer()
     avg_temp = np.mean(temperature)
+    err = err_ref = np.sum((temperature - avg_temp)**2)
+    since_exact = 0
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged:
         #transmission failure
         if np.random.uniform(low=0, high=1)<transmission_failure:
-            loss= np.append(loss, np.sum((temperature - avg_temp)**2))
+            loss.append(err)
+            if timer: t = timer.lap("failure", t)
             continue
         node_i = int(np.random.uniform(low=0, high=num_nodes))
-        i_neigh = np.transpose(np.nonzero(A[node_i, :]))
-        j_index = int(np.random.uniform(low=0, high=np.shape(i_neigh)[0]))
-        node_j = i_neigh[j_index][0]
+        if timer: t = timer.lap("select", t)
+        j_index = int(np.random.uniform(low=0, high=indptr[node_i + 1] - indptr[node_i]))
+        node_j = indices[indptr[node_i] + j_index]
+        if timer: t = timer.lap("neighbor", t)
 
         # update equation
-        W = W_construct_rand_gossip(node_i, node_j, num_nodes)
-        temperature = np.dot(W, temperature)
-        # avg=(temperature[node_i]+temperature[node_j])/2
-        # temperature[node_i]=avg
-        # temperature[node_j]=avg
-
-        if np.sum((temperature - avg_temp)**2)< tolerance:
-            loss = np.append(loss, np.sum((temperature - avg_temp)**2))
+        err += pair_average(temperature, node_i, node_j, avg_temp)
+        since_exact += 1
+        if timer: t = timer.lap("update", t)
+        if since_exact >= num_nodes or err < 1e-3 * err_ref or err < tolerance:
+            err = err_ref = np.sum((temperature - avg_temp)**2)
+            since_exact = 0
+
+        loss.append(err)
+        if err < tolerance:
             converged = True
-        else:
-            loss= np.append(loss, np.sum((temperature - avg_temp)**2))
-    return loss,temperature
+        if timer: t = timer.lap("loss", t)
+    if timer: timer.report("random_gossip_TF")
+    return loss.to_array(),temperature.reshape(shape)
 
-def random_gossip_node_change(temperature, G,pos,true_temp,var, r_c,tolerance=0.00001,node_change_status="add_bulk",averaging_method="update", max_iter=100000,node_change_p=0.1):
+def random_gossip_node_change(temperature, G,pos,true_temp,var, r_c,tolerance=0.00001,node_change_status="add_bulk",averaging_method="update", max_iter=100000,node_change_p=0.1,removal="tail", profile=False):
     """
     Perform random gossip algorithm to update the temperature values.
 
@@ -96,23 +138,30 @@ def random_gossip_node_change(temperature, G,pos,true_temp,var, r_c,tolerance=0.
     num_nodes (int): The total number of nodes in the network.
     A (numpy.ndarray): The adjacency matrix representing the network connections.
     tolerance (float, optional): The convergence tolerance. Defaults to 0.00001.
+    removal (str, optional): "tail" removes the highest label (the original experiments), "random" uniformly random nodes (swap_remove_node). Defaults to "tail".
+    profile (bool, optional): Time every phase of the loop and print a table per phase (PhaseTimer). Defaults to False.
 
     Returns:
     numpy.ndarray: The loss values at each iteration until convergence.
 
     """
     print("Started RG node change algorithm num_nodes ",G.number_of_nodes())
+    grid = GridIndex(pos, r_c * 100)
     A = nx.adjacency_matrix(G).toarray()
     num_nodes = np.shape(A)[0]
     converged = False
     loss = np.array([])
     avg_temp = np.mean(temperature)
     iter=0
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged and iter<max_iter:
         node_i = int(np.random.uniform(low=0, high=num_nodes))
+        if timer: t = timer.lap("select", t)
         i_neigh = np.transpose(np.nonzero(A[node_i, :]))
         j_index = int(np.random.uniform(low=0, high=np.shape(i_neigh)[0]))
         node_j = i_neigh[j_index][0]
+        if timer: t = timer.lap("neighbor", t)
 
         # update equation
         # W = W_construct_rand_gossip(node_i, node_j, num_nodes)
@@ -120,6 +169,7 @@ def random_gossip_node_change(temperature, G,pos,true_temp,var, r_c,tolerance=0.
         avg=(temperature[node_i]+temperature[node_j])/2
         temperature[node_i]=avg
         temperature[node_j]=avg
+        if timer: t = timer.lap("update", t)
 
         #implement removing/adding of nodes
         if node_change_status=="add_bulk" and  iter ==20000:
@@ -127,27 +177,30 @@ def random_gossip_node_change(temperature, G,pos,true_temp,var, r_c,tolerance=0.
             for i in range(1,num_add):
                 #add one node, update graph, temperature and number of nodes
                 num_nodes =num_nodes+1
-                G,pos=add_node_to_graph(G,pos,num_nodes,r_c)
-                A = nx.adjacency_matrix(G).toarray()
+                G,pos=add_node_to_graph(G,pos,num_nodes,r_c,grid)
                 new_temp=np.random.normal(true_temp, np.sqrt(var))
                 temperature=np.append(temperature,new_temp)
                 if averaging_method=="update":
                     avg_temp = (avg_temp*(num_nodes-1)+new_temp)/num_nodes
+            A = nx.adjacency_matrix(G).toarray()
         elif node_change_status=="remove_bulk" and  iter ==20000:
             num_rem=int(G.number_of_nodes()*node_change_p)
             for i in range(1,num_rem):
                 #remove one node, update graph, temperature and number of nodes
-                node_ids_list = sorted(list(G.nodes()))
-                G.remove_node(node_ids_list[-1])
+                node = pick_node_to_remove(num_nodes, removal)
+                swap_remove_node(G, pos, node, grid=grid)
                 num_nodes =num_nodes-1
-                A = nx.adjacency_matrix(G).toarray()
-                old_temp=temperature[num_nodes]
-                temperature=np.delete(temperature,-1)
+                old_temp=np.copy(temperature[node])
+                temperature[node]=temperature[num_nodes]
+                temperature=temperature[:num_nodes]
 
                 if averaging_method=="update":
                     # avg_temp = (avg_temp*(num_nodes+1)-old_temp)/num_nodes
                     avg_temp = np.mean(temperature)
+            # labels stay 0..n-1, rows of A follow the labels
+            A = nx.adjacency_matrix(G, nodelist=range(num_nodes)).toarray()
 
+        if timer: t = timer.lap("topology", t)
         iter =iter+1
         if np.sum((temperature - avg_temp)**2)< tolerance:
             loss = np.append(loss, np.sum((temperature - avg_temp)**2))
@@ -155,11 +208,13 @@ def random_gossip_node_change(temperature, G,pos,true_temp,var, r_c,tolerance=0.
         else:
             # print(iter,"\t",np.sum((temperature - avg_temp)**2))
             loss= np.append(loss, np.sum((temperature - avg_temp)**2))
+        if timer: t = timer.lap("loss", t)
     print("Finished algorithm num_nodes ",G.number_of_nodes())
+    if timer: timer.report("random_gossip_node_change")
     return loss,temperature
 
 
-def random_gossip_node_change_seq(temperature, G,pos,true_temp,var, r_c,tolerance=0.00001,node_change_status="add",averaging_method="update", max_iter=100000,node_change_p=0.1):
+def random_gossip_node_change_seq(temperature, G,pos,true_temp,var, r_c,tolerance=0.00001,node_change_status="add",averaging_method="update", max_iter=100000,node_change_p=0.1,removal="tail", profile=False):
     """
     Perform random gossip algorithm to update the temperature values.
 
@@ -168,12 +223,15 @@ def random_gossip_node_change_seq(temperature, G,pos,true_temp,var, r_c,toleranc
     num_nodes (int): The total number of nodes in the network.
     A (numpy.ndarray): The adjacency matrix representing the network connections.
     tolerance (float, optional): The convergence tolerance. Defaults to 0.00001.
+    removal (str, optional): "tail" removes the highest label (the original experiments), "random" uniformly random nodes (swap_remove_node). Defaults to "tail".
+    profile (bool, optional): Time every phase of the loop and print a table per phase (PhaseTimer). Defaults to False.
 
     Returns:
     numpy.ndarray: The loss values at each iteration until convergence.
 
     """
     print("Started RG node change algorithm num_nodes ",G.number_of_nodes())
+    grid = GridIndex(pos, r_c * 100)
     A = nx.adjacency_matrix(G).toarray()
     num_nodes = np.shape(A)[0]
     converged = False
@@ -183,11 +241,15 @@ def random_gossip_node_change_seq(temperature, G,pos,true_temp,var, r_c,toleranc
 
     num_change=int(G.number_of_nodes()*node_change_p)
     curr_num=0
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged and iter<max_iter:
         node_i = int(np.random.uniform(low=0, high=num_nodes))
+        if timer: t = timer.lap("select", t)
         i_neigh = np.transpose(np.nonzero(A[node_i, :]))
         j_index = int(np.random.uniform(low=0, high=np.shape(i_neigh)[0]))
         node_j = i_neigh[j_index][0]
+        if timer: t = timer.lap("neighbor", t)
 
         # update equation
         # W = W_construct_rand_gossip(node_i, node_j, num_nodes)
@@ -195,6 +257,7 @@ def random_gossip_node_change_seq(temperature, G,pos,true_temp,var, r_c,toleranc
         avg=(temperature[node_i]+temperature[node_j])/2
         temperature[node_i]=avg
         temperature[node_j]=avg
+        if timer: t = timer.lap("update", t)
 
         #implement removing/adding of nodes
         if node_change_status=="add" and  iter > 20000 and iter%1000==0 and curr_num<num_change: 
@@ -202,7 +265,7 @@ def random_gossip_node_change_seq(temperature, G,pos,true_temp,var, r_c,toleranc
 
             #add one node, update graph, temperature and number of nodes
             num_nodes =num_nodes+1
-            G,pos=add_node_to_graph(G,pos,num_nodes,r_c)
+            G,pos=add_node_to_graph(G,pos,num_nodes,r_c,grid)
             A = nx.adjacency_matrix(G).toarray()
             new_temp=np.random.normal(true_temp, np.sqrt(var))
             temperature=np.append(temperature,new_temp)
@@ -211,18 +274,20 @@ def random_gossip_node_change_seq(temperature, G,pos,true_temp,var, r_c,toleranc
         elif node_change_status=="remove" and  iter > 20000 and iter%1000==0 and curr_num<num_change:
             curr_num=curr_num+1
             #remove one node, update graph, temperature and number of nodes
-            node_ids_list = sorted(list(G.nodes()))
-            G.remove_node(node_ids_list[-1])
+            node = pick_node_to_remove(num_nodes, removal)
+            swap_remove_node(G, pos, node, grid=grid)
             num_nodes =num_nodes-1
-            A = nx.adjacency_matrix(G).toarray()
+            A = nx.adjacency_matrix(G, nodelist=range(num_nodes)).toarray()
             # old_temp=temperature[num_nodes]
-            temperature=np.delete(temperature,-1)
+            temperature[node]=temperature[num_nodes]
+            temperature=temperature[:num_nodes]
 
             if averaging_method=="update":
                 # avg_temp = (avg_temp*(num_nodes+1)-old_temp)/num_nodes
                 avg_temp = np.mean(temperature)
 
                 
+        if timer: t = timer.lap("topology", t)
         iter =iter+1
         if np.sum((temperature - avg_temp)**2)< tolerance:
             loss = np.append(loss, np.sum((temperature - avg_temp)**2))
@@ -230,43 +295,44 @@ def random_gossip_node_change_seq(temperature, G,pos,true_temp,var, r_c,toleranc
         else:
             # print(iter,"\t",np.sum((temperature - avg_temp)**2))
             loss= np.append(loss, np.sum((temperature - avg_temp)**2))
+        if timer: t = timer.lap("loss", t)
     # print("num_nodes ",G.number_of_nodes(),"\t", curr_num,"\t", num_change)
+    if timer: timer.report("random_gossip_node_change_seq")
     return loss,temperature
 
 
 
-def PDMM_async(temperature, G,tolerance=10**-8,c=0.3):
+def PDMM_async(temperature, G,tolerance=10**-8,c=0.3, profile=False):
     num_nodes = G.number_of_nodes()
-    x=np.zeros([num_nodes,1])
+    temperature=np.ravel(temperature)
+    x=np.zeros(num_nodes)
     converged = False
     loss = np.array([])
     avg_temp = np.mean(temperature)
-    #initialise A_ij
-    A_ij=calc_incidence(G)
+    #initialise A_ij, one entry per directed edge, edges of node i are indptr[i]:indptr[i+1]
+    indptr,indices,A_ij,rev=calc_incidence_arrays(G)
+    degree=np.diff(indptr)
 
     #initialise z_ij and y_ij
-    z=dict()
-    y=dict()
-    for i in np.arange(0,num_nodes):
-        for j in G.neighbors(i):
-            z[i,j]=0
-            y[i,j]=0
+    z=np.zeros(len(indices))
+    y=np.zeros(len(indices))
             
     transmissions=[]
     tot_transmissions=0
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged:
         #update x_i and y_ij
         i = int(np.random.uniform(low=0, high=num_nodes))
+        if timer: t = timer.lap("select", t)
+        s,e=indptr[i],indptr[i+1]
         #update x_i
-        x[i]=temperature[i]
-        for j in G.neighbors(i):
-            x[i]=x[i]-A_ij[i,j]*z[i,j]
-        x[i]=x[i]/(1+c*G.degree(i))
+        x[i]=(temperature[i]-np.dot(A_ij[s:e],z[s:e]))/(1+c*degree[i])
         #update y_ij
-        for j in G.neighbors(i):
-            y[i,j]=z[i,j]+2*c*(x[i]*A_ij[i,j])
+        y[s:e]=z[s:e]+2*c*x[i]*A_ij[s:e]
         tot_transmissions=tot_transmissions+1
         transmissions.append(tot_transmissions)
+        if timer: t = timer.lap("update", t)
 
         if np.sum((x- avg_temp)**2)< tolerance:
             loss = np.append(loss, np.sum((x - avg_temp)**2))
@@ -274,49 +340,51 @@ def PDMM_async(temperature, G,tolerance=10**-8,c=0.3):
         else:
             # print(np.sum((x- avg_temp)**2))
             loss= np.append(loss, np.sum((x - avg_temp)**2))
+        if timer: t = timer.lap("loss", t)
   
-        #update z_ij
-        for j in G.neighbors(i):
-            z[i,j]=y[j,i]
+        #update z_ij = y_ji, a single gather through the reverse edge index
+        z[s:e]=y[rev[s:e]]
+        if timer: t = timer.lap("exchange", t)
     # print(x[0:5])
+    if timer: timer.report("PDMM_async")
     return loss,transmissions
 
-def PDMM_async_TF(temperature, G, tolerance=10**-8, c=0.3, transmission_failure=0.1):
+def PDMM_async_TF(temperature, G, tolerance=10**-8, c=0.3, transmission_failure=0.1, profile=False):
     num_nodes = G.number_of_nodes()
-    x = np.zeros([num_nodes, 1])
+    temperature = np.ravel(temperature)
+    x = np.zeros(num_nodes)
     converged = False
     loss = np.array([])
     avg_temp = np.mean(temperature)
 
-    # Initialise A_ij
-    A_ij=calc_incidence(G)
+    # Initialise A_ij, one entry per directed edge, edges of node i are indptr[i]:indptr[i+1]
+    indptr, indices, A_ij, rev = calc_incidence_arrays(G)
+    degree = np.diff(indptr)
     # Initialise z_ij and y_ij
-    z = dict()
-    y = dict()
-    for i in np.arange(0, num_nodes):
-        for j in G.neighbors(i):
-            z[i, j] = 0
-            y[i, j] = 0
+    z = np.zeros(len(indices))
+    y = np.zeros(len(indices))
 
     transmissions = []
     tot_transmissions = 0
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged:
         i = int(np.random.uniform(low=0, high=num_nodes))
+        if timer: t = timer.lap("select", t)
         if np.random.uniform(low=0, high=1) < transmission_failure:
             tot_transmissions += 1
             transmissions.append(tot_transmissions)
             loss = np.append(loss, np.sum((x - avg_temp)**2))
+            if timer: t = timer.lap("failure", t)
             continue
 
+        s, e = indptr[i], indptr[i + 1]
         # Update x_i
-        x[i] = temperature[i]
-        for j in G.neighbors(i):
-            x[i] -= A_ij[i, j] * z[i, j]
-        x[i] /= (1 + c * G.degree(i))
+        x[i] = (temperature[i] - np.dot(A_ij[s:e], z[s:e])) / (1 + c * degree[i])
 
         # Update y_ij
-        for j in G.neighbors(i):
-            y[i, j] = z[i, j] + 2 * c * (x[i] * A_ij[i, j])
+        y[s:e] = z[s:e] + 2 * c * x[i] * A_ij[s:e]
+        if timer: t = timer.lap("update", t)
 
         tot_transmissions += 1
         transmissions.append(tot_transmissions)
@@ -324,15 +392,18 @@ def PDMM_async_TF(temperature, G, tolerance=10**-8, c=0.3, transmission_failure=
 
         if np.sum((x - avg_temp)**2) < tolerance:
             converged = True
+        if timer: t = timer.lap("loss", t)
 
-        # Update z_ij
-        for j in G.neighbors(i):
-            z[i, j] = y[j, i]
+        # Update z_ij = y_ji
+        z[s:e] = y[rev[s:e]]
+        if timer: t = timer.lap("exchange", t)
 
+    if timer: timer.report("PDMM_async_TF")
     return loss, transmissions
 
-def PDMM_async_node_change(temperature , G,pos,true_temp,var,r_c,tolerance=10**-8,c=0.3,node_change_status="add_bulk",averaging_method="update", max_iter=100000,node_change_p=0.1):
+def PDMM_async_node_change(temperature , G,pos,true_temp,var,r_c,tolerance=10**-8,c=0.3,node_change_status="add_bulk",averaging_method="update", max_iter=100000,node_change_p=0.1,removal="tail", profile=False):
     print("Started PDMM node change algorithm num_nodes ",G.number_of_nodes())
+    grid = GridIndex(pos, r_c * 100)
     num_nodes = G.number_of_nodes()
     x=np.zeros([num_nodes,1])
     converged = False
@@ -352,10 +423,13 @@ def PDMM_async_node_change(temperature , G,pos,true_temp,var,r_c,tolerance=10**-
     transmissions=[]
     tot_transmissions=0
     iter=0
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged and iter<max_iter:
         iter = iter+1
         #update x_i and y_ij
         i = int(np.random.uniform(low=0, high=num_nodes))
+        if timer: t = timer.lap("select", t)
         #update x_i
         x[i]=temperature[i]
         for j in G.neighbors(i):
@@ -366,6 +440,7 @@ def PDMM_async_node_change(temperature , G,pos,true_temp,var,r_c,tolerance=10**-
             y[i,j]=z[i,j]+2*c*(x[i]*A_ij[i,j])
         tot_transmissions=tot_transmissions+1
         transmissions.append(tot_transmissions)
+        if timer: t = timer.lap("update", t)
 
         if np.sum((x- avg_temp)**2)< tolerance:
             loss = np.append(loss, np.sum((x - avg_temp)**2))
@@ -373,17 +448,19 @@ def PDMM_async_node_change(temperature , G,pos,true_temp,var,r_c,tolerance=10**-
         else:
             # print(np.sum((x- avg_temp)**2))
             loss= np.append(loss, np.sum((x - avg_temp)**2))
+        if timer: t = timer.lap("loss", t)
 
         #update z_ij
         for j in G.neighbors(i):
             z[i,j]=y[j,i]
+        if timer: t = timer.lap("exchange", t)
         
         #implement removing/adding of nodes
         if node_change_status=="add_bulk" and  iter == 20000:
             num_add=int(G.number_of_nodes()*node_change_p)
             for i in range(1,num_add):
                 #add one node, update graph, temperature and number of nodes
-                G,pos=add_node_to_graph(G,pos,num_nodes,r_c)
+                G,pos=add_node_to_graph(G,pos,num_nodes,r_c,grid)
                 num_nodes =num_nodes+1
                 new_temp=np.random.normal(true_temp, np.sqrt(var))
                 temperature=np.append(temperature,new_temp)
@@ -394,29 +471,34 @@ def PDMM_async_node_change(temperature , G,pos,true_temp,var,r_c,tolerance=10**-
                     z[j,num_nodes-1]=0
                     y[num_nodes-1,j]=0
                     y[j,num_nodes-1]=0
-                A_ij=calc_incidence(G)
                 if averaging_method=="update":
                     avg_temp = (avg_temp*(num_nodes-1)+new_temp)/num_nodes
                     # avg_temp = np.mean(temperature)
+            A_ij=calc_incidence(G)
         elif node_change_status=="remove_bulk" and  iter == 20000:
             num_rem=int(G.number_of_nodes()*node_change_p)
             for i in range(1,num_rem):
                 #remove one node, update graph, temperature and number of nodes
-                node_ids_list = sorted(list(G.nodes()))
-                G.remove_node(node_ids_list[-1])
+                node = pick_node_to_remove(num_nodes, removal)
+                swap_remove_node(G, pos, node, (z, y, A_ij), grid)
                 num_nodes =num_nodes-1
-                old_temp=temperature[num_nodes]
-                temperature=np.delete(temperature,-1)
-                x=np.delete(x,-1)
+                old_temp=np.copy(temperature[node])
+                temperature[node]=temperature[num_nodes]
+                temperature=temperature[:num_nodes]
+                x[node]=x[num_nodes]
+                x=x[:num_nodes]
 
                 if averaging_method=="update":
                     avg_temp = (avg_temp*(num_nodes+1)-old_temp)/num_nodes
+        if timer: t = timer.lap("topology", t)
     # print("num_nodes ",G.number_of_nodes())
+    if timer: timer.report("PDMM_async_node_change")
     return loss,transmissions
 
 
-def PDMM_async_node_change_seq(temperature , G,pos,true_temp,var,r_c,tolerance=10**-8,c=0.3,node_change_status="add",averaging_method="update", max_iter=100000,node_change_p=0.1):
+def PDMM_async_node_change_seq(temperature , G,pos,true_temp,var,r_c,tolerance=10**-8,c=0.3,node_change_status="add",averaging_method="update", max_iter=100000,node_change_p=0.1,removal="tail", profile=False):
     print("Started PDMM node change algorithm num_nodes ",G.number_of_nodes())
+    grid = GridIndex(pos, r_c * 100)
     num_nodes = G.number_of_nodes()
     x=np.zeros([num_nodes,1])
     converged = False
@@ -438,10 +520,13 @@ def PDMM_async_node_change_seq(temperature , G,pos,true_temp,var,r_c,tolerance=1
     iter=0
     num_change=int(G.number_of_nodes()*node_change_p)
     curr_num=0
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged and iter<max_iter:
         iter = iter+1
         #update x_i and y_ij
         i = int(np.random.uniform(low=0, high=num_nodes))
+        if timer: t = timer.lap("select", t)
         #update x_i
         x[i]=temperature[i]
         for j in G.neighbors(i):
@@ -452,6 +537,7 @@ def PDMM_async_node_change_seq(temperature , G,pos,true_temp,var,r_c,tolerance=1
             y[i,j]=z[i,j]+2*c*(x[i]*A_ij[i,j])
         tot_transmissions=tot_transmissions+1
         transmissions.append(tot_transmissions)
+        if timer: t = timer.lap("update", t)
 
         if np.sum((x- avg_temp)**2)< tolerance:
             loss = np.append(loss, np.sum((x - avg_temp)**2))
@@ -459,16 +545,18 @@ def PDMM_async_node_change_seq(temperature , G,pos,true_temp,var,r_c,tolerance=1
         else:
             # print(np.sum((x- avg_temp)**2))
             loss= np.append(loss, np.sum((x - avg_temp)**2))
+        if timer: t = timer.lap("loss", t)
 
         #update z_ij
         for j in G.neighbors(i):
             z[i,j]=y[j,i]
+        if timer: t = timer.lap("exchange", t)
         
         #implement removing/adding of nodes
         if node_change_status=="add" and  tot_transmissions > 20000 and iter%1000==0 and curr_num<num_change: 
             curr_num=curr_num+1
             #add one node, update graph, temperature and number of nodes
-            G,pos=add_node_to_graph(G,pos,num_nodes,r_c)
+            G,pos=add_node_to_graph(G,pos,num_nodes,r_c,grid)
             num_nodes =num_nodes+1
             new_temp=np.random.normal(true_temp, np.sqrt(var))
             temperature=np.append(temperature,new_temp)
@@ -486,23 +574,27 @@ def PDMM_async_node_change_seq(temperature , G,pos,true_temp,var,r_c,tolerance=1
         elif node_change_status=="remove" and  tot_transmissions > 20000 and iter%1000==0 and curr_num<num_change:
             curr_num=curr_num+1
             #remove one node, update graph, temperature and number of nodes
-            node_ids_list = sorted(list(G.nodes()))
-            G.remove_node(node_ids_list[-1])
+            node = pick_node_to_remove(num_nodes, removal)
+            swap_remove_node(G, pos, node, (z, y, A_ij), grid)
             num_nodes =num_nodes-1
-            old_temp=temperature[num_nodes]
-            temperature=np.delete(temperature,-1)
-            x=np.delete(x,-1)
+            old_temp=np.copy(temperature[node])
+            temperature[node]=temperature[num_nodes]
+            temperature=temperature[:num_nodes]
+            x[node]=x[num_nodes]
+            x=x[:num_nodes]
             if averaging_method=="update":
                 avg_temp = (avg_temp*(num_nodes+1)-old_temp)/num_nodes
             iter= iter+1
+        if timer: t = timer.lap("topology", t)
     # print("num_nodes ",G.number_of_nodes(),"\t", curr_num,"\t", num_change)
     
+    if timer: timer.report("PDMM_async_node_change_seq")
     return loss,transmissions
 
 
 
 
-def async_distr_averaging(temperature,A,tolerance):
+def async_distr_averaging(temperature,A,tolerance,profile=False):
     """
     Perform asynchronous distributed averaging algorithm.
 
@@ -511,31 +603,39 @@ def async_distr_averaging(temperature,A,tolerance):
 
     """
     num_nodes = np.shape(A)[0]
+    indptr, indices = calc_neighbor_arrays(A)
     converged = False
     loss_a = np.array([])
     transmissions = np.array([])
     avg_temp = np.mean(temperature)
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged:
         node_i = int(np.random.uniform(low=0, high=num_nodes))
-        i_neigh = np.transpose(np.nonzero(A[node_i, :]))
+        if timer: t = timer.lap("select", t)
+        i_neigh = indices[indptr[node_i]:indptr[node_i+1]]
         num_neigh = np.shape(i_neigh)[0]
+        if timer: t = timer.lap("neighbor", t)
         
         # update equation
         avg_val= (np.sum(temperature[i_neigh])+temperature[node_i]) / (num_neigh+1)
         transmissions = np.append(transmissions, num_neigh+transmissions[-1] if transmissions.size > 0 else num_neigh)
         temperature[node_i] = avg_val
         temperature[i_neigh] = avg_val
+        if timer: t = timer.lap("update", t)
 
         if np.sum((temperature - avg_temp)**2)< tolerance:
             loss_a = np.append(loss_a, np.sum((temperature - avg_temp)**2))
             converged = True
         else:
             loss_a = np.append(loss_a, np.sum((temperature - avg_temp)**2))
+        if timer: t = timer.lap("loss", t)
     # print(temperature[0:5])
+    if timer: timer.report("async_distr_averaging")
     return loss_a,transmissions,temperature
 
 
-def async_distr_averaging_TF(temperature,A,tolerance,tf):
+def async_distr_averaging_TF(temperature,A,tolerance,tf,profile=False):
     """
     Perform asynchronous distributed averaging algorithm.
 
@@ -544,18 +644,23 @@ def async_distr_averaging_TF(temperature,A,tolerance,tf):
 
     """
     num_nodes = np.shape(A)[0]
+    indptr, indices = calc_neighbor_arrays(A)
     converged = False
     loss_a = np.array([0])
     transmissions = np.array([0])
     avg_temp = np.mean(temperature)
     iter=0
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged and transmissions[-1]<100000:
         random_number = random.randint(0, 1)
         
 
         node_i = int(np.random.uniform(low=0, high=num_nodes))
-        i_neigh = np.transpose(np.nonzero(A[node_i, :]))
+        if timer: t = timer.lap("select", t)
+        i_neigh = indices[indptr[node_i]:indptr[node_i+1]]
         num_neigh = np.shape(i_neigh)[0]
+        if timer: t = timer.lap("neighbor", t)
         i_neigh=list(i_neigh)
         if random_number == 1 and np.random.uniform(0,1) < tf:
             num_failures = int(len(i_neigh) * tf)
@@ -565,77 +670,67 @@ def async_distr_averaging_TF(temperature,A,tolerance,tf):
         if random_number == 0 and np.random.uniform(0,1) < tf:
             num_failures = int(len(i_neigh) * tf)
             i_neigh= random.sample(i_neigh, len(i_neigh) - num_failures)
+        if timer: t = timer.lap("failure", t)
         # update equation
         avg_val= (np.sum(temperature[i_neigh])+temperature[node_i]) / (num_neigh+1)
         transmissions = np.append(transmissions, num_neigh+transmissions[-1] if transmissions.size > 0 else num_neigh)
         temperature[node_i] = avg_val
         temperature[i_neigh] = avg_val
+        if timer: t = timer.lap("update", t)
 
         if np.sum((temperature - avg_temp)**2)< tolerance:
             loss_a = np.append(loss_a, np.sum((temperature - avg_temp)**2))
             converged = True
         else:
             loss_a = np.append(loss_a, np.sum((temperature - avg_temp)**2))
+        if timer: t = timer.lap("loss", t)
+    if timer: timer.report("async_distr_averaging_TF")
     return loss_a,transmissions,temperature
 
 ####Synchronous algorithm
-def PDMM_sync(temperature, G,tolerance=10**-8,c=0.1):
+def PDMM_sync(temperature, G,tolerance=10**-8,c=0.1, profile=False):
     num_nodes = G.number_of_nodes()
-    x=np.zeros([num_nodes,1])
-    A_ij=dict()
+    temperature=np.ravel(temperature)
+    x=np.zeros(num_nodes)
     converged = False
-    loss = np.array([])
     avg_temp = np.mean(temperature)
 
-    #initialise A_ij
-    for edge in G.edges:
-        if edge[0] < edge[1]:
-            A_ij[edge[0], edge[1]] = 1
-            A_ij[edge[1], edge[0]] = -1
-        else:
-            A_ij[edge[0], edge[1]] = -1
-            A_ij[edge[1], edge[0]] = -1
+    #initialise A_ij, one entry per directed edge, edges of node i are indptr[i]:indptr[i+1]
+    indptr,indices,A_ij,rev=calc_incidence_arrays(G)
+    degree=np.diff(indptr)
+    src=np.repeat(np.arange(num_nodes),degree)
+    #incidence matrix B (num_nodes x num_edges), B[i,e]=A_ij for the edges e=(i,j) leaving i
+    B=csr_matrix((A_ij.astype(float),np.arange(len(indices)),indptr),shape=(num_nodes,len(indices)))
 
     #initialise z_ij and y_ij
-    z=dict()
-    y=dict()
-    for i in np.arange(0,num_nodes):
-        for j in G.neighbors(i):
-            z[i,j]=0
-            y[i,j]=0
+    z=np.zeros(len(indices))
+    y=np.zeros(len(indices))
             
-    transmissions=[]
+    loss_rounds=[]
     tot_transmissions=0
+    timer = PhaseTimer() if profile else None
+    if timer: t = timer.start()
     while not converged:
-        #update x_i and y_ij
-        
-        for i in  np.arange(0,num_nodes):
-            #update x_i
-            x[i]=temperature[i]
-            for j in G.neighbors(i):
-                x[i]=x[i]-A_ij[i,j]*z[i,j]
-            x[i]=x[i]/(1+c*G.degree(i))
-            #update y_ij
-            for j in G.neighbors(i):
-                y[i,j]=z[i,j]+2*c*(x[i]*A_ij[i,j])
-            tot_transmissions=tot_transmissions+1
-            transmissions.append(tot_transmissions)
-
-            if np.sum((x- avg_temp)**2)< tolerance:
-                loss = np.append(loss, np.sum((x - avg_temp)**2))
-                converged = True
-            else:
-                # print(np.sum((x- avg_temp)**2))
-                loss= np.append(loss, np.sum((x - avg_temp)**2))
+        #update x_i and y_ij for all nodes at once
+        old_sq=(x-avg_temp)**2
+        x=(temperature-B@z)/(1+c*degree)
+        y=z+2*c*x[src]*A_ij
+        if timer: t = timer.lap("update", t)
+
+        #loss after each node's update within the round (nodes update in order 0..num_nodes-1)
+        new_sq=(x-avg_temp)**2
+        round_loss=np.sum(old_sq)+np.cumsum(new_sq-old_sq)
+        loss_rounds.append(round_loss)
+        tot_transmissions=tot_transmissions+num_nodes
+        if np.any(round_loss< tolerance):
+            converged = True
+        if timer: t = timer.lap("loss", t)
   
-        #update z_ij
-        for i in  np.arange(0,num_nodes):
-            for j in G.neighbors(i):
-                z[i,j]=y[j,i]
-                
-        
-        
+        #update z_ij = y_ji for all edges at once
+        z=y[rev]
+        if timer: t = timer.lap("exchange", t)
 
-    
+    loss=np.concatenate(loss_rounds)
+    transmissions=list(range(1,tot_transmissions+1))
+    if timer: timer.report("PDMM_sync")
     return loss,transmissions
-
@@ -1,20 +1,28 @@
+import ast
+import hashlib
+import inspect
+import os
+import pickle
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 import networkx as nx
 
 # np.random.seed(1)
 
-def build_random_graph(num_nodes_fix,required_probability=0.999,fix_num_nodes=False,r_fix=None):
+def build_random_graph(num_nodes_fix,required_probability=0.999,fix_num_nodes=False,r_fix=None,sparse=False):
     """
     Builds a random geometric graph with a given required probability.
 
     Parameters:
     - required_probability (float): The required probability for the graph connectivity. Default is 0.999.
+    - sparse (bool): Return A as a scipy.sparse CSR matrix instead of a dense array. Use this for large
+      graphs, the dense n x n matrix does not fit in memory. Default is False.
 
     Returns:
     - num_nodes (int): The number of nodes in the graph.
     - G (networkx.Graph): The generated random geometric graph.
-    - A (numpy.ndarray): The adjacency matrix of the graph.
+    - A (numpy.ndarray or scipy.sparse.csr_array): The adjacency matrix of the graph.
     - pos (dict): The positions of the nodes in the graph.
     """
     # we are working in 2 dimensions
@@ -32,10 +40,12 @@ def build_random_graph(num_nodes_fix,required_probability=0.999,fix_num_nodes=Fa
 
     G = nx.random_geometric_graph(n=num_nodes, radius=r_c * 100, pos=pos)
 
-    A = nx.adjacency_matrix(G).toarray()
+    A = nx.adjacency_matrix(G)
+    if not sparse:
+        A = A.toarray()
     return num_nodes, G, A, pos,r_c
 
-def add_node_to_graph(G, pos, new_node_id,r_c):
+def add_node_to_graph(G, pos, new_node_id,r_c,grid=None):
     """
     Add a new node to an existing graph, connecting it to all nodes within a certain radius.
 
@@ -43,11 +53,12 @@ def add_node_to_graph(G, pos, new_node_id,r_c):
     - G (nx.Graph): The existing graph.
     - pos (dict): The positions of the nodes in the graph.
     - new_node_id (int): The id of the new node.
+    - grid (GridIndex, optional): Spatial index over pos. If given, only the cells around the new node
+      are checked and the new node is added to the index, otherwise all nodes in pos are checked.
 
     Returns:
     - G (nx.Graph): The updated graph.
     - pos (dict): The updated positions of the nodes in the graph.
-    - A (np.array): The adjacency matrix of the updated graph.
     """
     # num_nodes = len(G.nodes)
     # r_c = np.sqrt(np.log(2*num_nodes) / num_nodes)
@@ -60,13 +71,118 @@ def add_node_to_graph(G, pos, new_node_id,r_c):
     pos[new_node_id] = new_pos
 
     # Connect the new node to all nodes within the radius
-    for node, node_pos in pos.items():
-        if np.linalg.norm(np.array(node_pos) - np.array(new_pos)) <= r_c * 100:
-            if new_node_id !=node: 
-                G.add_edge(new_node_id, node)
+    if grid is not None:
+        candidates = grid.query(new_pos, r_c * 100)
+        grid.insert(new_node_id, new_pos)
+    else:
+        candidates = [node for node, node_pos in pos.items() if np.linalg.norm(np.array(node_pos) - np.array(new_pos)) <= r_c * 100]
+    for node in candidates:
+        if new_node_id !=node: 
+            G.add_edge(new_node_id, node)
 
     return G, pos
 
+def swap_remove_node(G, pos, node, edge_dicts=(), grid=None):
+    """
+    Remove any node from a graph with nodes labelled 0..n-1 and keep the labels contiguous.
+    The node with the highest label n-1 takes over the label of the removed node (swap-remove), so an
+    array indexed by label only has to move its last entry: arr[node] = arr[-1]; arr = arr[:-1].
+    Only the edges of the two nodes and their (i, j) entries are touched, O(degree) instead of tail-only removal.
+
+    Parameters:
+    - G (networkx.Graph): The graph, changed in place. Relabelled node moves to the end of G.nodes(),
+      so build matrices with nodelist=range(n) afterwards.
+    - pos (dict): The positions of the nodes in the graph, changed in place.
+    - node (int): The label of the node to remove.
+    - edge_dicts (tuple of dict, optional): Dictionaries keyed (i, j) in both directions, e.g. (z, y, A_ij),
+      changed in place. Entries move with the relabelled node, so A_ij keeps its orientation.
+    - grid (GridIndex, optional): Spatial index over pos, kept in sync.
+
+    Returns:
+    - last (int): The label that moved to node (equal to node if the removed node was the last one).
+    """
+    last = G.number_of_nodes() - 1
+    for d in edge_dicts:
+        for j in G.neighbors(node):
+            del d[node, j]
+            del d[j, node]
+    if grid is not None:
+        grid.remove(node)
+    G.remove_node(node)
+    del pos[node]
+    if node == last:
+        return last
+
+    # relabel last -> node
+    if grid is not None:
+        grid.remove(last)
+    neighbors = list(G.neighbors(last))
+    attrs = dict(G.nodes[last])
+    G.remove_node(last)
+    G.add_node(node, **attrs)
+    for j in neighbors:
+        G.add_edge(node, j)
+        for d in edge_dicts:
+            d[node, j] = d.pop((last, j))
+            d[j, node] = d.pop((j, last))
+    pos[node] = pos.pop(last)
+    if grid is not None:
+        grid.insert(node, pos[node])
+    return last
+
+def pick_node_to_remove(num_nodes, removal="tail"):
+    """
+    Label of the next node to remove from a graph with nodes labelled 0..num_nodes-1.
+
+    Parameters:
+    - removal (str): "tail" for the highest label (tail-only removal, the original experiments),
+      "random" for a uniformly random node.
+    """
+    if removal == "tail":
+        return num_nodes - 1
+    return int(np.random.uniform(low=0, high=num_nodes))
+
+class GridIndex:
+    """
+    Uniform grid over the node positions with cell size equal to the connection radius, so all nodes
+    within the radius of a point lie in the 3x3 cells around it.
+
+    Parameters:
+    - pos (dict): The positions of the nodes in the graph (referenced, not copied).
+    - cell_size (float): The connection radius in position units (r_c * 100).
+    """
+    def __init__(self, pos, cell_size):
+        self.pos = pos
+        self.cell_size = cell_size
+        self.cells = {}
+        for node, node_pos in pos.items():
+            self.insert(node, node_pos)
+
+    def _cell(self, p):
+        return (int(np.floor(p[0] / self.cell_size)), int(np.floor(p[1] / self.cell_size)))
+
+    def insert(self, node, p):
+        self.cells.setdefault(self._cell(p), []).append(node)
+
+    def remove(self, node):
+        self.cells[self._cell(self.pos[node])].remove(node)
+
+    def query(self, p, radius):
+        """
+        Returns:
+        - list: The nodes within radius of position p.
+        """
+        rings = max(1, int(np.ceil(radius / self.cell_size)))
+        cx, cy = self._cell(p)
+        found = []
+        for dx in range(-rings, rings + 1):
+            for dy in range(-rings, rings + 1):
+                for node in self.cells.get((cx + dx, cy + dy), ()):
+                    q = self.pos[node]
+                    if (q[0] - p[0])**2 + (q[1] - p[1])**2 <= radius**2:
+                        found.append(node)
+        return found
+
 def W_construct_rand_gossip(i, j, n):
     """
     Constructs a weight matrix W for a distributed signal processing system.
@@ -129,4 +245,235 @@ def calc_incidence(G):
             else:
                 A_ij[edge[0], edge[1]] = -1
                 A_ij[edge[1], edge[0]] = -1
-        return A_ij
\ No newline at end of file
+        return A_ij
+def calc_incidence_arrays(G):
+    """
+    Array version of calc_incidence, with one entry per directed edge (i, j).
+
+    The directed edges are numbered in CSR order: the edges leaving node i are
+    indptr[i]:indptr[i+1] and indices holds their end nodes j. This lets PDMM
+    keep z_ij, y_ij and A_ij in flat arrays and update a node with slices.
+
+    Parameters:
+    - G (networkx.Graph): The graph, with nodes labelled 0..num_nodes-1.
+
+    Returns:
+    - indptr (numpy.ndarray): int32, the edges of node i start at indptr[i].
+    - indices (numpy.ndarray): int32, end node j of every directed edge.
+    - A_ij (numpy.ndarray): int8, +1 if i < j else -1 for every directed edge.
+    - rev (numpy.ndarray): int32, position of the edge (j, i) for every directed edge (i, j).
+    """
+    num_nodes = G.number_of_nodes()
+    degree = np.array([G.degree(i) for i in range(num_nodes)], dtype=np.int64)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum(degree)
+    indices = np.fromiter((j for i in range(num_nodes) for j in G.neighbors(i)), dtype=np.int32, count=indptr[-1])
+
+    src = np.repeat(np.arange(num_nodes, dtype=np.int64), degree)
+    A_ij = np.where(src < indices, 1, -1).astype(np.int8)
+
+    # (j, i) is found by sorting the edges on their (i, j) key
+    keys = src * num_nodes + indices
+    order = np.argsort(keys, kind="stable")
+    rev = order[np.searchsorted(keys[order], indices.astype(np.int64) * num_nodes + src)].astype(np.int32)
+    return indptr, indices, A_ij, rev
+
+def calc_neighbor_arrays(A):
+    """
+    Neighbor lists of every node from the adjacency matrix, computed once.
+
+    Parameters:
+    - A (numpy.ndarray or scipy.sparse matrix): The adjacency matrix representing the network connections.
+
+    Returns:
+    - indptr (numpy.ndarray): The neighbors of node i are indices[indptr[i]:indptr[i+1]].
+    - indices (numpy.ndarray): Neighbor ids, in increasing order per node (same order as np.nonzero(A[i, :])).
+    """
+    if hasattr(A, "tocsr"):
+        A = A.tocsr()
+        A.sort_indices()
+        return A.indptr, A.indices
+    rows, cols = np.nonzero(A)
+    indptr = np.searchsorted(rows, np.arange(np.shape(A)[0] + 1))
+    return indptr, cols
+
+class LossBuffer:
+    """
+    Preallocated float array for per-iteration losses. When it is full, the capacity is doubled,
+    so appending k values costs O(k) in total instead of O(k^2) with np.append.
+    """
+    def __init__(self, capacity=1024):
+        self.data = np.empty(capacity)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.data):
+            grown = np.empty(2 * len(self.data))
+            grown[:self.size] = self.data
+            self.data = grown
+        self.data[self.size] = value
+        self.size += 1
+
+    def to_array(self):
+        """
+        Returns:
+        - numpy.ndarray: The recorded losses (a copy of the filled part of the buffer).
+        """
+        return self.data[:self.size].copy()
+
+class PhaseTimer:
+    """
+    Per-phase wall time and call counts of an algorithm loop. The algorithms only create one with
+    profile=True and guard every lap with "if timer:", so a normal run pays a single check per phase.
+        t = timer.start()
+        ... select a node ...
+        t = timer.lap("select", t)
+    """
+    def __init__(self):
+        self.time = {}
+        self.calls = {}
+
+    def start(self):
+        return time.perf_counter()
+
+    def lap(self, phase, t):
+        """
+        Add the time since t to phase.
+
+        Returns:
+        - float: The current time, the reference for the next phase.
+        """
+        now = time.perf_counter()
+        self.time[phase] = self.time.get(phase, 0.0) + (now - t)
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        return now
+
+    def report(self, name=""):
+        """
+        Print a table with calls, total seconds, microseconds per call and share of the time per phase.
+        """
+        total = sum(self.time.values()) or 1.0
+        print("Profile " + name + ":")
+        print("    {:<12s}{:>12s}{:>12s}{:>12s}{:>8s}".format("phase", "calls", "total s", "us/call", "share"))
+        for phase in sorted(self.time, key=lambda p: -self.time[p]):
+            seconds = self.time[phase]
+            calls = self.calls[phase]
+            print("    {:<12s}{:>12d}{:>12.3f}{:>12.3f}{:>7.1f}%".format(phase, calls, seconds, 1e6 * seconds / calls, 100 * seconds / total))
+
+class RunCache:
+    """
+    Disk cache for algorithm runs, so baselines that the notebook recomputes in every cell are only
+    simulated once, e.g. loss, trans = cache(PDMM_async, temperature.copy(), G.copy(), tolerance, c).
+
+    The key hashes the function name, the code (its module and the modules next to it that it imports, so editing
+    algo.py or a helper in utils.py invalidates the entries), every argument (arrays, sparse matrices,
+    graphs, dicts, numbers) and the np.random state before the call. The np.random state after the call is
+    cached as well and restored on a hit, so later cells draw the same numbers as without the cache.
+    Arguments the function changes in place are not replayed on a hit, pass copies (as the notebook does).
+    Entries are pickled files; a hit updates their modification time and the least recently used
+    files are removed when the directory is larger than max_bytes.
+
+    Parameters:
+    - directory (str): Where the cached runs are kept.
+    - max_bytes (int): Size limit of the directory. Default is 1 GB.
+    """
+    def __init__(self, directory=".cache", max_bytes=1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, func, *args, **kwargs):
+        h = hashlib.sha256()
+        h.update((func.__module__ + "." + func.__name__).encode())
+        _code_fingerprint(h, func)
+        _fingerprint(h, args)
+        _fingerprint(h, sorted(kwargs.items()))
+        _fingerprint(h, np.random.get_state())
+        path = os.path.join(self.directory, h.hexdigest() + ".pkl")
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                result, state = pickle.load(f)
+            os.utime(path)
+            np.random.set_state(state)
+            return result
+
+        result = func(*args, **kwargs)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump((result, np.random.get_state()), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        self.evict()
+        return result
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+def _code_fingerprint(h, func):
+    """
+    Feed the code func runs into the hash h: its module and every module next to it that it imports, directly or
+    through one of them (names and contents, e.g. algo.py and utils.py). Other files of the directory are left out.
+    Functions without a source file (defined in the notebook) only add their own source.
+    """
+    try:
+        path = os.path.abspath(inspect.getsourcefile(func))
+    except TypeError:
+        h.update(inspect.getsource(func).encode())
+        return
+    directory = os.path.dirname(path)
+    todo = [os.path.splitext(os.path.basename(path))[0]]
+    found = set()
+    while todo:
+        name = todo.pop()
+        file = os.path.join(directory, name + ".py")
+        if name in found or not os.path.exists(file):
+            continue
+        found.add(name)
+        with open(file, "rb") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                todo.extend(alias.name.split(".")[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                todo.append(node.module.split(".")[0])
+    for name in sorted(found):
+        with open(os.path.join(directory, name + ".py"), "rb") as f:
+            h.update(name.encode() + b"\0" + f.read() + b"\0")
+
+def _fingerprint(h, value):
+    """
+    Feed the content of value into the hash h: arrays by dtype, shape and bytes, sparse matrices by their
+    CSR arrays, graphs by their sorted nodes and edges, containers element by element.
+    """
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        h.update(b"array" + value.dtype.str.encode() + repr(value.shape).encode())
+        h.update(value.tobytes())
+    elif hasattr(value, "tocsr"):
+        A = value.tocsr()
+        A.sort_indices()
+        h.update(b"sparse" + repr(A.shape).encode())
+        for array in (A.indptr, A.indices, A.data):
+            _fingerprint(h, array)
+    elif isinstance(value, nx.Graph):
+        h.update(b"graph")
+        _fingerprint(h, sorted(value.nodes()))
+        _fingerprint(h, sorted(tuple(sorted(edge)) for edge in value.edges()))
+    elif isinstance(value, dict):
+        h.update(b"dict")
+        _fingerprint(h, sorted(value.items()))
+    elif isinstance(value, (list, tuple)):
+        h.update(b"seq" + str(len(value)).encode())
+        for item in value:
+            _fingerprint(h, item)
+    else:
+        h.update(repr(value).encode())
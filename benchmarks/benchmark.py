@@ -0,0 +1,241 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+'''
+BENCHMARK SUITE
+python benchmarks/benchmark.py                              run every case on the default sizes, save to benchmarks/results/
+python benchmarks/benchmark.py --compare results/OLD.json   ... and compare against an earlier run
+Every case runs in its own process (Anja's and Frank's utils.py cannot be imported together, and the
+peak RSS of a fresh process belongs to that case only) on a fixed-seed random geometric graph.
+'''
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANJA = os.path.join(ROOT, "Anja")
+FRANK = os.path.join(ROOT, "Frank")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+SIZES = [100, 1000, 10000, 100000]
+SEED = 2024
+TOL_REL = 1e-6      # TOL = TOL_REL * ||a - mean(a)||^2, so every size is run to the same relative accuracy
+REGRESSION = 0.10   # slower / fewer transmissions per second / more memory by more than this is reported
+
+# name: (codebase, function, keyword arguments, largest default size)
+# The asynchronous loops are pure Python and need ~n^2 / log(n) transmissions on an RGG, so they stop at
+# a few thousand nodes by default; use --sizes with --no-cap to run them further.
+CASES = {
+    "anja.random_gossip_noW":   ("Anja", "randgoss.random_gossip_noW", {}, 1000),
+    "anja.random_gossip_batched": ("Anja", "randgoss.random_gossip_batched", {"seed": 0}, 10000),
+    "anja.dist_avg_asynch_noW": ("Anja", "distavg.dist_avg_asynch_noW", {}, 1000),
+    "anja.pdmm_async":          ("Anja", "pdmm.pdmm_async", {"c": 0.4}, 1000),
+    "anja.pdmm_synch":          ("Anja", "pdmm.pdmm_synch", {"c": 0.3}, 100000),
+    "anja.dist_avg_synch":      ("Anja", "distavg.dist_avg_synch", {"sparse": True}, 100000),
+    "frank.random_gossip":      ("Frank", "algo.random_gossip", {}, 1000),
+    "frank.async_distr_averaging": ("Frank", "algo.async_distr_averaging", {}, 1000),
+    "frank.PDMM_async":         ("Frank", "algo.PDMM_async", {"c": 0.4}, 1000),
+    "frank.PDMM_sync":          ("Frank", "algo.PDMM_sync", {"c": 0.3}, 100000),
+}
+
+
+def build_graph(num_nodes, seed):
+    '''
+    Connected RGG on the unit square with radius sqrt(log(2n) / n) (as in main.py) and measurements N(20, 3^2),
+    drawn from np.random.default_rng(seed) so every case of a size gets the same graph.
+    Returns the CSRGraph (Anja's rgg.py).
+    '''
+    from rgg import random_geometric_csr
+    rng = np.random.default_rng(seed)
+    radius = np.sqrt(np.log(2 * num_nodes) / num_nodes)
+    values = rng.normal(20, 3, num_nodes)
+    return random_geometric_csr(num_nodes, radius, 2, values, rng=rng)
+
+
+def _prepare(codebase, function, kwargs, csr, TOL):
+    '''
+    Imports the entry point and converts the graph to the form that codebase expects (not timed).
+    Returns run(), which calls the algorithm once and returns its number of transmissions.
+    '''
+    module_name, func_name = function.split(".")
+    func = getattr(__import__(module_name), func_name)
+    if codebase == "Anja":
+        graph = csr.to_networkx()
+        return lambda: func(graph, TOL, **kwargs)[3]
+
+    import networkx as nx
+    from scipy.sparse import csr_matrix
+    n = csr.num_nodes
+    temperature = csr.values.reshape(-1, 1).copy()
+    if func_name == "random_gossip":
+        # one exchange per loss value
+        A = csr_matrix((np.ones(len(csr.indices)), csr.indices, csr.indptr), shape=(n, n))
+        return lambda: len(func(temperature, A, TOL, **kwargs)[0])
+    if func_name == "async_distr_averaging":
+        # returns (loss, transmissions, x)
+        A = csr_matrix((np.ones(len(csr.indices)), csr.indices, csr.indptr), shape=(n, n))
+        return lambda: func(temperature, A, TOL, **kwargs)[1][-1]
+    G = nx.Graph()
+    G.add_nodes_from(range(n))
+    src = np.repeat(np.arange(n), csr.degree)
+    G.add_edges_from(zip(src[src < csr.indices].tolist(), csr.indices[src < csr.indices].tolist()))
+    return lambda: func(temperature, G, TOL, **kwargs)[1][-1]
+
+
+def run_case(name, num_nodes, seed, tol_rel):
+    '''
+    Child process: build the graph, run the case once and return its measurements.
+    Wall time covers only the algorithm call (including its own setup such as CSR conversion),
+    the peak RSS covers the whole process.
+    '''
+    codebase, function, kwargs, _ = CASES[name]
+    sys.path.insert(0, ANJA)
+    if codebase == "Frank":
+        sys.path.insert(0, FRANK)
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    # Anja's loops draw from random, Frank's from np.random
+    random.seed(seed)
+    np.random.seed(seed)
+    csr = build_graph(num_nodes, seed)
+    TOL = tol_rel * float(np.sum((csr.values - np.mean(csr.values))**2))
+    run = _prepare(codebase, function, kwargs, csr, TOL)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start_time = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        transmissions = run()
+    wall_time = time.perf_counter() - start_time
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "case": name,
+        "nodes": csr.num_nodes,
+        "edges": csr.num_edges,
+        "seed": seed,
+        "tol": TOL,
+        "transmissions": int(transmissions),
+        "wall_time": wall_time,
+        "transmissions_per_s": transmissions / wall_time if wall_time > 0 else None,
+        "peak_rss_mb": peak / 1024,
+        "rss_growth_mb": (peak - rss_before) / 1024,
+    }
+
+
+def run_suite(cases, sizes, seed=SEED, tol_rel=TOL_REL, cap=True, timeout=None):
+    # every (case, size) in its own interpreter, skipped above the case's default size when cap is set
+    records = []
+    for name in cases:
+        for num_nodes in sizes:
+            if cap and num_nodes > CASES[name][3]:
+                continue
+            print(f"{name:30s} n={num_nodes:<7d}", end=" ", flush=True)
+            command = [sys.executable, os.path.abspath(__file__), "--child", name, str(num_nodes),
+                       "--seed", str(seed), "--tol-rel", str(tol_rel)]
+            try:
+                proc = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                print("\033[91mTIMEOUT\033[0m")
+                continue
+            if proc.returncode != 0:
+                print("\033[91mERROR: " + proc.stderr.strip().splitlines()[-1] + "\033[0m")
+                continue
+            record = json.loads(proc.stdout.strip().splitlines()[-1])
+            records.append(record)
+            print(f"{record['wall_time']:9.3f} s  {record['transmissions']:>10d} tx  "
+                  f"{record['transmissions_per_s']:>12.0f} tx/s  {record['peak_rss_mb']:8.1f} MB")
+    return records
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def compare(old, new, threshold=REGRESSION):
+    '''
+    Prints old vs new per (case, nodes) and returns the list of regressions: wall time or peak memory
+    up by more than threshold, or transmissions per second down by more than threshold.
+    Transmissions are only compared for equality (same seed and code path should give the same count).
+    '''
+    old_by_key = {(r["case"], r["nodes"]): r for r in old["records"]}
+    regressions = []
+    print("")
+    print(f"{'case':30s} {'nodes':>7s} {'time old':>10s} {'time new':>10s} {'tx/s ratio':>10s} {'mem ratio':>9s}")
+    for r in new["records"]:
+        o = old_by_key.get((r["case"], r["nodes"]))
+        if o is None:
+            continue
+        speed = r["transmissions_per_s"] / o["transmissions_per_s"]
+        memory = r["peak_rss_mb"] / o["peak_rss_mb"]
+        flags = []
+        if r["wall_time"] > o["wall_time"] * (1 + threshold):
+            flags.append("slower")
+        if speed < 1 - threshold:
+            flags.append("throughput")
+        if memory > 1 + threshold:
+            flags.append("memory")
+        if r["transmissions"] != o["transmissions"]:
+            flags.append("transmissions " + str(o["transmissions"]) + " -> " + str(r["transmissions"]))
+        line = f"{r['case']:30s} {r['nodes']:7d} {o['wall_time']:10.3f} {r['wall_time']:10.3f} {speed:10.2f} {memory:9.2f}"
+        if flags:
+            line = "\033[91m" + line + "  " + ", ".join(flags) + "\033[0m"
+            regressions.append((r["case"], r["nodes"], flags))
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every averaging algorithm on fixed-seed RGGs.")
+    parser.add_argument("--cases", nargs="*", default=list(CASES), help="case names (default: all)")
+    parser.add_argument("--sizes", nargs="*", type=int, default=SIZES)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--tol-rel", type=float, default=TOL_REL)
+    parser.add_argument("--no-cap", action="store_true", help="also run cases above their default size")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per case")
+    parser.add_argument("--output", default=None, help="result file (default: results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="earlier result file to compare with")
+    parser.add_argument("--child", nargs=2, metavar=("CASE", "NODES"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(args.child[0], int(args.child[1]), args.seed, args.tol_rel)))
+        return 0
+
+    result = {"environment": environment(), "tol_rel": args.tol_rel,
+              "records": run_suite(args.cases, args.sizes, args.seed, args.tol_rel, not args.no_cap, args.timeout)}
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, result["environment"]["timestamp"].replace(":", "-") + ".json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=1)
+    print("Saved:", output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), result)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())